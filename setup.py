@@ -25,6 +25,7 @@ setuptools.setup(
     install_requires=[
         "astroplan",
         "astropy[recommended]",
+        "astropy-healpix",
         "astroquery",
         "avro-python3~=1.10.1",
         "docker",
@@ -0,0 +1,62 @@
+import unittest
+import logging
+
+import numpy as np
+from astropy.io import fits
+
+from winterdrp.paths import base_name_key, proc_history_key
+from winterdrp.processors.base_processor import BaseImageProcessor
+
+logger = logging.getLogger(__name__)
+
+
+def add_one(data):
+    return data + 1.
+
+
+class FunctionApplier(BaseImageProcessor):
+    """Applies a function to the pixels of each image"""
+
+    base_key = "test_function_applier"
+
+    def __init__(self, func=add_one, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.func = func
+
+    def _apply_to_images(self, images, headers):
+        return [self.func(x) for x in images], headers
+
+
+def make_batches(n_batches: int) -> list:
+    batches = []
+    for i in range(n_batches):
+        header = fits.Header({base_name_key: f"image_{i}.fits", proc_history_key: ""})
+        batches.append([[np.full((4, 4), float(i))], [header]])
+    return batches
+
+
+class TestBatchProcessing(unittest.TestCase):
+
+    def test_parallel_batches(self):
+        processor = FunctionApplier()
+        processor.set_max_n_cpu(2)
+        batches, failures = processor.base_apply(make_batches(3))
+        self.assertEqual(len(failures), 0)
+        self.assertEqual([x[0][0][0, 0] for x in batches], [1., 2., 3.])
+
+    def test_unpicklable_processor(self):
+        processor = FunctionApplier(func=lambda x: x + 2.)
+        processor.set_max_n_cpu(2)
+        self.assertFalse(processor.is_picklable())
+        batches, failures = processor.base_apply(make_batches(3))
+        self.assertEqual(len(failures), 0)
+        self.assertEqual([x[0][0][0, 0] for x in batches], [2., 3., 4.])
+
+    def test_invalid_n_cpu(self):
+        processor = FunctionApplier()
+        for value in [0, -1, 1.5]:
+            with self.assertRaises(ValueError):
+                processor.set_max_n_cpu(value)
+        with self.assertRaises(ValueError):
+            FunctionApplier(max_n_cpu=0)
+
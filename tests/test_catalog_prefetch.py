@@ -0,0 +1,104 @@
+import functools
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+import logging
+
+import numpy as np
+from astropy.io import fits
+from astropy.table import Table
+
+from winterdrp.catalog.base_catalog import BaseCatalog
+from winterdrp.paths import base_name_key, proc_history_key
+from winterdrp.processors.base_processor import BaseImageProcessor
+from winterdrp.processors.utils.catalog_prefetch import CatalogPrefetch
+
+logger = logging.getLogger(__name__)
+
+rng = np.random.default_rng(3)
+n_sources = 2000
+source_ra = rng.uniform(149., 151., n_sources)
+source_dec = rng.uniform(19., 21., n_sources)
+
+
+class SlowCatalog(BaseCatalog):
+    """Catalog of random sources, with a slow 'network' query"""
+
+    abbreviation = "slow"
+
+    query_started = threading.Event()
+
+    def query_catalog(self, ra_deg, dec_deg, search_radius_arcmin):
+        SlowCatalog.query_started.set()
+        time.sleep(1.)
+        return Table({"ra": source_ra, "dec": source_dec, "magnitude": np.full(n_sources, 15.)})
+
+
+def get_slow_catalog(header, cache_dir=None, offline=False):
+    return SlowCatalog(
+        search_radius_arcmin=20, min_mag=10, max_mag=20, filter_name="j", cache_dir=cache_dir, offline=offline,
+        mirror_dir=None
+    )
+
+
+class CatalogCounter(BaseImageProcessor):
+    """Records the number of reference catalog sources around each image"""
+
+    base_key = "test_catalog_counter"
+
+    def __init__(self, catalog_generator, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.catalog_generator = catalog_generator
+
+    def _apply_to_images(self, images, headers):
+        for header in headers:
+            header["NREFSRC"] = len(self.catalog_generator(header).get_catalog_from_header(header))
+        return images, headers
+
+
+class TestCatalogPrefetch(unittest.TestCase):
+
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+        SlowCatalog.query_started.clear()
+
+    def tearDown(self):
+        shutil.rmtree(self.cache_dir)
+
+    def test_prefetch_with_parallel_batches(self):
+        """Batches processed in forked worker processes, while the prefetch of their catalog is still running
+        in the main process, wait for the prefetch rather than deadlocking or querying the network again"""
+
+        batches = []
+        for i in range(2):
+            header = fits.Header({
+                base_name_key: f"image_{i}.fits", proc_history_key: "", "CRVAL1": 150., "CRVAL2": 20.,
+                "OBSCLASS": "science"
+            })
+            batches.append([[np.zeros((2, 2))], [header]])
+
+        prefetch = CatalogPrefetch(
+            ref_catalog_generators=[functools.partial(get_slow_catalog, cache_dir=self.cache_dir)]
+        )
+        batches, failures = prefetch.base_apply(batches)
+        self.assertEqual(len(failures), 0)
+
+        # The tile locks are held by the prefetch thread when the worker processes are forked
+        self.assertTrue(SlowCatalog.query_started.wait(10.))
+
+        # Offline, so the workers can only get the catalog from the tiles written by the prefetch
+        counter = CatalogCounter(
+            catalog_generator=functools.partial(get_slow_catalog, cache_dir=self.cache_dir, offline=True)
+        )
+        counter.set_max_n_cpu(2)
+        batches, failures = counter.base_apply(batches)
+
+        self.assertEqual(len(failures), 0)
+        self.assertEqual(len(batches), 2)
+
+        cone = get_slow_catalog(None, cache_dir=self.cache_dir, offline=True).get_catalog(150., 20.)
+        self.assertGreater(len(cone), 0)
+        for batch in batches:
+            self.assertEqual(batch[1][0]["NREFSRC"], len(cone))
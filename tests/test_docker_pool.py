@@ -0,0 +1,109 @@
+import os
+import shutil
+import subprocess
+import tempfile
+import unittest
+import logging
+from winterdrp.utils.dockerutil import DockerContainerPool
+from winterdrp.utils.execute_cmd import run_docker, ExecutionError
+
+logger = logging.getLogger(__name__)
+
+
+class FakeExecResult:
+
+    def __init__(self, exit_code, output):
+        self.exit_code = exit_code
+        self.output = output
+
+
+class FakeContainer:
+    """Stands in for a docker container, running commands locally in the bind-mounted directory"""
+
+    def __init__(self, volumes):
+        self.mounts = {v["bind"]: k for k, v in volumes.items()}
+        self.n_exec = 0
+        self.removed = False
+
+    def local_path(self, path):
+        for bind, local in self.mounts.items():
+            path = path.replace(bind, local)
+        return path
+
+    def exec_run(self, cmd, stderr=True, stdout=True, workdir=None):
+        self.n_exec += 1
+        rval = subprocess.run(
+            self.local_path(cmd), shell=True, capture_output=True, cwd=self.local_path(workdir)
+        )
+        return FakeExecResult(rval.returncode, rval.stdout + rval.stderr)
+
+    def kill(self):
+        pass
+
+    def remove(self):
+        self.removed = True
+
+
+class FakeContainers:
+
+    def __init__(self):
+        self.created = []
+
+    def run(self, image_name, tty=True, detach=True, volumes=None):
+        container = FakeContainer(volumes)
+        self.created.append(container)
+        return container
+
+
+class FakeDockerClient:
+
+    def __init__(self):
+        self.containers = FakeContainers()
+
+
+class TestDockerPool(unittest.TestCase):
+
+    def setUp(self):
+        self.logger = logging.getLogger(__name__)
+        self.logger.setLevel(logging.INFO)
+        self.test_dir = tempfile.mkdtemp()
+        self.client = FakeDockerClient()
+        self.pool = DockerContainerPool(client=self.client)
+
+    def tearDown(self):
+        self.pool.shutdown()
+        shutil.rmtree(self.test_dir)
+
+    def test_containers_are_reused(self):
+        self.logger.info("\n\n Testing docker container pool \n\n")
+
+        input_path = os.path.join(self.test_dir, "input.txt")
+        with open(input_path, "w") as f:
+            f.write("test")
+
+        output_dir = os.path.join(self.test_dir, "output")
+
+        for i in range(3):
+            run_docker(f"cp {input_path} output_{i}.txt", output_dir=output_dir, pool=self.pool)
+
+        self.assertEqual(len(self.client.containers.created), 1)
+        self.assertEqual(self.client.containers.created[0].n_exec, 3)
+        self.assertEqual(sorted(os.listdir(output_dir)), ["output_0.txt", "output_1.txt", "output_2.txt"])
+        # Inputs are left in place, and the work directories are cleaned up
+        self.assertTrue(os.path.exists(input_path))
+        self.assertEqual(os.listdir(self.pool.scratch_dir), [])
+
+    def test_failed_command(self):
+        with self.assertRaises(ExecutionError):
+            run_docker("false", output_dir=self.test_dir, pool=self.pool)
+
+        # A failed command does not break the container, so it is kept for reuse
+        run_docker("true", output_dir=self.test_dir, pool=self.pool)
+        self.assertEqual(len(self.client.containers.created), 1)
+
+    def test_shutdown(self):
+        run_docker("true", output_dir=self.test_dir, pool=self.pool)
+        scratch_dir = self.pool.scratch_dir
+        self.pool.shutdown()
+        self.assertTrue(self.client.containers.created[0].removed)
+        self.assertFalse(os.path.exists(scratch_dir))
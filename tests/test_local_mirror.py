@@ -0,0 +1,98 @@
+import shutil
+import tempfile
+import unittest
+import logging
+
+import astropy.units as u
+import numpy as np
+from astropy.coordinates import SkyCoord
+from astropy.table import Table
+
+from winterdrp.catalog.base_catalog import BaseCatalog
+from winterdrp.catalog.local_mirror import ingest_catalog
+
+logger = logging.getLogger(__name__)
+
+n_sources = 20000
+
+rng = np.random.default_rng(42)
+source_ra = rng.uniform(147., 153., n_sources)
+source_dec = rng.uniform(17., 23., n_sources)
+source_mag = rng.uniform(10., 20., n_sources)
+
+
+def cone_mask(ra_deg, dec_deg, radius_arcmin):
+    coords = SkyCoord(source_ra * u.deg, source_dec * u.deg)
+    return coords.separation(SkyCoord(ra_deg * u.deg, dec_deg * u.deg)) < radius_arcmin * u.arcmin
+
+
+class SyntheticCatalog(BaseCatalog):
+    """Catalog of random sources, which counts its 'network' queries"""
+
+    abbreviation = "synthetic"
+
+    n_queries = 0
+
+    def query_catalog(self, ra_deg, dec_deg, search_radius_arcmin):
+        SyntheticCatalog.n_queries += 1
+        mask = cone_mask(ra_deg, dec_deg, search_radius_arcmin)
+        return Table({
+            "ra": source_ra[mask],
+            "dec": source_dec[mask],
+            "magnitude": source_mag[mask],
+            "name": np.array([f"src{i}" for i in np.arange(n_sources)[mask]]),
+        })
+
+
+class TestLocalMirror(unittest.TestCase):
+
+    def setUp(self):
+        self.logger = logging.getLogger(__name__)
+        self.logger.setLevel(logging.INFO)
+        self.test_dir = tempfile.mkdtemp()
+        SyntheticCatalog.n_queries = 0
+        self.catalog = SyntheticCatalog(
+            search_radius_arcmin=30, min_mag=10, max_mag=20, filter_name="j", cache_dir=None,
+            mirror_dir=self.test_dir, offline=False
+        )
+        ingest_catalog(self.catalog, field_centres=[(150., 20.), (151., 20.5)])
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+
+    def test_cone_search(self):
+        self.logger.info("\n\n Testing local catalog mirror \n\n")
+
+        offline_catalog = SyntheticCatalog(
+            search_radius_arcmin=30, min_mag=10, max_mag=20, filter_name="j", cache_dir=None,
+            mirror_dir=self.test_dir, offline=True
+        )
+
+        n_ingest_queries = SyntheticCatalog.n_queries
+
+        for ra_deg, dec_deg in [(150., 20.), (150.8, 20.3), (151., 20.5)]:
+            table = offline_catalog.get_catalog(ra_deg, dec_deg)
+            expected = np.sort(np.arange(n_sources)[cone_mask(ra_deg, dec_deg, 30.)])
+            found = np.sort([int(x[3:]) for x in table["name"]])
+            np.testing.assert_array_equal(found, expected)
+            np.testing.assert_allclose(np.sort(table["magnitude"]), np.sort(source_mag[expected]))
+
+        # All cone searches are served by the mirror, without any further queries
+        self.assertEqual(SyntheticCatalog.n_queries, n_ingest_queries)
+
+    def test_outside_footprint(self):
+        offline_catalog = SyntheticCatalog(
+            search_radius_arcmin=30, min_mag=10, max_mag=20, filter_name="j", cache_dir=None,
+            mirror_dir=self.test_dir, offline=True
+        )
+        self.assertFalse(offline_catalog.get_mirror().covers(148., 18., 30.))
+
+        with self.assertRaises(ValueError):
+            offline_catalog.get_catalog(148., 18.)
+
+    def test_different_parameters(self):
+        catalog = SyntheticCatalog(
+            search_radius_arcmin=30, min_mag=10, max_mag=19, filter_name="j", cache_dir=None,
+            mirror_dir=self.test_dir, offline=True
+        )
+        self.assertIsNone(catalog.get_mirror())
@@ -103,7 +103,7 @@ class TestSummerPipeline(unittest.TestCase):
     def test_pipeline(self):
         self.logger.info("\n\n Testing summer pipeline \n\n")
 
-        pipeline = SummerPipeline(pipeline_configuration=test_pipeline, night="20220402")
+        pipeline = SummerPipeline(pipeline_configuration=test_pipeline, night="20220402", working_dtype="float64")
         res = pipeline.reduce_images([[[], []]])
         self.assertEqual(len(res), 1)
 
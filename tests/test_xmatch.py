@@ -0,0 +1,120 @@
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+import logging
+
+import numpy as np
+import pandas as pd
+
+from winterdrp.catalog.kowalski import TMASS
+from winterdrp.calculate.crossmatch import SkyIndex
+from winterdrp.processors.xmatch import XMatch
+
+logger = logging.getLogger(__name__)
+
+rng = np.random.default_rng(7)
+n_sources = 5000
+source_ra = rng.uniform(150., 150.5, n_sources)
+source_dec = rng.uniform(20., 20.5, n_sources)
+source_index = SkyIndex(source_ra, source_dec)
+
+
+class StubKowalski:
+    """Stands in for a Kowalski client, answering 'near' queries on a synthetic 2MASS catalog"""
+
+    def __init__(self):
+        self.queries = []
+        self.lock = threading.Lock()
+
+    def query(self, query):
+        with self.lock:
+            self.queries.append(query)
+
+        radec = query["query"]["radec"]
+        radius = query["query"]["max_distance"]
+        limit = query["kwargs"]["limit"]
+        catalog_name = list(query["query"]["catalogs"].keys())[0]
+
+        names = list(radec.keys())
+        positions = np.array([radec[x] for x in names], dtype=float).reshape(-1, 2)
+        idx, sep = source_index.match_k_nearest(positions[:, 0], positions[:, 1], k=limit)
+
+        data = {}
+        for i, name in enumerate(names):
+            data[name] = [
+                {
+                    "designation": f"J{j}",
+                    "ra": source_ra[j],
+                    "decl": source_dec[j],
+                    "j_m": 10. + j / n_sources,
+                }
+                for j, s in zip(idx[i], sep[i]) if s < radius
+            ]
+
+        return {"data": {catalog_name: data}}
+
+
+class TestXMatch(unittest.TestCase):
+
+    def setUp(self):
+        self.logger = logging.getLogger(__name__)
+        self.logger.setLevel(logging.INFO)
+        self.test_dir = tempfile.mkdtemp()
+        self.kowalski = StubKowalski()
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+
+    def get_processor(self):
+        catalog = TMASS(
+            kowalski=self.kowalski,
+            max_query_sources=100,
+            cache_path=os.path.join(self.test_dir, "xmatch.db")
+        )
+        return XMatch(catalog=catalog, num_stars=3, search_radius_arcsec=30)
+
+    def get_candidates(self):
+        n_candidates = 450
+        candidates = pd.DataFrame({
+            "ra": rng.uniform(150., 150.5, n_candidates),
+            "dec": rng.uniform(20., 20.5, n_candidates),
+        })
+        # A candidate far from every source
+        candidates.loc[0, ["ra", "dec"]] = [10., -10.]
+        return candidates
+
+    def test_xmatch(self):
+        self.logger.info("\n\n Testing batched Kowalski cross-match \n\n")
+
+        candidates = self.get_candidates()
+        table = self.get_processor()._apply_to_candidates(candidates.copy())
+
+        # 450 candidates, in chunks of 100
+        self.assertEqual(len(self.kowalski.queries), 5)
+
+        idx, sep = source_index.match_k_nearest(candidates["ra"], candidates["dec"], k=3)
+        n_expected = np.sum(sep < 30., axis=1)
+        np.testing.assert_array_equal(table["nmtchtm"], n_expected)
+
+        self.assertEqual(table.loc[0, "nmtchtm"], 0)
+        self.assertEqual(table.loc[0, "tmjmag1"], -99.)
+        self.assertEqual(table.loc[0, "tmobjectid1"], "-99.0")
+
+        has_match = n_expected > 0
+        np.testing.assert_allclose(table["tmra1"][has_match], source_ra[idx[has_match, 0]])
+        self.assertEqual(list(table["tmobjectid1"][has_match]), [f"J{j}" for j in idx[has_match, 0]])
+
+        has_third = n_expected > 2
+        np.testing.assert_allclose(table["tmdec3"][has_third], source_dec[idx[has_third, 2]])
+        self.assertTrue(np.all(table["tmjmag3"][np.invert(has_third)] == -99.))
+
+    def test_cache(self):
+        candidates = self.get_candidates()
+        first = self.get_processor()._apply_to_candidates(candidates.copy())
+        n_queries = len(self.kowalski.queries)
+
+        second = self.get_processor()._apply_to_candidates(candidates.copy())
+        self.assertEqual(len(self.kowalski.queries), n_queries)
+        pd.testing.assert_frame_equal(first, second)
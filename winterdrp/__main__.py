@@ -45,6 +45,36 @@ parser.add_argument(
     default=None,
     help="Only process a specific image batch"
 )
+parser.add_argument(
+    "-m",
+    "--maxcpu",
+    default=1,
+    type=int,
+    help="Maximum number of processes used to process independent batches in parallel"
+)
+parser.add_argument(
+    '--streaming',
+    help='Pass each batch through the full processor chain before starting the next batch',
+    action='store_true',
+    default=False
+)
+parser.add_argument(
+    "--report",
+    default=None,
+    help="If a path is passed, a JSON/CSV report of the resources used by each processor will be written there"
+)
+parser.add_argument(
+    '--checkpoint',
+    help='Store the output of each processor step, and reuse it when re-running with unchanged inputs',
+    action='store_true',
+    default=False
+)
+parser.add_argument(
+    "--dtype",
+    default=None,
+    choices=["float32", "float64"],
+    help="Precision of image data held in memory (defaults to the pipeline setting, usually float32)"
+)
 parser.add_argument(
     '--download',
     help='Download images from server',
@@ -92,8 +122,17 @@ pipe = get_pipeline(
     args.pipeline,
     configuration=args.config,
     night=args.night,
+    max_n_cpu=args.maxcpu,
+    streaming=args.streaming,
+    use_checkpoints=args.checkpoint,
+    working_dtype=args.dtype,
 )
 
 pipe.reduce_images([[[], []]])
 
+pipe.run_report.log_summary()
+
+if args.report is not None:
+    pipe.run_report.write(args.report)
+
 logger.info('End of winterdrp execution')
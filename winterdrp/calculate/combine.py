@@ -1,5 +1,150 @@
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+
 import numpy as np
 
+logger = logging.getLogger(__name__)
+
+combine_methods = ["median", "sigma_clipped_mean", "normed_median"]
+
+default_block_mb = 256.
+
+
+def get_row_blocks(
+        n_rows: int,
+        row_size: int,
+        max_block_mb: float = default_block_mb,
+) -> list[tuple[int, int]]:
+    """Split n_rows into contiguous blocks, each using at most max_block_mb (given row_size bytes per row)"""
+    rows_per_block = max(1, int(max_block_mb * 1024. ** 2 / row_size))
+    return [(i, min(i + rows_per_block, n_rows)) for i in range(0, n_rows, rows_per_block)]
+
+
+def sigma_clipped_mean(
+        stack: np.ndarray,
+        sigma: float = 3.,
+        max_iters: int = 5,
+) -> np.ndarray:
+    """Mean along the first axis, after iteratively rejecting values more than sigma standard deviations
+    from the median. Modifies stack in place."""
+    for _ in range(max_iters):
+        center = np.nanmedian(stack, axis=0)
+        std = np.nanstd(stack, axis=0)
+        clip = np.abs(stack - center) > sigma * std
+        if not np.any(clip):
+            break
+        stack[clip] = np.nan
+    return np.nanmean(stack, axis=0)
+
+
+def combine_block(
+        images: list[np.ndarray],
+        start: int,
+        stop: int,
+        method: str,
+        scales: np.ndarray,
+        dtype: np.dtype,
+        sigma: float,
+) -> np.ndarray:
+
+    stack = np.empty((len(images), stop - start) + images[0].shape[1:], dtype=dtype)
+
+    for i, img in enumerate(images):
+        stack[i] = img[start:stop]
+        if scales is not None:
+            stack[i] /= scales[i]
+
+    if method == "sigma_clipped_mean":
+        return sigma_clipped_mean(stack, sigma=sigma)
+
+    return np.nanmedian(stack, axis=0)
+
+
+def combine_images(
+        images: list[np.ndarray],
+        method: str = "median",
+        scales: list[float] | np.ndarray = None,
+        sigma: float = 3.,
+        dtype: np.dtype = np.float64,
+        n_threads: int = None,
+        max_block_mb: float = default_block_mb,
+) -> np.ndarray:
+    """
+    Combine a stack of images pixel-by-pixel, without ever building the full (n_frames, nx, ny) cube.
+    The images are processed in blocks of rows, so memory use is bounded by max_block_mb regardless
+    of the number of frames, and blocks are combined in parallel on a thread pool.
+
+    Parameters
+    ----------
+    images: Images to combine, all with the same shape
+    method: One of 'median', 'sigma_clipped_mean' or 'normed_median'. For 'normed_median', each image
+    is divided by its own median, and the median-combined image is divided by its median.
+    scales: Optional factor by which to divide each image before combining
+    sigma: Clipping threshold, for 'sigma_clipped_mean'
+    dtype: Precision of the stack and of the combined image
+    n_threads: Number of threads (default: number of CPUs)
+    max_block_mb: Maximum size of a single block of the stack, in MB
+
+    Returns
+    -------
+    The combined image
+    """
+
+    if method not in combine_methods:
+        err = f"Unrecognised combine method '{method}'. Available methods are: {combine_methods}"
+        logger.error(err)
+        raise ValueError(err)
+
+    if len(images) == 0:
+        err = "No images were provided to combine."
+        logger.error(err)
+        raise ValueError(err)
+
+    dtype = np.dtype(dtype)
+
+    if method == "normed_median":
+        scales = [np.nanmedian(img) for img in images]
+
+    if scales is not None:
+        scales = np.array(scales, dtype=dtype)
+
+    shape = images[0].shape
+
+    for img in images:
+        if img.shape != shape:
+            err = f"Cannot combine images with different shapes ({shape} and {img.shape})."
+            logger.error(err)
+            raise ValueError(err)
+
+    if n_threads is None:
+        n_threads = os.cpu_count()
+
+    row_size = len(images) * int(np.prod(shape[1:])) * dtype.itemsize
+    blocks = get_row_blocks(shape[0], row_size, max_block_mb=max_block_mb)
+
+    logger.debug(f"Combining {len(images)} images ({method}) in {len(blocks)} blocks, with {n_threads} threads")
+
+    combined = np.empty(shape, dtype=dtype)
+
+    def combine_rows(block):
+        start, stop = block
+        combined[start:stop] = combine_block(
+            images, start, stop, method=method, scales=scales, dtype=dtype, sigma=sigma
+        )
+
+    if np.logical_or(n_threads < 2, len(blocks) < 2):
+        for block in blocks:
+            combine_rows(block)
+    else:
+        with ThreadPoolExecutor(max_workers=n_threads) as executor:
+            list(executor.map(combine_rows, blocks))
+
+    if method == "normed_median":
+        combined /= np.nanmedian(combined)
+
+    return combined
+
 
 # Median combine with scaled normalization of individual and final frames
 def median_combine_normed(
@@ -9,16 +154,8 @@ def median_combine_normed(
     Median combine with normalization of individual and final frames
     Returns the combined image
     """
-    norm_array = np.ma.zeros(img_array.shape)
-
-    # Store normalized versions of each image
-    for i in range(len(img_array[0, 0, :])):
-        norm_array[:, :, i] = img_array[:, :, i] / np.ma.median(img_array[:, :, i])
-
-        # median combination of normalized images
-    combined_img = np.ma.median(norm_array, axis=2)
+    images = [np.ma.filled(img_array[:, :, i].astype(float), np.nan) for i in range(img_array.shape[2])]
 
-    # Normalize the median combination by itself
-    combined_img = combined_img / np.ma.median(combined_img)
+    combined_img = combine_images(images, method="normed_median")
 
-    return combined_img
+    return np.ma.masked_invalid(combined_img)
@@ -0,0 +1,190 @@
+"""
+Module for cross-matching sky positions, with a reusable spatial index.
+
+Positions are converted to 3-D unit vectors, and indexed with a KD-tree. Angular separations map
+monotonically onto straight-line (chord) distances between unit vectors, so nearest-neighbour and
+within-radius queries on the tree are exact on the sphere, with no special cases at RA=0 or the poles.
+All queries return plain index and separation arrays, rather than SkyCoord objects.
+
+An index of a catalog file (e.g. a Sextractor catalog reused as the reference for several images) can be
+built once and cached, using get_ldac_sky_index.
+"""
+import logging
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+from scipy.spatial import cKDTree
+
+from winterdrp.utils.ldac_tools import get_ldac_columns
+
+logger = logging.getLogger(__name__)
+
+max_cached_indexes = 16
+
+index_cache = OrderedDict()
+index_cache_lock = threading.Lock()
+
+
+def get_unit_vectors(
+        ra_deg: np.ndarray | float,
+        dec_deg: np.ndarray | float
+) -> np.ndarray:
+    """Convert RA/Dec (in degrees) to unit vectors, of shape (N, 3) (or (3,) for scalar positions)"""
+    ra = np.radians(np.asarray(ra_deg, dtype=float))
+    dec = np.radians(np.asarray(dec_deg, dtype=float))
+    return np.stack([np.cos(dec) * np.cos(ra), np.cos(dec) * np.sin(ra), np.sin(dec)], axis=-1)
+
+
+def arcsec_to_chord(
+        sep_arcsec: np.ndarray | float
+) -> np.ndarray | float:
+    """Convert an angular separation to the distance between the corresponding unit vectors"""
+    return 2. * np.sin(np.radians(np.asarray(sep_arcsec, dtype=float) / 3600.) / 2.)
+
+
+def chord_to_arcsec(
+        chord: np.ndarray | float
+) -> np.ndarray | float:
+    """Convert a distance between unit vectors to the corresponding angular separation"""
+    return np.degrees(2. * np.arcsin(np.clip(np.asarray(chord, dtype=float) / 2., 0., 1.))) * 3600.
+
+
+class SkyIndex:
+    """
+    Spatial index of a set of sky positions (KD-tree over unit vectors)
+
+    Parameters
+    ----------
+    ra_deg: RA of each source, in degrees
+    dec_deg: Dec of each source, in degrees
+    """
+
+    def __init__(
+            self,
+            ra_deg: np.ndarray,
+            dec_deg: np.ndarray
+    ):
+        self.vectors = get_unit_vectors(np.atleast_1d(ra_deg), np.atleast_1d(dec_deg)).reshape(-1, 3)
+        self.tree = cKDTree(self.vectors)
+
+    def __len__(self):
+        return len(self.vectors)
+
+    def match_nearest(
+            self,
+            ra_deg: np.ndarray,
+            dec_deg: np.ndarray
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Find the nearest indexed source to each position (like SkyCoord.match_to_catalog_sky)
+
+        Parameters
+        ----------
+        ra_deg: RA of each position, in degrees
+        dec_deg: Dec of each position, in degrees
+
+        Returns
+        -------
+        Index of the nearest source to each position, and the separation in arcsec
+        """
+        if len(self) == 0:
+            err = "Cannot match positions to an empty catalog"
+            logger.error(err)
+            raise ValueError(err)
+
+        vectors = get_unit_vectors(np.atleast_1d(ra_deg), np.atleast_1d(dec_deg)).reshape(-1, 3)
+        dist, idx = self.tree.query(vectors, k=1)
+        return np.asarray(idx, dtype=int), chord_to_arcsec(dist)
+
+    def match_k_nearest(
+            self,
+            ra_deg: np.ndarray,
+            dec_deg: np.ndarray,
+            k: int
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Find the k nearest indexed sources to each position
+
+        Parameters
+        ----------
+        ra_deg: RA of each position, in degrees
+        dec_deg: Dec of each position, in degrees
+        k: Number of neighbours
+
+        Returns
+        -------
+        Indices of the neighbours of each position, and their separations in arcsec, both of shape (N, k)
+        and sorted by separation. If there are fewer than k sources, the missing neighbours have an
+        index of len(self) and an infinite separation.
+        """
+        vectors = get_unit_vectors(np.atleast_1d(ra_deg), np.atleast_1d(dec_deg)).reshape(-1, 3)
+        dist, idx = self.tree.query(vectors, k=k)
+        dist = np.asarray(dist).reshape(len(vectors), k)
+        idx = np.asarray(idx, dtype=int).reshape(len(vectors), k)
+        sep = np.full(dist.shape, np.inf)
+        finite = np.isfinite(dist)
+        sep[finite] = chord_to_arcsec(dist[finite])
+        return idx, sep
+
+    def match_within(
+            self,
+            ra_deg: np.ndarray,
+            dec_deg: np.ndarray,
+            radius_arcsec: float
+    ) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Find all pairs of (position, indexed source) within a radius (like SkyCoord.search_around_sky)
+
+        Parameters
+        ----------
+        ra_deg: RA of each position, in degrees
+        dec_deg: Dec of each position, in degrees
+        radius_arcsec: Maximum separation, in arcsec
+
+        Returns
+        -------
+        Index of the position and index of the source for each pair (sorted by position, then source),
+        and their separation in arcsec
+        """
+        vectors = get_unit_vectors(np.atleast_1d(ra_deg), np.atleast_1d(dec_deg)).reshape(-1, 3)
+
+        matches = self.tree.query_ball_point(vectors, r=arcsec_to_chord(radius_arcsec))
+
+        n_matches = np.array([len(x) for x in matches], dtype=int)
+        idx_query = np.repeat(np.arange(len(vectors)), n_matches)
+        idx_index = np.concatenate([np.asarray(x, dtype=int) for x in matches] + [np.zeros(0, dtype=int)])
+
+        order = np.lexsort((idx_index, idx_query))
+        idx_query = idx_query[order]
+        idx_index = idx_index[order]
+
+        chord = np.linalg.norm(vectors[idx_query] - self.vectors[idx_index], axis=-1)
+
+        return idx_query, idx_index, chord_to_arcsec(chord)
+
+
+def get_ldac_sky_index(
+        file_path: str,
+        ra_column: str = "ALPHAWIN_J2000",
+        dec_column: str = "DELTAWIN_J2000",
+) -> SkyIndex:
+    """Get the index of a fits_ldac catalog, keeping the indexes of recently used catalogs in memory"""
+    stat = os.stat(file_path)
+    key = (os.path.abspath(file_path), stat.st_mtime_ns, stat.st_size, ra_column, dec_column)
+
+    with index_cache_lock:
+        if key in index_cache:
+            index_cache.move_to_end(key)
+            return index_cache[key]
+
+    columns = get_ldac_columns(file_path, [ra_column, dec_column])
+    index = SkyIndex(columns[ra_column], columns[dec_column])
+
+    with index_cache_lock:
+        index_cache[key] = index
+        while len(index_cache) > max_cached_indexes:
+            index_cache.popitem(last=False)
+
+    return index
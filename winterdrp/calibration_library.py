@@ -0,0 +1,247 @@
+"""
+Module for a persistent library of master calibration frames (bias, dark, flat), shared between nights.
+Masters are indexed in a small SQLite database, so that a processor can reuse a master built from the same
+input frames, or fall back to the nearest master in time when a night has no calibration frames of its own.
+"""
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from collections.abc import Callable
+
+import astropy.io.fits
+import numpy as np
+from astropy.time import Time
+
+logger = logging.getLogger(__name__)
+
+library_index_name = "index.db"
+
+# Header keys checked (in order) for each piece of master frame metadata
+mjd_keys = ["MJD-OBS", "EXPMJD", "OBSMJD"]
+detector_keys = ["DETECTOR", "INSTRUME", "DETNAM"]
+filter_key = "FILTER"
+exptime_key = "EXPTIME"
+
+exptime_tolerance = 1.e-3
+
+masters_schema = """
+CREATE TABLE IF NOT EXISTS masters (
+    path TEXT PRIMARY KEY,
+    cal_type TEXT NOT NULL,
+    input_hash TEXT NOT NULL,
+    filter TEXT,
+    exptime REAL,
+    detector TEXT,
+    obs_mjd REAL,
+    n_frames INTEGER,
+    created REAL
+);
+CREATE INDEX IF NOT EXISTS masters_lookup ON masters (cal_type, detector, obs_mjd);
+CREATE INDEX IF NOT EXISTS masters_hash ON masters (cal_type, input_hash);
+"""
+
+
+def get_obs_mjd(
+        header: astropy.io.fits.Header
+) -> float | None:
+    """Get the MJD of an observation from its header, or None if it cannot be determined"""
+    for key in mjd_keys:
+        if key in header.keys():
+            try:
+                return float(header[key])
+            except (TypeError, ValueError):
+                pass
+    try:
+        return float(Time(header["UTCTIME"]).mjd)
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+def get_detector(
+        header: astropy.io.fits.Header
+) -> str:
+    for key in detector_keys:
+        if key in header.keys():
+            return str(header[key])
+    return ""
+
+
+def get_master_metadata(
+        headers: list[astropy.io.fits.Header]
+) -> dict:
+    """Get the metadata used to index (or search for) a master frame, from the headers of a batch
+
+    Parameters
+    ----------
+    headers: Headers of the input frames (or of the images to be calibrated)
+
+    Returns
+    -------
+    Dictionary with filter, exptime, detector and mean obs_mjd
+    """
+    header = headers[0]
+
+    mjds = [x for x in [get_obs_mjd(h) for h in headers] if x is not None]
+
+    exptime = header.get(exptime_key, None)
+
+    return {
+        "filter": str(header.get(filter_key, "")),
+        "exptime": None if exptime is None else float(exptime),
+        "detector": get_detector(header),
+        "obs_mjd": float(np.mean(mjds)) if len(mjds) > 0 else None,
+    }
+
+
+class CalibrationLibrary:
+    """Index of master calibration frames, stored as a SQLite database in 'library_dir'"""
+
+    def __init__(
+            self,
+            library_dir: str
+    ):
+        self.library_dir = library_dir
+        self.db_path = os.path.join(library_dir, library_index_name)
+
+    def connect(self) -> sqlite3.Connection:
+        try:
+            os.makedirs(self.library_dir)
+        except OSError:
+            pass
+
+        conn = sqlite3.connect(self.db_path, timeout=30.)
+        conn.executescript(masters_schema)
+        return conn
+
+    def add_master(
+            self,
+            path: str,
+            cal_type: str,
+            input_hash: str,
+            headers: list[astropy.io.fits.Header],
+    ):
+        """Record a master frame built from the frames with 'headers'"""
+        metadata = get_master_metadata(headers)
+
+        with self.connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO masters "
+                "(path, cal_type, input_hash, filter, exptime, detector, obs_mjd, n_frames, created) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (os.path.abspath(path), cal_type, input_hash, metadata["filter"], metadata["exptime"],
+                 metadata["detector"], metadata["obs_mjd"], len(headers), time.time())
+            )
+        conn.close()
+
+        logger.debug(f"Added {cal_type} master {path} to calibration library {self.db_path}")
+
+    def query_paths(
+            self,
+            query: str,
+            params: list
+    ) -> list[str]:
+        conn = self.connect()
+        try:
+            rows = conn.execute(query, params).fetchall()
+        finally:
+            conn.close()
+        return [x[0] for x in rows if os.path.exists(x[0])]
+
+    def find_by_hash(
+            self,
+            cal_type: str,
+            input_hash: str
+    ) -> str | None:
+        """Find a master frame built from exactly the same input frames"""
+        paths = self.query_paths(
+            "SELECT path FROM masters WHERE cal_type = ? AND input_hash = ? ORDER BY created DESC",
+            [cal_type, input_hash]
+        )
+        return paths[0] if len(paths) > 0 else None
+
+    def find_nearest(
+            self,
+            cal_type: str,
+            headers: list[astropy.io.fits.Header],
+            match_keys: list[str] = (),
+            max_age_days: float = 30.,
+    ) -> str | None:
+        """Find the master frame which is nearest in time to the images with 'headers', and
+        has the same detector (and values of 'match_keys', any of 'filter' and 'exptime').
+
+        Parameters
+        ----------
+        cal_type: Type of master frame (the base_key of the processor making it)
+        headers: Headers of the images to be calibrated
+        match_keys: Metadata which must match
+        max_age_days: Maximum time difference between the master and the images
+
+        Returns
+        -------
+        Path of the master frame, or None if no valid master is found
+        """
+        metadata = get_master_metadata(headers)
+
+        if metadata["obs_mjd"] is None:
+            logger.warning(f"Cannot determine observation time, so no {cal_type} master can be matched by time")
+            return None
+
+        query = "SELECT path FROM masters WHERE cal_type = ? AND detector = ? " \
+                "AND obs_mjd IS NOT NULL AND ABS(obs_mjd - ?) <= ?"
+        params = [cal_type, metadata["detector"], metadata["obs_mjd"], max_age_days]
+
+        for key in match_keys:
+            if key == "exptime":
+                query += " AND ABS(exptime - ?) < ?"
+                params += [metadata["exptime"], exptime_tolerance]
+            else:
+                query += f" AND {key} = ?"
+                params.append(metadata[key])
+
+        query += " ORDER BY ABS(obs_mjd - ?) ASC, created DESC"
+        params.append(metadata["obs_mjd"])
+
+        paths = self.query_paths(query, params)
+        return paths[0] if len(paths) > 0 else None
+
+
+max_cached_masters = 8
+
+master_cache = OrderedDict()
+master_cache_lock = threading.Lock()
+
+
+def load_cached_master(
+        path: str,
+        load_fits: Callable[[str], tuple[np.ndarray, astropy.io.fits.Header]]
+) -> tuple[np.ndarray, astropy.io.fits.Header]:
+    """Load a master frame, keeping the most recently used masters in memory. The cached objects are
+    returned directly, so callers must copy them before making any changes.
+
+    Parameters
+    ----------
+    path: Path of the master frame
+    load_fits: Function to open the file if it is not cached
+
+    Returns
+    -------
+    Master image and header
+    """
+    key = (os.path.abspath(path), os.path.getmtime(path))
+
+    with master_cache_lock:
+        if key in master_cache:
+            master_cache.move_to_end(key)
+            return master_cache[key]
+
+    data, header = load_fits(path)
+
+    with master_cache_lock:
+        master_cache[key] = (data, header)
+        while len(master_cache) > max_cached_masters:
+            master_cache.popitem(last=False)
+
+    return data, header
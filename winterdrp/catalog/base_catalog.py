@@ -1,18 +1,53 @@
 import astropy.table
+import io
 import os
 import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
 import astropy.io.fits
 import pandas as pd
+from astropy.table import Table
 
+from winterdrp.catalog.local_mirror import LocalCatalogMirror, open_mirror
+from winterdrp.catalog.tile_cache import CatalogTileCache, default_cache_nside, get_params_hash, is_offline
+from winterdrp.catalog.xmatch_cache import XMatchCache
 from winterdrp.utils.ldac_tools import save_table_as_ldac
-from winterdrp.paths import base_name_key
+from winterdrp.paths import base_name_key, ref_catalog_cache_dir, ref_catalog_mirror_dir
 from penquins import Kowalski
 import numpy as np
 
 logger = logging.getLogger(__name__)
 
+xmatch_cache_name = "kowalski_xmatch.db"
+
+default_xmatch_cache_path = None if ref_catalog_cache_dir is None \
+    else os.path.join(ref_catalog_cache_dir, xmatch_cache_name)
+
+
+def convert_table_via_csv(
+        table: astropy.table.Table
+) -> astropy.table.Table:
+    """Round-trip a table through CSV (in memory), which converts the column types of query results
+    (e.g. from Vizier) to plain ones"""
+    buf = io.StringIO()
+    table.write(buf, format="ascii.csv")
+    return Table.read(buf.getvalue(), format="ascii.csv")
+
 
 class BaseCatalog:
+    """
+    Base class for reference catalogs queried around the centre of an image.
+
+    Subclasses implement query_catalog, which queries the network. Cone searches within the footprint of a
+    local mirror (in mirror_dir, by default REF_CATALOG_MIRROR_DIR, see winterdrp.catalog.local_mirror) are
+    served from the mirror. Otherwise, if a cache directory is set (by default REF_CATALOG_CACHE_DIR, or a
+    subdirectory of OUTPUT_DATA_DIR), queries are served from a persistent HEALPix tile cache
+    (see winterdrp.catalog.tile_cache). With offline=True (by default REF_CATALOG_OFFLINE), catalogs are
+    never queried over the network.
+    """
+
+    ra_column = "ra"
+    dec_column = "dec"
 
     @property
     def abbreviation(self):
@@ -23,19 +58,99 @@ class BaseCatalog:
             search_radius_arcmin: float,
             min_mag: float,
             max_mag: float,
-            filter_name: str
+            filter_name: str,
+            cache_dir: str = ref_catalog_cache_dir,
+            offline: bool = None,
+            cache_nside: int = default_cache_nside,
+            mirror_dir: str = ref_catalog_mirror_dir
     ):
         self.search_radius_arcmin = search_radius_arcmin
         self.min_mag = min_mag
         self.max_mag = max_mag
         self.filter_name = filter_name
+        self.cache_dir = cache_dir
+        self.offline = is_offline() if offline is None else offline
+        self.cache_nside = cache_nside
+        self.mirror_dir = mirror_dir
+
+    def query_catalog(
+            self,
+            ra_deg: float,
+            dec_deg: float,
+            search_radius_arcmin: float
+    ) -> astropy.table.Table:
+        """Query the catalog over the network, for a cone around (ra_deg, dec_deg)"""
+        raise NotImplementedError()
+
+    def get_cache_params(self) -> dict:
+        """Parameters which change the result of query_catalog (other than the cone), used to key the cache"""
+        return {
+            "min_mag": self.min_mag,
+            "max_mag": self.max_mag,
+            "filter_name": self.filter_name,
+        }
+
+    def get_cache_sub_dir(self) -> str:
+        return os.path.join(self.abbreviation, get_params_hash(self.get_cache_params()))
+
+    def get_tile_cache(self) -> CatalogTileCache | None:
+        if self.cache_dir is None:
+            return None
+
+        return CatalogTileCache(
+            cache_dir=os.path.join(self.cache_dir, self.get_cache_sub_dir()),
+            query=self.query_catalog,
+            ra_column=self.ra_column,
+            dec_column=self.dec_column,
+            nside=self.cache_nside,
+            offline=self.offline
+        )
+
+    def get_mirror_path(
+            self,
+            mirror_dir: str = None
+    ) -> str:
+        if mirror_dir is None:
+            mirror_dir = self.mirror_dir
+        return os.path.join(mirror_dir, self.get_cache_sub_dir())
+
+    def get_mirror(self) -> LocalCatalogMirror | None:
+        if self.mirror_dir is None:
+            return None
+        return open_mirror(self.get_mirror_path())
+
+    def select_sources(
+            self,
+            table: astropy.table.Table
+    ) -> astropy.table.Table:
+        """Any selection applied after the catalog is retrieved (e.g. image-specific trimming)"""
+        return table
 
-    @staticmethod
     def get_catalog(
+            self,
             ra_deg: float,
             dec_deg: float
     ) -> astropy.table.Table:
-        raise NotImplementedError()
+        mirror = self.get_mirror()
+        cache = self.get_tile_cache()
+
+        if mirror is not None and mirror.covers(ra_deg, dec_deg, self.search_radius_arcmin):
+            logger.debug(f"Using local mirror of {self.abbreviation} catalog in {mirror.mirror_dir}")
+            table = mirror.get_catalog(ra_deg, dec_deg, self.search_radius_arcmin)
+        elif cache is None:
+            if self.offline:
+                err = f"Offline mode is enabled, but the {self.abbreviation} catalog around " \
+                      f"RA {ra_deg:.4f}, Dec {dec_deg:.4f} is not in a local mirror, and no reference catalog " \
+                      f"cache directory has been specified. Run 'export REF_CATALOG_CACHE_DIR=/path/to/cache' to set one."
+                logger.error(err)
+                raise ValueError(err)
+            table = self.query_catalog(ra_deg, dec_deg, self.search_radius_arcmin)
+        else:
+            table = cache.get_catalog(ra_deg, dec_deg, self.search_radius_arcmin)
+
+        logger.info(f'Found {len(table)} sources in {self.abbreviation} catalog')
+
+        return self.select_sources(table)
 
     def write_catalog(
             self,
@@ -122,18 +237,23 @@ class BaseXMatchCatalog:
         raise NotImplementedError
 
 
-class BaseKowalskiXMatch(BaseXMatchCatalog):
+kowalski_clients = {}
+kowalski_clients_lock = threading.Lock()
 
-    def __init__(self,
-                 kowalski: Kowalski = None,
-                 max_time_ms: float = 10000,
-                 *args,
-                 **kwargs):
-        super(BaseKowalskiXMatch, self).__init__(*args,**kwargs)
-        self.max_time_ms = max_time_ms
-        self.kowalski = kowalski
+default_kowalski_pool_size = 4
+
+
+def get_kowalski(
+        pool_size: int = default_kowalski_pool_size
+) -> Kowalski:
+    """Get the Kowalski client of this process, creating (and pinging) it if needed.
+    The client is shared by all catalogs, and keeps a pool of up to 'pool_size' connections."""
+    pid = os.getpid()
+
+    with kowalski_clients_lock:
+        if pid in kowalski_clients:
+            return kowalski_clients[pid]
 
-    def get_kowalski(self) -> Kowalski:
         protocol, host, port = "https", "kowalski.caltech.edu", 443
 
         token_kowalski = os.environ.get("kowalski_token")
@@ -141,7 +261,8 @@ class BaseKowalskiXMatch(BaseXMatchCatalog):
         if token_kowalski is not None:
             logger.debug("Using kowalski token")
 
-            k = Kowalski(token=token_kowalski, protocol=protocol, host=host, port=port)
+            k = Kowalski(token=token_kowalski, protocol=protocol, host=host, port=port,
+                         pool_connections=pool_size, pool_maxsize=pool_size)
 
         else:
 
@@ -158,12 +279,52 @@ class BaseKowalskiXMatch(BaseXMatchCatalog):
                 raise ValueError
 
             k = Kowalski(username=username_kowalski, password=password_kowalski, protocol=protocol, host=host,
-                         port=port)
+                         port=port, pool_connections=pool_size, pool_maxsize=pool_size)
 
         connection_ok = k.ping()
         logger.info(f'Connection OK?: {connection_ok}')
 
-        return k
+        kowalski_clients[pid] = k
+
+    return k
+
+
+class BaseKowalskiXMatch(BaseXMatchCatalog):
+    """
+    Base class for cross-matching with a Kowalski catalog.
+
+    Positions are queried in chunks of up to 'max_query_sources', with up to 'max_n_threads' chunks
+    in flight at once, through one Kowalski client shared by all catalogs. Results are cached
+    (see winterdrp.catalog.xmatch_cache) in 'cache_path', by default in the reference catalog cache
+    directory, so positions which have already been queried never go to the network again.
+    """
+
+    def __init__(self,
+                 kowalski: Kowalski = None,
+                 max_time_ms: float = 10000,
+                 max_query_sources: int = 500,
+                 max_n_threads: int = default_kowalski_pool_size,
+                 cache_path: str = default_xmatch_cache_path,
+                 *args,
+                 **kwargs):
+        super(BaseKowalskiXMatch, self).__init__(*args,**kwargs)
+        self.max_time_ms = max_time_ms
+        self.kowalski = kowalski
+        self.max_query_sources = max_query_sources
+        self.max_n_threads = max_n_threads
+        self.cache_path = cache_path
+
+    def get_kowalski(self) -> Kowalski:
+        return get_kowalski(pool_size=self.max_n_threads)
+
+    def get_query_key(self) -> str:
+        """Key of the query parameters, for the result cache"""
+        params = {
+            "radius": self.search_radius_arcsec,
+            "limit": self.num_sources,
+            "projection": self.projection,
+        }
+        return f"{self.catalog_name}_{get_params_hash(params)}"
 
     def near_query_kowalski(self, coords: dict) -> dict:
         query = {
@@ -184,14 +345,43 @@ class BaseKowalskiXMatch(BaseXMatchCatalog):
                 "limit": self.num_sources,
             },
         }
-        logger.info(f'Kowalski is {self.kowalski}')
         response = self.kowalski.query(query=query)
         data = response.get("data")
         return data[self.catalog_name]
 
     def query(self, coords) -> dict:
+        cache = None if self.cache_path is None else XMatchCache(self.cache_path)
+
+        results = {}
+        if cache is not None:
+            results = cache.load(self.get_query_key(), coords)
+
+        missing = [x for x in coords.keys() if x not in results]
+
+        logger.info(f'Found {len(results)} of {len(coords)} sources in the {self.catalog_name} cross-match cache')
+
+        if len(missing) == 0:
+            return results
+
         if self.kowalski is None:
             self.kowalski = self.get_kowalski()
-        logger.info('Querying kowalski')
-        data = self.near_query_kowalski(coords)
-        return data
+
+        chunks = [
+            {x: coords[x] for x in missing[i: i + self.max_query_sources]}
+            for i in range(0, len(missing), self.max_query_sources)
+        ]
+
+        logger.info(f'Querying kowalski for {len(missing)} sources, in {len(chunks)} chunks')
+
+        if np.logical_or(len(chunks) < 2, self.max_n_threads < 2):
+            chunk_results = [self.near_query_kowalski(x) for x in chunks]
+        else:
+            with ThreadPoolExecutor(max_workers=self.max_n_threads) as executor:
+                chunk_results = list(executor.map(self.near_query_kowalski, chunks))
+
+        for chunk, data in zip(chunks, chunk_results):
+            results.update(data)
+            if cache is not None:
+                cache.save(self.get_query_key(), chunk, data)
+
+        return results
@@ -2,9 +2,8 @@ import logging
 import astropy.table
 from astroquery.gaia import Gaia
 from winterdrp.catalog.base_catalog import BaseCatalog
-from astropy.coordinates import SkyCoord
-import astropy.units as u
-from winterdrp.utils.ldac_tools import get_table_from_ldac
+from winterdrp.calculate.crossmatch import SkyIndex
+from winterdrp.utils.ldac_tools import get_ldac_columns
 
 logger = logging.getLogger(__name__)
 
@@ -21,24 +20,30 @@ class Gaia2Mass(BaseCatalog):
             ph_qual_cut: bool = False,
             trim: bool = False,
             image_catalog_path: str = None,
-
+            **kwargs
     ):
-        super().__init__(search_radius_arcmin, min_mag, max_mag, filter_name)
+        super().__init__(search_radius_arcmin, min_mag, max_mag, filter_name, **kwargs)
         self.ph_qual_cut = ph_qual_cut
         self.trim = trim
         self.image_catalog_path = image_catalog_path
 
         logger.info(f'Sextractor catalog path is {self.image_catalog_path}')
 
-    def get_catalog(
+    def get_cache_params(self) -> dict:
+        params = super().get_cache_params()
+        params["ph_qual_cut"] = self.ph_qual_cut
+        return params
+
+    def query_catalog(
             self,
             ra_deg: float,
             dec_deg: float,
+            search_radius_arcmin: float
     ) -> astropy.table.Table:
 
         logger.info(
             f'Querying 2MASS - Gaia cross-match around RA {ra_deg:.4f}, '
-            f'Dec {dec_deg:.4f} with a radius of {self.search_radius_arcmin:.4f} arcmin'
+            f'Dec {dec_deg:.4f} with a radius of {search_radius_arcmin:.4f} arcmin'
         )
 
         cmd = f"SELECT * FROM gaiadr2.gaia_source AS g, " \
@@ -47,14 +52,14 @@ class Gaia2Mass(BaseCatalog):
               f"WHERE g.source_id = tbest.source_id " \
               f"AND tbest.tmass_oid = tmass.tmass_oid " \
               f"AND CONTAINS(POINT('ICRS', g.ra, g.dec), " \
-              f"CIRCLE('ICRS', {ra_deg:.4f}, {dec_deg:.4f}, {self.search_radius_arcmin / 60:.4f}))=1 " \
+              f"CIRCLE('ICRS', {ra_deg:.4f}, {dec_deg:.4f}, {search_radius_arcmin / 60:.4f}))=1 " \
               f"AND tmass.{self.filter_name}_m > {self.min_mag:.2f} " \
               f"AND tmass.{self.filter_name}_m < {self.max_mag:.2f} " \
               f"AND tbest.number_of_mates=0 " \
               f"AND tbest.number_of_neighbours=1"
 
         if self.ph_qual_cut:
-            cmd += f"AND tmass.ph_qual='AAA';"
+            cmd += f" AND tmass.ph_qual='AAA';"
         else:
             cmd += ";"
 
@@ -70,23 +75,28 @@ class Gaia2Mass(BaseCatalog):
         t["magnitude"] = t[f"{self.filter_name.lower()}_m"]
 
         logger.info(f'Found {len(t)} sources in Gaia')
+
+        return t
+
+    def select_sources(
+            self,
+            table: astropy.table.Table
+    ) -> astropy.table.Table:
         if self.trim:
             if self.image_catalog_path is None:
                 logger.error('Gaia catalog trimming requested but no sextractor catalog path specified.')
                 raise ValueError
             else:
-                image_catalog = get_table_from_ldac(self.image_catalog_path)
-                t = self.trim_catalog(t, image_catalog)
-                logger.info(f'Trimmed to {len(t)} sources in Gaia')
+                image_catalog = get_ldac_columns(self.image_catalog_path, ['ALPHAWIN_J2000', 'DELTAWIN_J2000'])
+                table = self.trim_catalog(table, image_catalog)
+                logger.info(f'Trimmed to {len(table)} sources in Gaia')
 
-        return t
+        return table
 
     def trim_catalog(self, ref_catalog, image_catalog):
-        ref_coords = SkyCoord(ra=ref_catalog['ra'], dec=ref_catalog['dec'], unit=(u.deg, u.deg))
-        image_coords = SkyCoord(ra=image_catalog['ALPHAWIN_J2000'], dec=image_catalog['DELTAWIN_J2000'],
-                                unit=(u.deg, u.deg))
-        idx, d2d, d3d = image_coords.match_to_catalog_sky(ref_coords)
-        match_mask = (d2d < 2 * u.arcsec)
+        ref_index = SkyIndex(ref_catalog['ra'], ref_catalog['dec'])
+        idx, d2d_arcsec = ref_index.match_nearest(image_catalog['ALPHAWIN_J2000'], image_catalog['DELTAWIN_J2000'])
+        match_mask = (d2d_arcsec < 2)
         matched_catalog = ref_catalog[idx[match_mask]]
         return matched_catalog
 #        if len(matched_catalog) == 0:
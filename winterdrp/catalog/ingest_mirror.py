@@ -0,0 +1,106 @@
+#!/usr/bin/env python
+"""
+Script to build a local mirror of a reference catalog for a survey footprint, e.g.
+
+python -m winterdrp.catalog.ingest_mirror -c tmass -f j --minmag 10 --maxmag 20 --radius 30 --fields fields.txt
+
+where fields.txt has the RA and Dec (in degrees) of one field per line. Pipelines then use the mirror
+for any catalog with the same parameters, when REF_CATALOG_MIRROR_DIR is set to the same directory.
+"""
+import argparse
+import logging
+import sys
+
+import numpy as np
+
+from winterdrp.catalog import Gaia2Mass, PS1, SDSS
+from winterdrp.catalog.local_mirror import ingest_catalog, default_mirror_nside
+from winterdrp.paths import ref_catalog_mirror_dir
+
+logger = logging.getLogger(__name__)
+
+mirror_catalogs = {x.abbreviation: x for x in [Gaia2Mass, PS1, SDSS]}
+
+parser = argparse.ArgumentParser(
+    description="Build a local mirror of a reference catalog for a survey footprint"
+)
+parser.add_argument(
+    "-c",
+    "--catalog",
+    required=True,
+    choices=list(mirror_catalogs.keys()),
+    help="Catalog to mirror"
+)
+parser.add_argument(
+    "-f",
+    "--filter",
+    required=True,
+    help="Filter of the catalog (as used by the pipeline)"
+)
+parser.add_argument(
+    "--minmag",
+    type=float,
+    default=10.,
+    help="Minimum magnitude (as used by the pipeline)"
+)
+parser.add_argument(
+    "--maxmag",
+    type=float,
+    default=20.,
+    help="Maximum magnitude (as used by the pipeline)"
+)
+parser.add_argument(
+    "--radius",
+    type=float,
+    default=30.,
+    help="Search radius in arcmin (as used by the pipeline)"
+)
+parser.add_argument(
+    "--fields",
+    required=True,
+    help="File with the RA and Dec (in degrees) of each field in the footprint, one per line"
+)
+parser.add_argument(
+    "--mirrordir",
+    default=ref_catalog_mirror_dir,
+    help="Root directory of local mirrors (default: REF_CATALOG_MIRROR_DIR)"
+)
+parser.add_argument(
+    "--nside",
+    type=int,
+    default=default_mirror_nside,
+    help="HEALPix nside used to order the sources of the mirror"
+)
+parser.add_argument(
+    "--level",
+    default="INFO",
+    help="Python logging level"
+)
+
+args = parser.parse_args()
+
+# Set up logging
+
+log = logging.getLogger("winterdrp")
+
+handler = logging.StreamHandler(sys.stdout)
+formatter = logging.Formatter('%(name)s [l %(lineno)d] - %(levelname)s - %(message)s')
+handler.setFormatter(formatter)
+log.addHandler(handler)
+log.setLevel(args.level)
+
+fields = np.loadtxt(args.fields, ndmin=2)
+
+catalog = mirror_catalogs[args.catalog](
+    search_radius_arcmin=args.radius,
+    min_mag=args.minmag,
+    max_mag=args.maxmag,
+    filter_name=args.filter,
+    mirror_dir=args.mirrordir
+)
+
+ingest_catalog(
+    catalog,
+    field_centres=fields[:, :2],
+    nside=args.nside
+)
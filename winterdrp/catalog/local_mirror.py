@@ -0,0 +1,318 @@
+"""
+Module for a local mirror of a reference catalog over a fixed footprint, which answers cone searches
+without the network.
+
+A mirror holds one catalog (with one set of query parameters) in a directory of numpy files: one file per
+column, with all sources sorted by their HEALPix pixel (nested ordering, at 'nside'), and a file of those
+sorted pixel indices. Columns are memory-mapped, so a cone search finds the pixels overlapping the cone,
+binary-searches the pixel index for the rows of each pixel, and reads only those rows.
+
+Mirrors are built from the tiles of a CatalogTileCache (see ingest_catalog), and record which tiles they
+cover, so that a cone search outside the footprint can fall back to the cache or the network.
+"""
+import json
+import logging
+import os
+import shutil
+import tempfile
+import threading
+from collections import OrderedDict
+
+import astropy.table
+import astropy.units as u
+import numpy as np
+from astropy.coordinates import ICRS
+from astropy.table import Table, MaskedColumn
+from astropy_healpix import HEALPix
+
+from winterdrp.calculate.crossmatch import get_unit_vectors
+from winterdrp.catalog.tile_cache import CatalogTileCache
+
+logger = logging.getLogger(__name__)
+
+default_mirror_nside = 256
+
+mirror_meta_name = "mirror.json"
+mirror_pixels_name = "pixels.npy"
+
+max_cached_mirrors = 8
+
+mirror_cache = OrderedDict()
+mirror_cache_lock = threading.Lock()
+
+
+class LocalCatalogMirror:
+    """Read-only local mirror of a catalog in 'mirror_dir' (see write_mirror for the layout)"""
+
+    def __init__(
+            self,
+            mirror_dir: str
+    ):
+        self.mirror_dir = mirror_dir
+
+        with open(os.path.join(mirror_dir, mirror_meta_name), "r") as f:
+            self.meta = json.load(f)
+
+        self.healpix = HEALPix(nside=self.meta["nside"], order="nested", frame=ICRS())
+        self.tile_healpix = HEALPix(nside=self.meta["tile_nside"], order="nested", frame=ICRS())
+        self.tiles = np.array(self.meta["tiles"], dtype=np.int64)
+        self.pixels = np.load(os.path.join(mirror_dir, mirror_pixels_name), mmap_mode="r")
+
+        self.columns = {}
+        for i, col in enumerate(self.meta["columns"]):
+            data = np.load(os.path.join(mirror_dir, f"col_{i}.npy"), mmap_mode="r")
+            mask = None
+            if col["masked"]:
+                mask = np.load(os.path.join(mirror_dir, f"col_{i}_mask.npy"), mmap_mode="r")
+            self.columns[col["name"]] = (data, mask, col["unit"])
+
+    def covers(
+            self,
+            ra_deg: float,
+            dec_deg: float,
+            search_radius_arcmin: float
+    ) -> bool:
+        """Whether a cone lies entirely within the footprint of the mirror"""
+        tiles = self.tile_healpix.cone_search_lonlat(
+            ra_deg * u.deg, dec_deg * u.deg, radius=search_radius_arcmin * u.arcmin
+        )
+        return bool(np.all(np.isin(tiles, self.tiles)))
+
+    def get_cone_rows(
+            self,
+            ra_deg: float,
+            dec_deg: float,
+            search_radius_arcmin: float
+    ) -> np.ndarray:
+        """Indices of all rows within a cone"""
+        pixels = np.sort(self.healpix.cone_search_lonlat(
+            ra_deg * u.deg, dec_deg * u.deg, radius=search_radius_arcmin * u.arcmin
+        ))
+
+        starts = np.searchsorted(self.pixels, pixels, side="left")
+        ends = np.searchsorted(self.pixels, pixels, side="right")
+
+        rows = np.concatenate([np.arange(start, end) for start, end in zip(starts, ends)] + [np.zeros(0, dtype=int)])
+
+        if len(rows) == 0:
+            return rows
+
+        ra = self.columns[self.meta["ra_column"]][0][rows]
+        dec = self.columns[self.meta["dec_column"]][0][rows]
+
+        cos_sep = np.dot(get_unit_vectors(ra, dec), get_unit_vectors(ra_deg, dec_deg))
+
+        return rows[cos_sep > np.cos(np.radians(search_radius_arcmin / 60.))]
+
+    def get_catalog(
+            self,
+            ra_deg: float,
+            dec_deg: float,
+            search_radius_arcmin: float
+    ) -> astropy.table.Table:
+        """Cone search of the mirror
+
+        Parameters
+        ----------
+        ra_deg: RA of the centre of the cone
+        dec_deg: Dec of the centre of the cone
+        search_radius_arcmin: Radius of the cone
+
+        Returns
+        -------
+        All sources within the cone
+        """
+        rows = self.get_cone_rows(ra_deg, dec_deg, search_radius_arcmin)
+
+        table = Table()
+        for name, (data, mask, unit) in self.columns.items():
+            if mask is not None:
+                table[name] = MaskedColumn(data[rows], mask=mask[rows], unit=unit)
+            else:
+                table[name] = astropy.table.Column(data[rows], unit=unit)
+        return table
+
+
+def open_mirror(
+        mirror_dir: str
+) -> LocalCatalogMirror | None:
+    """Open a mirror (or return None if there is no mirror in 'mirror_dir'), keeping recently used mirrors open"""
+    meta_path = os.path.join(mirror_dir, mirror_meta_name)
+
+    try:
+        key = (os.path.abspath(mirror_dir), os.stat(meta_path).st_mtime_ns)
+    except FileNotFoundError:
+        return None
+
+    with mirror_cache_lock:
+        if key in mirror_cache:
+            mirror_cache.move_to_end(key)
+            return mirror_cache[key]
+
+    mirror = LocalCatalogMirror(mirror_dir)
+
+    with mirror_cache_lock:
+        mirror_cache[key] = mirror
+        while len(mirror_cache) > max_cached_mirrors:
+            mirror_cache.popitem(last=False)
+
+    return mirror
+
+
+def write_mirror(
+        table: astropy.table.Table,
+        mirror_dir: str,
+        tiles: np.ndarray,
+        tile_nside: int,
+        ra_column: str = "ra",
+        dec_column: str = "dec",
+        nside: int = default_mirror_nside,
+        params: dict = None
+):
+    """
+    Write a table as a mirror, replacing any existing mirror in 'mirror_dir'
+
+    Parameters
+    ----------
+    table: Every source in the footprint
+    mirror_dir: Directory of the mirror
+    tiles: Tiles (at tile_nside) making up the footprint
+    tile_nside: HEALPix nside of the footprint tiles
+    ra_column: Name of the RA column (in degrees)
+    dec_column: Name of the Dec column (in degrees)
+    nside: HEALPix nside used to order the sources
+    params: Query parameters of the catalog, recorded for reference
+    """
+    parent_dir = os.path.dirname(os.path.abspath(mirror_dir))
+
+    try:
+        os.makedirs(parent_dir)
+    except OSError:
+        pass
+
+    healpix = HEALPix(nside=nside, order="nested", frame=ICRS())
+
+    if len(table) > 0:
+        pixels = healpix.lonlat_to_healpix(
+            np.asarray(table[ra_column], dtype=float) * u.deg,
+            np.asarray(table[dec_column], dtype=float) * u.deg
+        )
+    else:
+        pixels = np.zeros(0, dtype=np.int64)
+
+    order = np.argsort(pixels, kind="stable")
+
+    meta = {
+        "nside": nside,
+        "tile_nside": tile_nside,
+        "tiles": [int(x) for x in np.unique(tiles)],
+        "ra_column": ra_column,
+        "dec_column": dec_column,
+        "n_sources": len(table),
+        "params": {key: repr(value) for key, value in (params or {}).items()},
+        "columns": [],
+    }
+
+    # Write the new mirror alongside the old one, and then swap them, so readers never see a partial mirror
+    temp_dir = tempfile.mkdtemp(dir=parent_dir, prefix=".mirror_")
+
+    np.save(os.path.join(temp_dir, mirror_pixels_name), np.asarray(pixels, dtype=np.int64)[order])
+
+    for i, name in enumerate(table.colnames):
+        col = table[name]
+        masked = isinstance(col, MaskedColumn)
+        data = np.asarray(col.filled() if masked else col)[order]
+        np.save(os.path.join(temp_dir, f"col_{i}.npy"), data)
+        if masked:
+            np.save(os.path.join(temp_dir, f"col_{i}_mask.npy"), np.asarray(col.mask)[order])
+        meta["columns"].append({
+            "name": name,
+            "unit": None if col.unit is None else str(col.unit),
+            "masked": masked,
+        })
+
+    with open(os.path.join(temp_dir, mirror_meta_name), "w") as f:
+        json.dump(meta, f)
+
+    if os.path.exists(mirror_dir):
+        old_dir = temp_dir + "_old"
+        os.replace(mirror_dir, old_dir)
+        os.replace(temp_dir, mirror_dir)
+        shutil.rmtree(old_dir)
+    else:
+        os.replace(temp_dir, mirror_dir)
+
+    logger.info(f"Wrote mirror of {len(table)} sources in {len(meta['tiles'])} tiles to {mirror_dir}")
+
+
+def ingest_catalog(
+        catalog,
+        field_centres: list[tuple[float, float]] | np.ndarray,
+        search_radius_arcmin: float = None,
+        mirror_dir: str = None,
+        nside: int = default_mirror_nside
+) -> str:
+    """
+    Build the local mirror of a catalog (a BaseCatalog) for a footprint. The footprint is every cache tile
+    overlapping a cone around any of the field centres. Tiles are fetched through the tile cache of the
+    catalog (or a temporary cache, if it has none), so ingestion can resume after an interruption.
+
+    Parameters
+    ----------
+    catalog: Catalog to mirror
+    field_centres: (RA, Dec) in degrees of each field in the footprint
+    search_radius_arcmin: Radius around each field (default: the catalog search radius)
+    mirror_dir: Root directory of local mirrors (default: the catalog mirror_dir)
+    nside: HEALPix nside used to order the sources
+
+    Returns
+    -------
+    Directory of the new mirror
+    """
+    if search_radius_arcmin is None:
+        search_radius_arcmin = catalog.search_radius_arcmin
+
+    if mirror_dir is None:
+        mirror_dir = catalog.mirror_dir
+
+    if mirror_dir is None:
+        err = "No local catalog mirror directory has been specified. " \
+              "Run 'export REF_CATALOG_MIRROR_DIR=/path/to/mirror' to set one."
+        logger.error(err)
+        raise ValueError(err)
+
+    with tempfile.TemporaryDirectory() as temp_cache_dir:
+
+        cache = catalog.get_tile_cache()
+
+        if cache is None:
+            cache = CatalogTileCache(
+                cache_dir=temp_cache_dir,
+                query=catalog.query_catalog,
+                ra_column=catalog.ra_column,
+                dec_column=catalog.dec_column,
+                nside=catalog.cache_nside,
+                offline=catalog.offline
+            )
+
+        tiles = np.unique(np.concatenate(
+            [cache.fill_tiles(ra, dec, search_radius_arcmin) for ra, dec in field_centres]
+            + [np.zeros(0, dtype=np.int64)]
+        ))
+
+        table = cache.read_tiles(tiles)
+
+    output_dir = catalog.get_mirror_path(mirror_dir)
+
+    write_mirror(
+        table,
+        output_dir,
+        tiles=tiles,
+        tile_nside=catalog.cache_nside,
+        ra_column=catalog.ra_column,
+        dec_column=catalog.dec_column,
+        nside=nside,
+        params=catalog.get_cache_params()
+    )
+
+    return output_dir
@@ -0,0 +1,175 @@
+"""
+Module for prefetching reference catalogs in the background, so that network queries overlap with
+image processing.
+
+A CatalogPrefetcher fills the tile cache of a catalog (see winterdrp.catalog.tile_cache) on a thread pool.
+Processors which later need the catalog (e.g. Scamp, PhotCalibrator) call get_catalog as usual: if the
+prefetch has finished, the tiles are read from disk, and if it is still running, get_catalog waits on the
+tile locks until it is done, rather than sending a second query.
+"""
+import logging
+import multiprocessing.util
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, Future
+
+logger = logging.getLogger(__name__)
+
+default_max_prefetch_workers = 4
+
+
+class CatalogPrefetcher:
+    """
+    Thread pool for prefetching catalogs.
+
+    Parameters
+    ----------
+    max_workers: Maximum number of concurrent catalog queries
+    min_query_interval_s: Minimum time between the start of successive network queries, to respect the
+    rate limits of catalog services
+    """
+
+    def __init__(
+            self,
+            max_workers: int = default_max_prefetch_workers,
+            min_query_interval_s: float = 0.
+    ):
+        self.max_workers = max_workers
+        self.min_query_interval_s = min_query_interval_s
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="catalog_prefetch")
+        self.futures = {}
+        self.lock = threading.Lock()
+        self.last_query_time = None
+
+    def wait_for_rate_limit(self):
+        with self.lock:
+            now = time.monotonic()
+            start = now
+            if self.last_query_time is not None:
+                start = max(now, self.last_query_time + self.min_query_interval_s)
+            self.last_query_time = start
+        if start > now:
+            time.sleep(start - now)
+
+    def prefetch_catalog(
+            self,
+            catalog,
+            ra_deg: float,
+            dec_deg: float,
+            search_radius_arcmin: float
+    ):
+        cache = catalog.get_tile_cache()
+
+        if cache.is_cached(ra_deg, dec_deg, search_radius_arcmin):
+            return
+
+        self.wait_for_rate_limit()
+
+        logger.debug(f"Prefetching {catalog.abbreviation} catalog around RA {ra_deg:.4f}, Dec {dec_deg:.4f}")
+
+        try:
+            cache.fill_tiles(ra_deg, dec_deg, search_radius_arcmin)
+        except Exception as exc:
+            # The catalog will be queried again when it is needed, and any error raised then
+            logger.warning(f"Failed to prefetch {catalog.abbreviation} catalog around "
+                           f"RA {ra_deg:.4f}, Dec {dec_deg:.4f}: {exc}")
+
+    def submit(
+            self,
+            catalog,
+            ra_deg: float,
+            dec_deg: float,
+            search_radius_arcmin: float = None
+    ) -> Future | None:
+        """Start prefetching the catalog (a BaseCatalog) around a position, unless it is already being prefetched
+
+        Parameters
+        ----------
+        catalog: Catalog to prefetch
+        ra_deg: RA of the centre of the cone
+        dec_deg: Dec of the centre of the cone
+        search_radius_arcmin: Radius of the cone (default: the catalog search radius)
+
+        Returns
+        -------
+        Future of the prefetch, or None if the catalog cannot be prefetched
+        """
+        if search_radius_arcmin is None:
+            search_radius_arcmin = catalog.search_radius_arcmin
+
+        mirror = catalog.get_mirror()
+        if mirror is not None and mirror.covers(ra_deg, dec_deg, search_radius_arcmin):
+            return None
+
+        if catalog.get_tile_cache() is None:
+            logger.debug(f"No reference catalog cache directory is set, so {catalog.abbreviation} "
+                         f"catalogs cannot be prefetched")
+            return None
+
+        key = (catalog.get_cache_sub_dir(), round(ra_deg, 4), round(dec_deg, 4), round(search_radius_arcmin, 4))
+
+        with self.lock:
+            if key in self.futures:
+                return self.futures[key]
+            future = self.executor.submit(self.prefetch_catalog, catalog, ra_deg, dec_deg, search_radius_arcmin)
+            self.futures[key] = future
+
+        return future
+
+    def wait(self):
+        """Wait for all prefetches submitted so far to finish"""
+        with self.lock:
+            futures = list(self.futures.values())
+        for future in futures:
+            future.result()
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+
+prefetchers = {}
+prefetchers_lock = threading.Lock()
+
+
+def acquire_prefetchers():
+    prefetchers_lock.acquire()
+
+
+def release_prefetchers():
+    prefetchers_lock.release()
+
+
+def reset_prefetchers():
+    """Forget the prefetchers of the parent in a forked child, whose threads do not exist in the child"""
+    global prefetchers, prefetchers_lock
+    prefetchers = {}
+    prefetchers_lock = threading.Lock()
+
+
+os.register_at_fork(before=acquire_prefetchers, after_in_parent=release_prefetchers, after_in_child=reset_prefetchers)
+
+
+def get_prefetcher(
+        max_workers: int = default_max_prefetch_workers,
+        min_query_interval_s: float = 0.
+) -> CatalogPrefetcher:
+    """Get the catalog prefetcher of this process, creating it if needed.
+    Each (worker) process has its own prefetcher, which is shut down when the process exits."""
+    pid = os.getpid()
+    with prefetchers_lock:
+        if pid not in prefetchers:
+            prefetchers[pid] = CatalogPrefetcher(
+                max_workers=max_workers,
+                min_query_interval_s=min_query_interval_s
+            )
+            multiprocessing.util.Finalize(None, shutdown_prefetchers, exitpriority=10)
+        return prefetchers[pid]
+
+
+def shutdown_prefetchers():
+    """Shut down the catalog prefetcher of this process, if there is one"""
+    with prefetchers_lock:
+        prefetcher = prefetchers.pop(os.getpid(), None)
+    if prefetcher is not None:
+        prefetcher.shutdown()
@@ -1,7 +1,7 @@
 import logging
 import astropy.table
 from astroquery.vizier import Vizier
-from winterdrp.catalog.base_catalog import BaseCatalog
+from winterdrp.catalog.base_catalog import BaseCatalog, convert_table_via_csv
 from astropy.coordinates import SkyCoord
 import astropy.units as u
 from astropy.table import Table
@@ -13,6 +13,8 @@ class SDSS(BaseCatalog):
 
     catalog_vizier_code = "V/147"
     abbreviation = "sdss"
+    ra_column = "RA_ICRS"
+    dec_column = "DE_ICRS"
 
     def __init__(
             self,
@@ -20,29 +22,36 @@ class SDSS(BaseCatalog):
             min_mag: float,
             max_mag: float,
             filter_name: str,
-            snr_threshold : float=3.0
+            snr_threshold: float = 3.0,
+            **kwargs
     ):
-        super().__init__(search_radius_arcmin, min_mag, max_mag, filter_name)
+        super().__init__(search_radius_arcmin, min_mag, max_mag, filter_name, **kwargs)
         self.snr_threshold = snr_threshold
 
-    def get_catalog(
+    def get_cache_params(self) -> dict:
+        params = super().get_cache_params()
+        params["snr_threshold"] = self.snr_threshold
+        return params
+
+    def query_catalog(
             self,
             ra_deg: float,
-            dec_deg: float
+            dec_deg: float,
+            search_radius_arcmin: float
     ) -> astropy.table.Table:
 
         logger.info(
             f'Querying SDSS catalog around RA {ra_deg:.4f}, '
-            f'Dec {dec_deg:.4f} with a radius of {self.search_radius_arcmin:.4f} arcmin'
+            f'Dec {dec_deg:.4f} with a radius of {search_radius_arcmin:.4f} arcmin'
         )
 
         v = Vizier(columns=['*'],
-                   column_filters={f"{self.filter_name}mag" : f"< {self.max_mag}",
-                                   f"e_{self.filter_name}mag" : "<%.3f" % (1.086 / self.snr_threshold)},
+                   column_filters={f"{self.filter_name}mag": f"< {self.max_mag}",
+                                   f"e_{self.filter_name}mag": "<%.3f" % (1.086 / self.snr_threshold)},
                    row_limit=-1)
         Q = v.query_region(SkyCoord(ra=ra_deg, dec=dec_deg, unit=(u.deg, u.deg)),
-                           radius=str(self.search_radius_arcmin) + 'm',
-                           catalog="V/147", cache=False)
+                           radius=str(search_radius_arcmin) + 'm',
+                           catalog=self.catalog_vizier_code, cache=False)
 
         if len(Q) == 0:
             logger.info('No matches found in the given radius in SDSS')
@@ -53,6 +62,5 @@ class SDSS(BaseCatalog):
             t['DEC'] = t['DE_ICRS']
             t['magnitude'] = t[f'{self.filter_name}mag']
             logger.info(f'{len(t)} matches found in the given radius in SDSS')
-            t.write('phot_table.csv', overwrite=True)
-            t = Table.read('phot_table.csv')
-        return t
\ No newline at end of file
+            t = convert_table_via_csv(t)
+        return t
@@ -0,0 +1,301 @@
+"""
+Module for a persistent on-disk cache of reference catalog queries, split into HEALPix tiles.
+
+A cone search is served from every tile which overlaps the cone. Only tiles which are not already cached
+are fetched, with a single network query covering all of them, and each tile is stored as its own FITS
+binary table. Tiles are keyed by the catalog and its query parameters (e.g. magnitude limits), so catalogs
+with different cuts never share tiles.
+
+Concurrent requests for the same tile are coalesced: threads wait on an in-process lock and processes on a
+lock file, and whoever gets the lock second finds the tile already cached. Forked processes start with fresh
+in-process locks, and rely on the lock files alone to wait for tiles being fetched by their parent. In offline mode, missing tiles
+raise an error instead of touching the network.
+"""
+import fcntl
+import hashlib
+import logging
+import os
+import threading
+from collections.abc import Callable
+from contextlib import contextmanager, ExitStack
+
+import astropy.table
+import astropy.units as u
+import numpy as np
+from astropy.coordinates import ICRS, SkyCoord
+from astropy.table import Table, vstack
+from astropy_healpix import HEALPix
+
+from winterdrp.paths import ProcessingError
+
+logger = logging.getLogger(__name__)
+
+default_cache_nside = 64
+
+offline_env = "REF_CATALOG_OFFLINE"
+
+tile_locks = {}
+tile_locks_lock = threading.Lock()
+
+
+def reset_tile_locks():
+    """Replace the in-process tile locks in a forked child. Threads of the parent (e.g. catalog prefetches)
+    may hold tile locks at the moment of the fork, and those threads do not exist in the child, so the inherited
+    locks would never be released. The lock files still exclude the parent and child from each other."""
+    global tile_locks, tile_locks_lock
+    tile_locks = {}
+    tile_locks_lock = threading.Lock()
+
+
+def acquire_tile_locks():
+    tile_locks_lock.acquire()
+
+
+def release_tile_locks():
+    tile_locks_lock.release()
+
+
+os.register_at_fork(before=acquire_tile_locks, after_in_parent=release_tile_locks, after_in_child=reset_tile_locks)
+
+
+class CatalogCacheError(ProcessingError):
+    pass
+
+
+def is_offline() -> bool:
+    """Whether reference catalogs should only be served from the cache ('export REF_CATALOG_OFFLINE=1')"""
+    return os.getenv(offline_env, "").lower() in ["1", "true", "yes"]
+
+
+def get_params_hash(
+        params: dict
+) -> str:
+    """Short hash of the query parameters of a catalog, used to name its cache directory"""
+    text = repr(sorted((str(key), repr(value)) for key, value in params.items()))
+    return hashlib.sha1(text.encode()).hexdigest()[:16]
+
+
+def get_tile_lock(
+        path: str
+) -> threading.Lock:
+    with tile_locks_lock:
+        if path not in tile_locks:
+            tile_locks[path] = threading.Lock()
+        return tile_locks[path]
+
+
+@contextmanager
+def lock_tile(
+        path: str
+):
+    """Hold a tile exclusively, against both other threads and other processes"""
+    with get_tile_lock(path):
+        with open(path + ".lock", "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+class CatalogTileCache:
+    """
+    Cache of catalog queries in 'cache_dir', in HEALPix tiles (nested ordering) with 'nside'.
+
+    Parameters
+    ----------
+    cache_dir: Directory for this catalog and set of query parameters
+    query: Function (ra_deg, dec_deg, radius_arcmin) -> Table, to query the catalog over the network
+    ra_column: Name of the RA column (in degrees) of the catalog
+    dec_column: Name of the Dec column (in degrees) of the catalog
+    nside: HEALPix nside of the tiles
+    offline: If True, never query the network, and raise CatalogCacheError for missing tiles
+    """
+
+    def __init__(
+            self,
+            cache_dir: str,
+            query: Callable[[float, float, float], astropy.table.Table],
+            ra_column: str = "ra",
+            dec_column: str = "dec",
+            nside: int = default_cache_nside,
+            offline: bool = False
+    ):
+        self.cache_dir = os.path.join(cache_dir, f"nside{nside}")
+        self.query = query
+        self.ra_column = ra_column
+        self.dec_column = dec_column
+        self.healpix = HEALPix(nside=nside, order="nested", frame=ICRS())
+        self.offline = offline
+
+    def get_tile_path(
+            self,
+            tile: int
+    ) -> str:
+        return os.path.join(self.cache_dir, f"{tile}.fits")
+
+    def get_tile_radii(
+            self,
+            tiles: np.ndarray
+    ) -> u.Quantity:
+        """Maximum distance from the centre of each tile to its boundary"""
+        lon, lat = self.healpix.healpix_to_lonlat(tiles)
+        centres = SkyCoord(lon, lat)
+        b_lon, b_lat = self.healpix.boundaries_lonlat(tiles, step=4)
+        boundaries = SkyCoord(b_lon, b_lat)
+        return np.max(centres[:, None].separation(boundaries), axis=1)
+
+    def get_tile_indices(
+            self,
+            table: astropy.table.Table
+    ) -> np.ndarray:
+        ra = np.asarray(table[self.ra_column], dtype=float) * u.deg
+        dec = np.asarray(table[self.dec_column], dtype=float) * u.deg
+        return self.healpix.lonlat_to_healpix(ra, dec)
+
+    def fetch_tiles(
+            self,
+            tiles: np.ndarray,
+            ra_deg: float,
+            dec_deg: float
+    ):
+        """Query the network once for all 'tiles', with a cone centred on (ra_deg, dec_deg), and save each tile"""
+        if self.offline:
+            err = f"Reference catalog tiles {[int(x) for x in tiles]} are not in the cache ({self.cache_dir}), " \
+                  f"and offline mode is enabled ({offline_env})."
+            logger.error(err)
+            raise CatalogCacheError(err)
+
+        centre = SkyCoord(ra_deg * u.deg, dec_deg * u.deg)
+        lon, lat = self.healpix.healpix_to_lonlat(tiles)
+        tile_seps = centre.separation(SkyCoord(lon, lat))
+        radius = np.max(tile_seps + self.get_tile_radii(tiles)).to(u.arcmin)
+
+        # Make sure the cone covers the whole of every tile, including the bulge of its edges
+        radius_arcmin = float(radius.value) * 1.01
+
+        logger.info(f"Fetching {len(tiles)} reference catalog tiles, with a radius of {radius_arcmin:.2f} arcmin")
+
+        table = self.query(ra_deg, dec_deg, radius_arcmin)
+
+        if len(table.colnames) == 0:
+            table = Table({self.ra_column: np.zeros(0), self.dec_column: np.zeros(0)})
+            row_tiles = np.zeros(0, dtype=int)
+        else:
+            row_tiles = self.get_tile_indices(table)
+
+        for tile in tiles:
+            path = self.get_tile_path(tile)
+            temp_path = path + f".{os.getpid()}.{threading.get_ident()}.tmp"
+            table[row_tiles == tile].write(temp_path, format="fits", overwrite=True)
+            os.replace(temp_path, path)
+
+    def get_cone_tiles(
+            self,
+            ra_deg: float,
+            dec_deg: float,
+            search_radius_arcmin: float
+    ) -> np.ndarray:
+        """Sorted indices of all tiles which overlap a cone"""
+        return np.sort(self.healpix.cone_search_lonlat(
+            ra_deg * u.deg, dec_deg * u.deg, radius=search_radius_arcmin * u.arcmin
+        ))
+
+    def is_cached(
+            self,
+            ra_deg: float,
+            dec_deg: float,
+            search_radius_arcmin: float
+    ) -> bool:
+        """Whether every tile overlapping a cone is already cached"""
+        tiles = self.get_cone_tiles(ra_deg, dec_deg, search_radius_arcmin)
+        return all([os.path.exists(self.get_tile_path(x)) for x in tiles])
+
+    def fill_tiles(
+            self,
+            ra_deg: float,
+            dec_deg: float,
+            search_radius_arcmin: float
+    ) -> np.ndarray:
+        """Make sure that every tile overlapping a cone is cached, fetching any missing tiles
+
+        Parameters
+        ----------
+        ra_deg: RA of the centre of the cone
+        dec_deg: Dec of the centre of the cone
+        search_radius_arcmin: Radius of the cone
+
+        Returns
+        -------
+        Sorted indices of the tiles overlapping the cone
+        """
+        try:
+            os.makedirs(self.cache_dir)
+        except OSError:
+            pass
+
+        tiles = self.get_cone_tiles(ra_deg, dec_deg, search_radius_arcmin)
+
+        missing = [x for x in tiles if not os.path.exists(self.get_tile_path(x))]
+
+        if len(missing) > 0:
+            # Always lock in sorted order, so overlapping requests cannot deadlock
+            with ExitStack() as stack:
+                for tile in missing:
+                    stack.enter_context(lock_tile(self.get_tile_path(tile)))
+
+                # Another thread or process may have fetched some tiles while we waited for the locks
+                missing = [x for x in missing if not os.path.exists(self.get_tile_path(x))]
+
+                if len(missing) > 0:
+                    self.fetch_tiles(np.array(missing), ra_deg, dec_deg)
+        else:
+            logger.debug(f"All {len(tiles)} reference catalog tiles are cached in {self.cache_dir}")
+
+        return tiles
+
+    def read_tiles(
+            self,
+            tiles: np.ndarray
+    ) -> astropy.table.Table:
+        """Combine cached tiles into a single table (with no columns, if all tiles are empty)"""
+        tables = [Table.read(self.get_tile_path(x), format="fits") for x in tiles]
+        tables = [x for x in tables if len(x) > 0]
+
+        if len(tables) == 0:
+            return Table()
+
+        return vstack(tables, metadata_conflicts="silent")
+
+    def get_catalog(
+            self,
+            ra_deg: float,
+            dec_deg: float,
+            search_radius_arcmin: float
+    ) -> astropy.table.Table:
+        """Cone search, served from the cached tiles (fetching any missing tiles first)
+
+        Parameters
+        ----------
+        ra_deg: RA of the centre of the cone
+        dec_deg: Dec of the centre of the cone
+        search_radius_arcmin: Radius of the cone
+
+        Returns
+        -------
+        All cached sources within the cone
+        """
+        tiles = self.fill_tiles(ra_deg, dec_deg, search_radius_arcmin)
+
+        table = self.read_tiles(tiles)
+
+        if len(table) == 0:
+            return table
+
+        coords = SkyCoord(
+            np.asarray(table[self.ra_column], dtype=float) * u.deg,
+            np.asarray(table[self.dec_column], dtype=float) * u.deg
+        )
+        mask = coords.separation(SkyCoord(ra_deg * u.deg, dec_deg * u.deg)) < search_radius_arcmin * u.arcmin
+
+        return table[mask]
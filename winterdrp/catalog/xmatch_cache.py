@@ -0,0 +1,107 @@
+"""
+Module for a persistent cache of cross-match query results (e.g. from Kowalski), so that re-processed
+candidates and repeated fields do not query the network again.
+
+Results are stored in a small SQLite database, keyed by the query (catalog, radius, projection etc.)
+and by the position, rounded to 'precision_deg'.
+"""
+import json
+import logging
+import os
+import sqlite3
+import time
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+default_precision_deg = 1.e-5
+
+xmatch_schema = """
+CREATE TABLE IF NOT EXISTS xmatch (
+    query_key TEXT NOT NULL,
+    ra_key INTEGER NOT NULL,
+    dec_key INTEGER NOT NULL,
+    results TEXT NOT NULL,
+    created REAL,
+    PRIMARY KEY (query_key, ra_key, dec_key)
+);
+"""
+
+
+class XMatchCache:
+    """Cache of cross-match results, stored as a SQLite database at 'db_path'"""
+
+    def __init__(
+            self,
+            db_path: str,
+            precision_deg: float = default_precision_deg
+    ):
+        self.db_path = db_path
+        self.precision_deg = precision_deg
+
+    def connect(self) -> sqlite3.Connection:
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(self.db_path)))
+        except OSError:
+            pass
+
+        conn = sqlite3.connect(self.db_path, timeout=30.)
+        conn.executescript(xmatch_schema)
+        return conn
+
+    def get_position_key(
+            self,
+            position: list[float]
+    ) -> tuple[int, int]:
+        ra, dec = position
+        return int(np.round(float(ra) / self.precision_deg)), int(np.round(float(dec) / self.precision_deg))
+
+    def load(
+            self,
+            query_key: str,
+            coords: dict
+    ) -> dict:
+        """Get the cached results for any of 'coords' (a dictionary of name: [ra, dec])
+
+        Parameters
+        ----------
+        query_key: Key of the query (catalog and query parameters)
+        coords: Positions, by query name
+
+        Returns
+        -------
+        Cached results, by query name
+        """
+        cached = {}
+        conn = self.connect()
+        try:
+            for name, position in coords.items():
+                row = conn.execute(
+                    "SELECT results FROM xmatch WHERE query_key = ? AND ra_key = ? AND dec_key = ?",
+                    (query_key, *self.get_position_key(position))
+                ).fetchone()
+                if row is not None:
+                    cached[name] = json.loads(row[0])
+        finally:
+            conn.close()
+        return cached
+
+    def save(
+            self,
+            query_key: str,
+            coords: dict,
+            results: dict
+    ):
+        """Store the results of a query, for each of 'coords' (a dictionary of name: [ra, dec])"""
+        now = time.time()
+        rows = [
+            (query_key, *self.get_position_key(position), json.dumps(results[name], default=str), now)
+            for name, position in coords.items() if name in results
+        ]
+        with self.connect() as conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO xmatch (query_key, ra_key, dec_key, results, created) VALUES (?, ?, ?, ?, ?)",
+                rows
+            )
+        conn.close()
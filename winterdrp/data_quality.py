@@ -0,0 +1,172 @@
+"""
+Module for the data-quality (DQ) bitmask which travels with each image through a pipeline.
+
+Images carrying a DQ plane are DQImage arrays: ordinary numpy arrays with an extra 'dq' attribute,
+holding a uint16 flag for every pixel. Elementwise arithmetic combines the DQ planes of its inputs, and
+slicing slices the DQ plane along with the data, so processors can treat a DQImage as a normal array.
+The DQ plane is only written to disk (as a compact uint8 weight map) when an external tool needs one.
+"""
+import logging
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+dq_dtype = np.uint16
+
+# DQ flags
+dq_masked = 1  # Pixel in a bad pixel mask
+dq_saturated = 2  # Pixel above the saturation level
+dq_edge = 4  # Pixel with no coverage (e.g. zero weight after resampling)
+dq_flat_nan = 8  # Pixel set to NaN, because the flat was below threshold
+
+
+def unwrap_dq(value):
+    """Replace any DQImage (including in lists or tuples) with a plain numpy view"""
+    if isinstance(value, DQImage):
+        return value.view(np.ndarray)
+    if isinstance(value, (list, tuple)):
+        return type(value)([unwrap_dq(x) for x in value])
+    return value
+
+
+class DQImage(np.ndarray):
+    """
+    Image data with a data-quality bitmask ('dq', or None if no pixels have been flagged yet).
+
+    Elementwise ufuncs return a DQImage whose DQ plane is the bitwise OR of the input DQ planes,
+    and indexing returns the matching slice of the DQ plane. Other numpy functions (e.g. medians
+    and reductions) act on the plain data and return plain arrays.
+    """
+
+    def __new__(
+            cls,
+            data,
+            dq: np.ndarray = None
+    ):
+        obj = np.asarray(data).view(cls)
+        obj.dq = dq
+        return obj
+
+    def __array_finalize__(self, obj):
+        dq = getattr(obj, "dq", None)
+        if dq is not None and dq.shape != self.shape:
+            dq = None
+        self.dq = dq
+
+    def __getitem__(self, item):
+        result = super().__getitem__(item)
+        if isinstance(result, DQImage):
+            result.dq = None if self.dq is None else self.dq[item]
+        return result
+
+    def copy(self, order="C"):
+        result = super().copy(order=order)
+        result.dq = None if self.dq is None else self.dq.copy()
+        return result
+
+    def __array_ufunc__(self, ufunc, method, *inputs, **kwargs):
+
+        dqs = [x.dq for x in inputs if isinstance(x, DQImage) and x.dq is not None]
+
+        inputs = unwrap_dq(inputs)
+
+        outputs = kwargs.get("out", None)
+        if outputs is not None:
+            kwargs["out"] = unwrap_dq(outputs)
+
+        result = getattr(ufunc, method)(*inputs, **kwargs)
+
+        if method != "__call__" or ufunc.nout > 1:
+            return result
+
+        shape = np.shape(result)
+        dqs = [x for x in dqs if x.shape == shape]
+
+        # In-place operation (e.g. data /= flat)
+        if outputs is not None:
+            out = outputs[0]
+            if isinstance(out, DQImage):
+                for dq in dqs:
+                    if dq is not out.dq:
+                        out.dq = merge_dq(out.dq, dq)
+            return out
+
+        if not isinstance(result, np.ndarray) or len(shape) == 0:
+            return result
+
+        dq = None
+        for x in dqs:
+            dq = merge_dq(dq, x)
+
+        return DQImage(result, dq=dq)
+
+    def __array_function__(self, func, types, args, kwargs):
+        return func(*unwrap_dq(args), **unwrap_dq(kwargs))
+
+    def __reduce__(self):
+        reconstruct, args, state = super().__reduce__()
+        return reconstruct, args, (state, self.dq)
+
+    def __setstate__(self, state):
+        nd_state, dq = state
+        super().__setstate__(nd_state)
+        self.dq = dq
+
+
+def merge_dq(
+        dq: np.ndarray | None,
+        other: np.ndarray | None
+) -> np.ndarray | None:
+    """Bitwise OR of two DQ planes, either of which may be None"""
+    if other is None:
+        return dq
+    if dq is None:
+        return other.copy()
+    return np.bitwise_or(dq, other)
+
+
+def get_dq(
+        data: np.ndarray
+) -> np.ndarray | None:
+    """Get the DQ plane of an image, or None if it has none"""
+    return getattr(data, "dq", None) if isinstance(data, DQImage) else None
+
+
+def set_dq_flags(
+        data: np.ndarray,
+        mask: np.ndarray,
+        flag: int
+) -> DQImage:
+    """Set a DQ flag for the pixels in 'mask', in place. Plain arrays are wrapped (without copying) as DQImage.
+
+    Parameters
+    ----------
+    data: Image
+    mask: Boolean array of pixels to flag
+    flag: DQ flag (e.g. dq_masked)
+
+    Returns
+    -------
+    The image, as a DQImage
+    """
+    if not isinstance(data, DQImage):
+        data = DQImage(data)
+
+    if data.dq is None:
+        data.dq = np.zeros(data.shape, dtype=dq_dtype)
+
+    data.dq[mask] |= flag
+    return data
+
+
+def get_weight_map(
+        data: np.ndarray
+) -> np.ndarray:
+    """Get a uint8 weight map for external tools: 1 for good pixels, and 0 for NaN or flagged pixels"""
+    dq = get_dq(data)
+    good = ~np.isnan(np.asarray(data))
+    if dq is not None:
+        good &= (dq == 0)
+    return good.astype(np.uint8)
+
@@ -10,12 +10,20 @@ class ErrorReport:
             self,
             error,
             processor_name,
-            images,
-            headers
+            contents
     ):
         self.error = error
         self.processor_name = processor_name
-        self.filenames = [h[base_name_key] for h in headers]
+        self.filenames = self.get_filenames(contents)
+
+    @staticmethod
+    def get_filenames(contents) -> list[str]:
+        try:
+            [_, headers] = contents
+            return [h[base_name_key] for h in headers]
+        except (TypeError, ValueError, KeyError, IndexError):
+            return []
 
     def generate_log_message(self):
-        return "You messed up somewhere :)"
\ No newline at end of file
+        return f"Error in {self.processor_name} when processing {self.filenames}: " \
+               f"{self.error.__class__.__name__}: {self.error}"
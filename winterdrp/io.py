@@ -1,30 +1,507 @@
+import os
+import shutil
+import hashlib
+import logging
+from collections.abc import Callable
 from astropy.io import fits
 import numpy as np
+import pandas as pd
 import astropy.io.fits
+from numpy.lib.mixins import NDArrayOperatorsMixin
+from winterdrp.monitor import record_bytes_read
+from winterdrp.data_quality import DQImage, get_dq
+from winterdrp.paths import latest_save_key, latest_mask_save_key, proc_history_key, checkpoint_key, \
+    pixel_save_key, pixel_hash_key, header_hash_key, mask_hash_key
+
+logger = logging.getLogger(__name__)
+
+# Header keys which record bookkeeping rather than image metadata, and are ignored by get_header_hash
+bookkeeping_keys = [
+    latest_save_key, latest_mask_save_key, proc_history_key, checkpoint_key, pixel_save_key, pixel_hash_key,
+    header_hash_key, mask_hash_key, "REDUCER", "REDMACH", "REDTIME", "REDSOFT"
+]
+
+# Header keys which describe the layout of the data array in a file
+structural_keys = ["SIMPLE", "XTENSION", "BITPIX", "NAXIS", "EXTEND", "BZERO", "BSCALE", "PCOUNT", "GCOUNT"]
+
+
+# Tile compression algorithms (see astropy.io.fits.CompImageHDU). RICE_1 is lossy for floating point
+# images (controlled by the quantization level), while GZIP and PLIO_1 (integers only) are lossless.
+compression_types = ["RICE_1", "GZIP_1", "GZIP_2", "PLIO_1", "HCOMPRESS_1"]
+
+default_quantize_level = 16.
 
 
 def create_fits(data, header):
-    proc_hdu = fits.PrimaryHDU(data)
+    proc_hdu = fits.PrimaryHDU(np.asarray(data))
     if header is not None:
         proc_hdu.header = header  # Copy over the header from the raw file
     return proc_hdu
 
 
+def create_compressed_fits(
+        data: np.ndarray,
+        header: astropy.io.fits.Header,
+        compression: str,
+        quantize_level: float = default_quantize_level
+) -> fits.HDUList:
+    """Create a tile-compressed image, stored (following the fpack convention) in the first extension,
+    after an empty primary HDU"""
+    if compression not in compression_types:
+        err = f"Unrecognised compression type '{compression}'. Available types are: {compression_types}"
+        logger.error(err)
+        raise ValueError(err)
+
+    comp_hdu = fits.CompImageHDU(
+        np.asarray(data),
+        header=header,
+        compression_type=compression,
+        quantize_level=quantize_level
+    )
+    return fits.HDUList([fits.PrimaryHDU(), comp_hdu])
+
+
 def save_to_path(
         data: np.ndarray,
         header: astropy.io.fits.Header,
         path: str,
-        overwrite: bool = True
+        overwrite: bool = True,
+        compression: str = None,
+        quantize_level: float = default_quantize_level
 ):
-    img = create_fits(data, header=header)
+    """Save an image to a FITS file, optionally with tile compression
+
+    Parameters
+    ----------
+    data: Image data
+    header: Image header
+    path: Path to save to
+    overwrite: Whether to overwrite an existing file
+    compression: None (for an uncompressed primary HDU), or one of compression_types
+    quantize_level: Quantization level for lossy compression of floating point images (RICE_1 or HCOMPRESS_1)
+
+    Returns
+    -------
+    """
+    if compression is None:
+        img = create_fits(data, header=header)
+    else:
+        img = create_compressed_fits(data, header, compression=compression, quantize_level=quantize_level)
     img.writeto(path, overwrite=overwrite)
 
 
+def get_image_hdu(
+        img: fits.HDUList
+):
+    """Get the first HDU containing image data: the primary HDU, or (for tile-compressed files) the
+    compressed image extension"""
+    for hdu in img:
+        if np.logical_and(hdu.is_image, hdu.header.get("NAXIS", 0) > 0):
+            return hdu
+    return img[0]
+
+
+def get_primary_header(
+        hdu
+) -> astropy.io.fits.Header:
+    """Get the header of an image HDU, in the form of a primary header (so that a compressed extension
+    can be saved again as a primary HDU)"""
+    header = hdu.header
+    if isinstance(hdu, fits.PrimaryHDU):
+        return header
+    header = header.copy()
+    for key in ["XTENSION", "PCOUNT", "GCOUNT"]:
+        header.remove(key, ignore_missing=True)
+    if "SIMPLE" not in header:
+        header.insert(0, ("SIMPLE", True, "conforms to FITS standard"))
+    return header
+
+
+def is_compressed(
+        path: str
+) -> bool:
+    with fits.open(path) as img:
+        return isinstance(get_image_hdu(img), fits.CompImageHDU)
+
+
 def open_fits(
         path: str
 ) -> (np.array, astropy.io.fits.Header):
     with fits.open(path) as img:
-        data = img[0].data
-        header = img[0].header
+        hdu = get_image_hdu(img)
+        data = hdu.data
+        header = get_primary_header(hdu)
 
     return data, header
+
+
+def open_header(
+        path: str
+) -> astropy.io.fits.Header:
+    with fits.open(path) as img:
+        header = get_primary_header(get_image_hdu(img))
+    return header
+
+
+def open_fits_data(
+        path: str
+) -> np.ndarray:
+    """Open the image data of a FITS file, memory-mapped where possible (compressed images are decompressed)"""
+    with fits.open(path, memmap=True) as img:
+        data = get_image_hdu(img).data
+    return data
+
+
+def get_header_shape(
+        header: astropy.io.fits.Header
+) -> tuple | None:
+    """Get the numpy shape of the primary data array described by a header, or None if unknown"""
+    try:
+        return tuple(int(header[f"NAXIS{i}"]) for i in range(int(header["NAXIS"]), 0, -1))
+    except KeyError:
+        return None
+
+
+def get_pixel_hash(
+        data: np.ndarray
+) -> str:
+    """Hash the pixels of an image (including its data-quality plane, if any), along with their shape and dtype"""
+    pixels = np.asarray(data)
+    # Pixels read back from a FITS file are big-endian, but are still the same pixels
+    pixels = np.ascontiguousarray(pixels.astype(pixels.dtype.newbyteorder("="), copy=False))
+    key = hashlib.sha1(pixels.view(np.uint8))
+    key.update(f"{pixels.dtype.str}{pixels.shape}".encode())
+    dq = get_dq(data)
+    if dq is not None:
+        key.update(np.ascontiguousarray(dq).view(np.uint8))
+    return key.hexdigest()
+
+
+def get_header_hash(
+        header: astropy.io.fits.Header
+) -> str:
+    """Hash the contents of a header, ignoring bookkeeping keys (such as save paths and processing history),
+    and the keys describing the data layout (which are set from the data when an image is saved)"""
+    cards = [
+        str(card) for card in header.cards
+        if not np.logical_or(card.keyword in bookkeeping_keys + structural_keys, card.keyword.startswith("NAXIS"))
+    ]
+    return hashlib.sha1("".join(cards).encode()).hexdigest()
+
+
+def link_file(
+        local_path: str,
+        output_path: str
+):
+    """Hardlink a file to 'output_path', or copy it if a link is not possible (e.g. across filesystems)"""
+    if os.path.exists(output_path):
+        if os.path.samefile(local_path, output_path):
+            return
+        os.remove(output_path)
+    try:
+        os.link(local_path, output_path)
+    except OSError:
+        shutil.copyfile(local_path, output_path)
+
+
+def copy_file_range(
+        source,
+        output,
+        offset: int,
+        n_bytes: int
+):
+    """Copy n_bytes from 'offset' in the open file 'source' to the open file 'output', within the kernel
+    where possible"""
+    output.flush()
+    if hasattr(os, "copy_file_range"):
+        try:
+            while n_bytes > 0:
+                n_copied = os.copy_file_range(source.fileno(), output.fileno(), n_bytes, offset)
+                if n_copied == 0:
+                    break
+                offset += n_copied
+                n_bytes -= n_copied
+            output.seek(0, os.SEEK_END)
+            return
+        except OSError:
+            pass
+    source.seek(offset)
+    while n_bytes > 0:
+        chunk = source.read(min(n_bytes, 2 ** 24))
+        if len(chunk) == 0:
+            break
+        output.write(chunk)
+        n_bytes -= len(chunk)
+
+
+def save_header_only(
+        header: astropy.io.fits.Header,
+        source_path: str,
+        path: str
+) -> int:
+    """
+    Save an image whose pixels are unchanged since they were saved to 'source_path', with a new header,
+    without re-serializing the pixels. If the file is being overwritten and the new header fits in the
+    existing header blocks, only the header is written. If the header is also unchanged, the file is
+    hardlinked. Otherwise, the pixel bytes are copied directly from the existing file.
+
+    Parameters
+    ----------
+    header: New header
+    source_path: File to which the pixels were saved (an uncompressed FITS file)
+    path: Path to save to
+
+    Returns
+    -------
+    Number of bytes written
+    """
+    with fits.open(source_path) as img:
+        source_header = img[0].header
+        info = img.fileinfo(0)
+
+    # The layout of the data is taken from the existing file
+    new_header = fits.Header([card for card in source_header.cards if card.keyword.startswith("NAXIS")
+                              or card.keyword in structural_keys])
+    for card in header.cards:
+        if not np.logical_or(card.keyword.startswith("NAXIS"), card.keyword in structural_keys):
+            new_header.append(card)
+
+    header_bytes = new_header.tostring().encode("ascii")
+
+    data_offset, data_size = info["datLoc"], info["datSpan"]
+
+    same_file = np.logical_and(os.path.exists(path), os.path.abspath(path) == os.path.abspath(source_path))
+
+    if same_file:
+        if np.logical_and(len(header_bytes) == data_offset, os.stat(path).st_nlink == 1):
+            with open(path, "r+b") as f:
+                f.seek(0)
+                f.write(header_bytes)
+            return len(header_bytes)
+    else:
+        with open(source_path, "rb") as f:
+            source_header_bytes = f.read(data_offset)
+        if source_header_bytes == header_bytes:
+            link_file(source_path, path)
+            return 0
+
+    temp_path = path + ".tmp"
+    with open(source_path, "rb") as source, open(temp_path, "wb") as output:
+        output.write(header_bytes)
+        copy_file_range(source, output, data_offset, data_size)
+    os.replace(temp_path, path)
+
+    return len(header_bytes) + data_size
+
+
+class LazyImage(NDArrayOperatorsMixin):
+    """
+    Pixel data of an image on disk, which is only read (memory-mapped where possible) when a processor
+    first touches it. A LazyImage can be used in place of a numpy array: arithmetic, ufuncs, indexing
+    and numpy functions all act on the underlying data. Once a step has finished with an image,
+    the cached pixels can be dropped with release(), and will be read again if they are needed later.
+    Pixels which have been modified in place are kept, as they can no longer be reloaded from disk.
+
+    To keep track of modifications, the pixels are only exposed (via data, np.asarray, indexing or numpy
+    array attributes) as read-only views. Pixels are modified through the LazyImage itself, e.g.
+    image[mask] = np.nan or image *= 2., or through the array returned by image.astype(dtype, copy=False).
+    """
+
+    def __init__(
+            self,
+            path: str,
+            loader: Callable[[str], np.ndarray] = open_fits_data,
+            shape: tuple = None
+    ):
+        self.path = path
+        self.loader = loader
+        self._shape = shape
+        self._data = None
+        self._modified = False
+
+    def _get_data(self) -> np.ndarray:
+        if self._data is None:
+            self._data = np.asarray(self.loader(self.path))
+            record_bytes_read(self.path)
+        return self._data
+
+    @property
+    def data(self) -> np.ndarray:
+        """Read-only view of the pixels"""
+        view = self._get_data().view()
+        view.flags.writeable = False
+        return view
+
+    def is_loaded(self) -> bool:
+        return self._data is not None
+
+    def release(self):
+        """Drop the cached pixel data, unless it has been modified in place"""
+        if not self._modified:
+            self._data = None
+
+    @property
+    def shape(self) -> tuple:
+        if self._data is None and self._shape is not None:
+            return self._shape
+        return self.data.shape
+
+    @property
+    def ndim(self) -> int:
+        return len(self.shape)
+
+    def __len__(self):
+        return self.shape[0]
+
+    def __array__(self, dtype=None, copy=None):
+        data = self.data
+        if dtype is not None:
+            data = data.astype(dtype, copy=False)
+        if copy:
+            data = data.copy()
+        return data
+
+    def astype(
+            self,
+            dtype,
+            copy: bool = True
+    ) -> np.ndarray:
+        """Like np.ndarray.astype. If the pixels themselves are returned (copy=False, with a matching dtype),
+        they are writable, so the image is treated as modified."""
+        data = self._get_data()
+        result = data.astype(dtype, copy=copy)
+        if result is data:
+            self._modified = True
+        return result
+
+    def __array_ufunc__(self, ufunc, method, *inputs, **kwargs):
+        inputs = [x.data if isinstance(x, LazyImage) else x for x in inputs]
+
+        lazy_outputs = []
+        if "out" in kwargs:
+            out = []
+            for x in kwargs["out"]:
+                if isinstance(x, LazyImage):
+                    x._modified = True
+                    lazy_outputs.append(x)
+                    x = x._get_data()
+                out.append(x)
+            kwargs["out"] = tuple(out)
+
+        result = getattr(ufunc, method)(*inputs, **kwargs)
+
+        # In-place operations (e.g. image /= flat) should leave the LazyImage in place
+        if len(lazy_outputs) == 1 and result is lazy_outputs[0]._data:
+            return lazy_outputs[0]
+
+        return result
+
+    def __getitem__(self, item):
+        return self.data[item]
+
+    def __setitem__(self, key, value):
+        self._get_data()[key] = value
+        self._modified = True
+
+    def __getattr__(self, item):
+        # Only called for attributes not found normally, i.e numpy array attributes such as dtype
+        if item.startswith("_"):
+            raise AttributeError(item)
+        return getattr(self.data, item)
+
+    def __getstate__(self):
+        # Unmodified pixels are re-read from disk rather than being pickled
+        state = self.__dict__.copy()
+        if not self._modified:
+            state["_data"] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+
+    def __repr__(self):
+        return f"LazyImage({self.path}, shape={self._shape}, loaded={self.is_loaded()})"
+
+
+def release_images(
+        batches: list
+):
+    """Drop the cached pixels of every unmodified LazyImage in a list of batches"""
+    for batch in batches:
+        if isinstance(batch, pd.DataFrame):
+            continue
+        for image in batch[0]:
+            if isinstance(image, LazyImage):
+                image.release()
+
+
+def save_checkpoint(
+        batch,
+        path: str
+):
+    """Save the output of a processor for a single batch, so that it can be reloaded instead of
+    being recomputed. Image batches are stored as a compressed numpy .npz archive (with headers as strings),
+    while dataframes are pickled. The file is written to a temporary path and then moved, so
+    an interrupted write never leaves a partial checkpoint.
+
+    Parameters
+    ----------
+    batch: Either [images, headers] or a pandas DataFrame
+    path: Path to save to, without extension
+
+    Returns
+    -------
+    The path of the checkpoint file
+    """
+    if isinstance(batch, pd.DataFrame):
+        output_path = path + ".pkl"
+        temp_path = output_path + ".tmp"
+        batch.to_pickle(temp_path, compression=None)
+    else:
+        [images, headers] = batch
+        output_path = path + ".npz"
+        temp_path = path + ".tmp.npz"
+        arrays = {f"image_{i}": np.asarray(x) for i, x in enumerate(images)}
+        arrays.update({f"dq_{i}": get_dq(x) for i, x in enumerate(images) if get_dq(x) is not None})
+        header_strings = np.array([x.tostring() for x in headers], dtype=str)
+        np.savez_compressed(temp_path, headers=header_strings, **arrays)
+
+    os.replace(temp_path, output_path)
+    return output_path
+
+
+def find_checkpoint(
+        path: str
+) -> str | None:
+    """Return the path of an existing checkpoint with base path 'path', or None"""
+    for ext in [".npz", ".pkl"]:
+        if os.path.exists(path + ext):
+            return path + ext
+    return None
+
+
+def load_checkpoint(
+        checkpoint_path: str
+):
+    """Load a batch saved by save_checkpoint
+
+    Parameters
+    ----------
+    checkpoint_path: Path of the checkpoint file
+
+    Returns
+    -------
+    Either [images, headers] or a pandas DataFrame
+    """
+    if checkpoint_path.endswith(".pkl"):
+        return pd.read_pickle(checkpoint_path, compression=None)
+
+    with np.load(checkpoint_path) as archive:
+        headers = [fits.Header.fromstring(str(x)) for x in archive["headers"]]
+        images = [archive[f"image_{i}"] for i in range(len(headers))]
+        images = [
+            DQImage(x, dq=archive[f"dq_{i}"]) if f"dq_{i}" in archive.files else x
+            for i, x in enumerate(images)
+        ]
+
+    return [images, headers]
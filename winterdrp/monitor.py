@@ -0,0 +1,220 @@
+"""
+Module for measuring the resources used by each processor, and summarising them in a run report.
+"""
+import json
+import logging
+import os
+import resource
+import sys
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+io_lock = threading.Lock()
+
+io_counts = {
+    "bytes_read": 0,
+    "bytes_written": 0
+}
+
+
+def record_bytes_read(
+        path: str
+):
+    """Add the size of the file at 'path' to the running total of bytes read"""
+    n_bytes = os.path.getsize(path)
+    with io_lock:
+        io_counts["bytes_read"] += n_bytes
+
+
+def record_bytes_written(
+        path: str,
+        n_bytes: int = None
+):
+    """Add the size of the file at 'path' (or n_bytes, if only part of it was written) to the
+    running total of bytes written"""
+    if n_bytes is None:
+        n_bytes = os.path.getsize(path)
+    with io_lock:
+        io_counts["bytes_written"] += n_bytes
+
+
+def get_current_rss_mb() -> float:
+    """Current resident set size of this process, in MB (or NaN, where /proc is not available)"""
+    try:
+        with open("/proc/self/statm", "r") as f:
+            resident_pages = int(f.read().split()[1])
+    except (OSError, IndexError, ValueError):
+        return np.nan
+    return resident_pages * os.sysconf("SC_PAGE_SIZE") / 1024. ** 2
+
+
+def get_max_rss_mb() -> float:
+    """Peak resident set size of this process over its lifetime so far, in MB"""
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is given in bytes on macOS, and in kilobytes elsewhere
+    if sys.platform == "darwin":
+        max_rss /= 1024.
+    return max_rss / 1024.
+
+
+def get_resource_snapshot() -> dict:
+    """Get the current wall time, CPU time (including any waited-for child processes,
+    such as the external tools launched via execute), current and peak RSS, and I/O totals.
+
+    Returns
+    -------
+    Dictionary of resource counters
+    """
+    self_usage = resource.getrusage(resource.RUSAGE_SELF)
+    child_usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+
+    with io_lock:
+        bytes_read = io_counts["bytes_read"]
+        bytes_written = io_counts["bytes_written"]
+
+    return {
+        "wall_time": time.perf_counter(),
+        "cpu_time": self_usage.ru_utime + self_usage.ru_stime,
+        "child_cpu_time": child_usage.ru_utime + child_usage.ru_stime,
+        "rss_mb": get_current_rss_mb(),
+        "max_rss_mb": get_max_rss_mb(),
+        "bytes_read": bytes_read,
+        "bytes_written": bytes_written,
+    }
+
+
+def get_usage_since(
+        start: dict
+) -> dict:
+    """Get the resources used since the snapshot 'start' was taken
+
+    Parameters
+    ----------
+    start: Snapshot returned by get_resource_snapshot
+
+    Returns
+    -------
+    Dictionary with the difference of each resource counter. Memory is reported as the change in
+    current RSS (memory retained by the batch, not transient allocations), and the peak RSS of the process so far
+    """
+    end = get_resource_snapshot()
+    return {
+        "wall_time_s": end["wall_time"] - start["wall_time"],
+        "cpu_time_s": end["cpu_time"] - start["cpu_time"],
+        "child_cpu_time_s": end["child_cpu_time"] - start["child_cpu_time"],
+        "rss_delta_mb": end["rss_mb"] - start["rss_mb"],
+        "process_peak_rss_mb": end["max_rss_mb"],
+        "bytes_read": end["bytes_read"] - start["bytes_read"],
+        "bytes_written": end["bytes_written"] - start["bytes_written"],
+    }
+
+
+def get_batch_size(
+        batch
+) -> int:
+    """Number of images (or candidates) in a batch"""
+    if batch is None:
+        return 0
+    if isinstance(batch, pd.DataFrame):
+        return len(batch)
+    try:
+        return len(batch[0])
+    except (TypeError, IndexError):
+        return 0
+
+
+summary_columns = [
+    "wall_time_s", "cpu_time_s", "child_cpu_time_s", "bytes_read", "bytes_written", "n_in", "n_out"
+]
+
+
+class RunReport:
+    """Collects the per-batch resource usage records of each processor in a pipeline run"""
+
+    def __init__(self):
+        self.records = []
+
+    def add_batch_records(
+            self,
+            step: int,
+            processor_name: str,
+            records: list[dict]
+    ):
+        for record in records:
+            self.records.append({"step": step, "processor": processor_name, **record})
+
+    def get_batch_table(self) -> pd.DataFrame:
+        return pd.DataFrame(self.records)
+
+    def get_summary_table(self) -> pd.DataFrame:
+        """Aggregate the batch records by processor step
+
+        Returns
+        -------
+        A DataFrame with one row per processor step
+        """
+        table = self.get_batch_table()
+
+        if len(table) == 0:
+            return table
+
+        grouped = table.groupby(["step", "processor"], sort=True)
+        summary = grouped[summary_columns].sum()
+        summary["n_batches"] = grouped.size()
+        summary["n_failed"] = grouped["failed"].sum()
+        summary["max_rss_delta_mb"] = grouped["rss_delta_mb"].max()
+        summary["process_peak_rss_mb"] = grouped["process_peak_rss_mb"].max()
+        summary["frac_wall_time"] = summary["wall_time_s"] / np.sum(summary["wall_time_s"])
+        return summary.reset_index()
+
+    def write(
+            self,
+            output_path: str
+    ) -> tuple[str, str]:
+        """Write the run report as a JSON file (summary and per-batch records) and a
+        CSV file (per-batch records)
+
+        Parameters
+        ----------
+        output_path: Path of the report, with or without extension
+
+        Returns
+        -------
+        Paths of the JSON and CSV files
+        """
+        base_path = os.path.splitext(output_path)[0]
+        json_path = base_path + ".json"
+        csv_path = base_path + ".csv"
+
+        output_dir = os.path.dirname(base_path)
+        if output_dir != "":
+            try:
+                os.makedirs(output_dir)
+            except OSError:
+                pass
+
+        report = {
+            "summary": json.loads(self.get_summary_table().to_json(orient="records")),
+            "batches": json.loads(self.get_batch_table().to_json(orient="records")),
+        }
+
+        logger.info(f"Saving run report to {json_path} and {csv_path}")
+
+        with open(json_path, "w") as f:
+            json.dump(report, f, indent=2)
+
+        self.get_batch_table().to_csv(csv_path, index=False)
+
+        return json_path, csv_path
+
+    def log_summary(self):
+        summary = self.get_summary_table()
+        if len(summary) == 0:
+            logger.info("No processor usage was recorded")
+            return
+        logger.info(f"Processor usage summary: \n {summary.to_string(index=False, float_format='%.3g')}")
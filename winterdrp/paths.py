@@ -65,6 +65,19 @@ def cal_output_dir(
 
 cal_output_sub_dir = "calibration"
 
+checkpoint_sub_dir = "checkpoints"
+
+cal_library_sub_dir = "calibration_library"
+
+ref_catalog_cache_sub_dir = "ref_catalog_cache"
+
+ref_catalog_cache_dir = os.getenv("REF_CATALOG_CACHE_DIR")
+
+if ref_catalog_cache_dir is None and base_output_dir is not None:
+    ref_catalog_cache_dir = os.path.join(base_output_dir, ref_catalog_cache_sub_dir)
+
+ref_catalog_mirror_dir = os.getenv("REF_CATALOG_MIRROR_DIR")
+
 
 def reduced_img_dir(
         sub_dir: str | int = "",
@@ -167,6 +180,13 @@ flat_frame_key = 'FLATNAME'
 bias_frame_key = 'BIASNAME'
 dark_frame_key = 'DARKNAME'
 coadd_key = "COADDS"
+checkpoint_key = "CHKPTKEY"
+
+# Dirty tracking: the path where the current pixels were last saved, and hashes of the pixels and header
+pixel_save_key = "PIXPATH"
+pixel_hash_key = "PIXHASH"
+header_hash_key = "HDRHASH"
+mask_hash_key = "MASKHASH"
 
 core_fields = ["OBSCLASS", "TARGET", "UTCTIME", coadd_key, proc_history_key]
 
@@ -4,7 +4,11 @@ import os
 import astropy.io.fits
 import numpy as np
 import copy
-from winterdrp.paths import saturate_key
+from winterdrp.paths import saturate_key, get_output_dir, checkpoint_sub_dir
+from winterdrp.monitor import RunReport
+from winterdrp.io import release_images
+from winterdrp.processors.utils.image_loader import ImageLoader
+from winterdrp.processors.utils.image_selector import ImageSelector
 
 logger = logging.getLogger(__name__)
 
@@ -15,6 +19,9 @@ class Pipeline:
     pipelines = {}
     name = None
 
+    # Precision of image data held in memory. Use float64 when validating results against reference values.
+    default_working_dtype = "float32"
+
     @property
     def pipeline_configurations(self):
         raise NotImplementedError()
@@ -31,9 +38,21 @@ class Pipeline:
             self,
             pipeline_configuration: str | list = None,
             night: int | str = "",
+            max_n_cpu: int = 1,
+            streaming: bool = False,
+            use_checkpoints: bool = False,
+            working_dtype: str = None,
     ):
 
         self.night_sub_dir = os.path.join(self.name, night)
+        self.max_n_cpu = max_n_cpu
+        self.streaming = streaming
+        self.use_checkpoints = use_checkpoints
+
+        if working_dtype is None:
+            working_dtype = self.default_working_dtype
+        self.working_dtype = np.dtype(working_dtype)
+        self.run_report = RunReport()
 
         self.processors = self.load_pipeline_configuration(pipeline_configuration)
 
@@ -61,8 +80,43 @@ class Pipeline:
             self,
             sub_dir: str = ""
     ):
+        checkpoint_dir = None
+        if self.use_checkpoints:
+            checkpoint_dir = get_output_dir(checkpoint_sub_dir, sub_dir=sub_dir)
+            logger.info(f"Using checkpoint cache in {checkpoint_dir}")
+
         for processor in self.processors:
             processor.set_night(night_sub_dir=sub_dir)
+            processor.set_max_n_cpu(max_n_cpu=self.max_n_cpu)
+            processor.set_working_dtype(working_dtype=self.working_dtype)
+            processor.set_checkpoint_dir(checkpoint_dir=checkpoint_dir)
+
+        self.push_down_selectors()
+
+    def push_down_selectors(self):
+        """Give each ImageLoader the ImageSelector steps which follow it, so that unwanted images are
+        rejected from their headers alone, before any pixels are read. Only selectors reached through
+        header-only steps (see BaseProcessor.header_only) are used, because any other step could
+        depend on the rejected images or modify the selected header values. The selectors remain in the
+        processor chain, where they then have nothing left to remove.
+        """
+        for i, processor in enumerate(self.processors):
+
+            if not isinstance(processor, ImageLoader):
+                continue
+
+            selectors = []
+
+            for step in self.processors[i+1:]:
+                if not step.header_only:
+                    break
+                if isinstance(step, ImageSelector):
+                    selectors.append(step)
+
+            if len(selectors) > 0:
+                logger.debug(f"Applying {len(selectors)} image selectors while loading headers")
+
+            processor.set_header_selectors(selectors)
 
     @staticmethod
     def download_raw_images_for_night(
@@ -84,16 +138,118 @@ class Pipeline:
             batches: list[list[list[np.ndarray], list[astropy.io.fits.header]]],
     ):
 
+        if self.streaming:
+            return self.reduce_images_streaming(batches)
+
         for i, processor in enumerate(self.processors):
             logger.debug(f"Applying '{processor.__class__}' processor to {len(batches)} batches. "
                          f"(Step {i+1}/{len(self.processors)})")
 
-            batches, failures = processor.base_apply(
-                batches
-            )
+            batches, failures = self.apply_processor(processor, batches)
 
         return batches
 
+    def apply_processor(
+            self,
+            processor,
+            batches: list,
+    ) -> tuple[list, list]:
+        """Apply a single processor to batches, and record the resources it used in the run report"""
+
+        batches, failures = processor.base_apply(batches)
+
+        # Pixels which were only read by this step can be dropped, and re-read from disk if needed again
+        release_images(batches)
+
+        self.run_report.add_batch_records(
+            step=self.processors.index(processor) + 1,
+            processor_name=processor.__class__.__name__,
+            records=processor.batch_usage
+        )
+
+        return batches, failures
+
+    def reduce_images_streaming(
+            self,
+            batches: list[list[list[np.ndarray], list[astropy.io.fits.header]]],
+    ):
+        """Reduce images depth-first, so that each batch passes through the full chain of processors
+        before the next batch is started. Processors which require all batches at once
+        (see BaseProcessor.requires_all_batches) act as barriers: every batch is streamed up to the
+        barrier, the barrier is applied to all batches together, and streaming then resumes.
+
+        Parameters
+        ----------
+        batches: Initial batches to reduce
+
+        Returns
+        -------
+        The reduced batches
+        """
+
+        segment = []
+
+        for i, processor in enumerate(self.processors):
+
+            if processor.requires_all_batches:
+                batches = self.stream_batches(batches, segment)
+                segment = []
+
+                logger.debug(f"Applying barrier processor '{processor.__class__}' to {len(batches)} batches. "
+                             f"(Step {i+1}/{len(self.processors)})")
+
+                batches, failures = self.apply_processor(processor, batches)
+
+            else:
+                segment.append(processor)
+
+        return self.stream_batches(batches, segment)
+
+    def stream_batches(
+            self,
+            batches: list,
+            processors: list,
+    ) -> list:
+
+        if len(processors) == 0:
+            return batches
+
+        logger.debug(f"Streaming {len(batches)} batches through {len(processors)} processors: "
+                     f"{[x.__class__.__name__ for x in processors]}")
+
+        pending = list(batches)
+        new_batches = []
+
+        while len(pending) > 0:
+            new_batches += self.stream_batch(pending.pop(0), processors)
+
+        return new_batches
+
+    def stream_batch(
+            self,
+            batch,
+            processors: list,
+    ) -> list:
+
+        processor = processors[0]
+
+        logger.debug(f"Applying '{processor.__class__}' processor to single batch. "
+                     f"(Step {self.processors.index(processor)+1}/{len(self.processors)})")
+
+        new_batches, failures = self.apply_processor(processor, [batch])
+
+        del batch
+
+        if len(processors) == 1:
+            return new_batches
+
+        output_batches = []
+
+        while len(new_batches) > 0:
+            output_batches += self.stream_batch(new_batches.pop(0), processors[1:])
+
+        return output_batches
+
     def set_saturation(
             self,
             header: astropy.io.fits.Header
@@ -19,6 +19,7 @@ from winterdrp.pipelines.summer.summer_files.schema import summer_schema_dir
 from winterdrp.processors.split import SplitImage
 from winterdrp.processors.utils import ImageSaver
 from winterdrp.processors.utils.image_loader import ImageLoader
+from winterdrp.processors.utils.catalog_prefetch import CatalogPrefetch
 from winterdrp.processors.utils.image_selector import ImageSelector, ImageBatcher
 from winterdrp.processors.photcal import PhotCalibrator
 from winterdrp.processors import MaskPixels, BiasCalibrator, FlatCalibrator
@@ -35,7 +36,8 @@ logger = logging.getLogger(__name__)
 def summer_astrometric_catalog_generator(
         header: astropy.io.fits.Header
 ):
-    temp_cat_path = header[sextractor_header_key]
+    # The Sextractor catalog is only needed for trimming, and is not yet available when prefetching
+    temp_cat_path = header.get(sextractor_header_key)
     cat = Gaia2Mass(
         min_mag=10,
         max_mag=20,
@@ -54,106 +56,119 @@ def summer_photometric_catalog_generator(
     return PS1(min_mag=10, max_mag=20, search_radius_arcmin=30, filter_name=filter_name)
 
 
+def load_raw_summer_header(
+        path: str
+) -> astropy.io.fits.Header:
+    header = fits.getheader(path)
+    header["OBSCLASS"] = ["calibration", "science"][header["OBSTYPE"] == "SCIENCE"]
+    # print(header['OBSCLASS'])
+    header['UTCTIME'] = header['UTCSHUT']
+    header['TARGET'] = header['OBSTYPE'].lower()
+    # header['TARGET'] = header['FIELDID']
+    crd = SkyCoord(ra=header['RA'], dec=header['DEC'], unit=(u.deg, u.deg))
+    header['RA'] = crd.ra.deg
+    header['DEC'] = crd.dec.deg
+    header['CRVAL1'] = header['RA']
+    header['CRVAL2'] = header['DEC']
+    tel_crd = SkyCoord(ra=header['TELRA'], dec=header['TELDEC'], unit=(u.deg, u.deg))
+    header['TELRA'] = tel_crd.ra.deg
+    header['TELDEC'] = tel_crd.dec.deg
+    # filters = {'4': 'OPEN', '3': 'r', '1': 'u'}
+    header['BZERO'] = 0
+    header[latest_save_key] = path
+    header["RAWPATH"] = path
+    # print(img[0].data.shape)
+    # img[0].data[2048, :] = np.nan
+
+    if 'other' in header['FILTERID']:
+        header['FILTERID'] = 'r'
+
+    header["CALSTEPS"] = ""
+    header["BASENAME"] = os.path.basename(path)
+    header.append(('GAIN', summer_gain, 'Gain in electrons / ADU'), end=True)
+
+    header['OBSDATE'] = int(header['UTC'].split('_')[0])
+
+    obstime = Time(header['UTCISO'], format='iso')
+    t0 = Time('2018-01-01', format='iso')
+    header['OBSID'] = 0
+    header['NIGHT'] = np.floor((obstime - t0).jd).astype(int)
+    header['PROGID'] = 0
+    header['EXPMJD'] = header['OBSMJD']
+
+    if "SUBPROG" not in header.keys():
+        header['SUBPROG'] = 'high_cadence'
+
+    header['FILTER'] = header['FILTERID']
+    header['DARKNAME'] = ''
+    # print('Time', header['shutopen'])
+    try:
+        header['SHUTOPEN'] = Time(header['SHUTOPEN'], format='iso').jd
+    except (KeyError, ValueError):
+        # header['SHUTOPEN'] = None
+        pass
+
+    try:
+        header['SHUTCLSD'] = Time(header['SHUTCLSD'], format='iso').jd
+    except ValueError:
+        pass
+        # header['SHUTCLSD'] = None
+
+    header['PROCFLAG'] = 0
+    sunmoon_keywords = ['MOONRA', 'MOONDEC', 'MOONILLF', 'MOONPHAS', 'MOONALT', 'SUNAZ', 'SUNALT']
+    for key in sunmoon_keywords:
+        val = 0
+        if key in header.keys():
+            if header[key] not in ['']:
+                val = header[key]
+        header[key] = val
+
+    itid_dict = {
+        'SCIENCE': 1,
+        'BIAS': 2,
+        'FLAT': 2,
+        'DARK': 2,
+        'FOCUS': 3,
+        'POINTING': 4,
+        'OTHER': 5
+    }
+
+    if not header['OBSTYPE'] in itid_dict.keys():
+        header['ITID'] = 5
+    else:
+        header['ITID'] = itid_dict[header['OBSTYPE']]
+
+    if header['FIELDID'] == 'radec':
+        header['FIELDID'] = 0
+
+    if header['ITID'] != 1:
+        header['FIELDID'] = -99
+
+    if 'COADDS' not in header.keys():
+        header['COADDS'] = 1
+        # logger.debug('Setting COADDS to 1')
+
+    crds = SkyCoord(ra=header['RA'], dec=header['DEC'], unit=(u.deg, u.deg))
+    header['RA'] = crds.ra.deg
+    header['DEC'] = crds.dec.deg
+
+    return header
+
+
+def load_raw_summer_data(
+        path: str
+) -> np.array:
+    with fits.open(path) as data:
+        pixels = data[0].data
+    return pixels
+
+
 def load_raw_summer_image(
         path: str
 ) -> tuple[np.array, astropy.io.fits.Header]:
-    with fits.open(path) as data:
-        header = data[0].header
-        header["OBSCLASS"] = ["calibration", "science"][header["OBSTYPE"] == "SCIENCE"]
-        # print(header['OBSCLASS'])
-        header['UTCTIME'] = header['UTCSHUT']
-        header['TARGET'] = header['OBSTYPE'].lower()
-        # header['TARGET'] = header['FIELDID']
-        crd = SkyCoord(ra=data[0].header['RA'], dec=data[0].header['DEC'], unit=(u.deg, u.deg))
-        header['RA'] = crd.ra.deg
-        header['DEC'] = crd.dec.deg
-        header['CRVAL1'] = header['RA']
-        header['CRVAL2'] = header['DEC']
-        tel_crd = SkyCoord(ra=data[0].header['TELRA'], dec=data[0].header['TELDEC'], unit=(u.deg, u.deg))
-        header['TELRA'] = tel_crd.ra.deg
-        header['TELDEC'] = tel_crd.dec.deg
-        # filters = {'4': 'OPEN', '3': 'r', '1': 'u'}
-        header['BZERO'] = 0
-        header[latest_save_key] = path
-        header["RAWPATH"] = path
-        # print(img[0].data.shape)
-        data[0].data = data[0].data * 1.0
-        # img[0].data[2048, :] = np.nan
-
-        if 'other' in header['FILTERID']:
-            header['FILTERID'] = 'r'
-
-        header["CALSTEPS"] = ""
-        header["BASENAME"] = os.path.basename(path)
-        header.append(('GAIN', summer_gain, 'Gain in electrons / ADU'), end=True)
-
-        header['OBSDATE'] = int(header['UTC'].split('_')[0])
-
-        obstime = Time(header['UTCISO'], format='iso')
-        t0 = Time('2018-01-01', format='iso')
-        header['OBSID'] = 0
-        header['NIGHT'] = np.floor((obstime - t0).jd).astype(int)
-        header['PROGID'] = 0
-        header['EXPMJD'] = header['OBSMJD']
-
-        if "SUBPROG" not in header.keys():
-            header['SUBPROG'] = 'high_cadence'
-
-        header['FILTER'] = header['FILTERID']
-        header['DARKNAME'] = ''
-        # print('Time', header['shutopen'])
-        try:
-            header['SHUTOPEN'] = Time(header['SHUTOPEN'], format='iso').jd
-        except (KeyError, ValueError):
-            # header['SHUTOPEN'] = None
-            pass
-
-        try:
-            header['SHUTCLSD'] = Time(header['SHUTCLSD'], format='iso').jd
-        except ValueError:
-            pass
-            # header['SHUTCLSD'] = None
-
-        header['PROCFLAG'] = 0
-        sunmoon_keywords = ['MOONRA', 'MOONDEC', 'MOONILLF', 'MOONPHAS', 'MOONALT', 'SUNAZ', 'SUNALT']
-        for key in sunmoon_keywords:
-            val = 0
-            if key in header.keys():
-                if header[key] not in ['']:
-                    val = header[key]
-            header[key] = val
-
-        itid_dict = {
-            'SCIENCE': 1,
-            'BIAS': 2,
-            'FLAT': 2,
-            'DARK': 2,
-            'FOCUS': 3,
-            'POINTING': 4,
-            'OTHER': 5
-        }
-
-        if not header['OBSTYPE'] in itid_dict.keys():
-            header['ITID'] = 5
-        else:
-            header['ITID'] = itid_dict[header['OBSTYPE']]
-
-        if header['FIELDID'] == 'radec':
-            header['FIELDID'] = 0
-
-        if header['ITID'] != 1:
-            header['FIELDID'] = -99
-
-        if 'COADDS' not in header.keys():
-            header['COADDS'] = 1
-            # logger.debug('Setting COADDS to 1')
-
-        crds = SkyCoord(ra=header['RA'], dec=header['DEC'], unit=(u.deg, u.deg))
-        header['RA'] = crds.ra.deg
-        header['DEC'] = crds.dec.deg
-
-        data[0].header = header
-    return data[0].data, data[0].header
+    header = load_raw_summer_header(path)
+    pixels = load_raw_summer_data(path)
+    return pixels, header
 
 
 pipeline_name = "summer"
@@ -165,7 +180,16 @@ class SummerPipeline(Pipeline):
     pipeline_configurations = {
         None: [
             ImageLoader(
-                load_image=load_raw_summer_image
+                load_image=load_raw_summer_image,
+                load_header=load_raw_summer_header,
+                load_data=load_raw_summer_data,
+                lazy=True
+            ),
+            CatalogPrefetch(
+                ref_catalog_generators=[
+                    summer_astrometric_catalog_generator,
+                    summer_photometric_catalog_generator
+                ]
             ),
             CSVLog(
                 export_keys=[
@@ -17,6 +17,7 @@ from winterdrp.processors.photcal import PhotCalibrator
 from winterdrp.catalog import Gaia2Mass
 from winterdrp.downloader.caltech import download_via_ssh
 from winterdrp.processors.utils.image_loader import ImageLoader
+from winterdrp.processors.utils.catalog_prefetch import CatalogPrefetch
 from winterdrp.processors.utils.image_selector import ImageSelector, ImageBatcher, ImageDebatcher
 from winterdrp.paths import coadd_key, proc_history_key
 import logging
@@ -40,36 +41,49 @@ def wirc_photometric_catalog_generator(
 pipeline_name = "wirc"
 
 
-def load_raw_wirc_image(
+def load_raw_wirc_header(
         path: str
-) -> tuple[np.array, astropy.io.fits.Header]:
+) -> astropy.io.fits.Header:
+    header = fits.getheader(path)
+    header["FILTER"] = header["AFT"].split("__")[0]
+    header["OBSCLASS"] = ["calibration", "science"][header["OBSTYPE"] == "object"]
+    header["CALSTEPS"] = ""
+    header["BASENAME"] = os.path.basename(path)
+    header["TARGET"] = header["OBJECT"].lower()
+    header["UTCTIME"] = header["UTSHUT"]
+    header["MJD-OBS"] = Time(header['UTSHUT']).mjd
+    if coadd_key not in header.keys():
+        logger.debug(f"No {coadd_key} entry. Setting coadds to 1.")
+        header[coadd_key] = 1
+    if proc_history_key not in header.keys():
+        header[proc_history_key] = ""
+
+    filter_dict = {'J': 1,'H': 2, 'Ks': 3}
+    if "FILTERID" not in header.keys():
+        header["FILTERID"] = filter_dict[header["FILTER"]]
+    if "FIELDID" not in header.keys():
+        header["FIELDID"] = 99999
+    if "PROGPI" not in header.keys():
+        header["PROGPI"] = "Kasliwal"
+    if "PROGID" not in header.keys():
+        header["PROGID"] = 0
+    return header
+
+
+def load_raw_wirc_data(
+        path: str
+) -> np.array:
     with fits.open(path) as img:
         data = img[0].data
-        header = img[0].header
-        header["FILTER"] = header["AFT"].split("__")[0]
-        header["OBSCLASS"] = ["calibration", "science"][header["OBSTYPE"] == "object"]
-        header["CALSTEPS"] = ""
-        header["BASENAME"] = os.path.basename(path)
-        header["TARGET"] = header["OBJECT"].lower()
-        header["UTCTIME"] = header["UTSHUT"]
-        header["MJD-OBS"] = Time(header['UTSHUT']).mjd
-        if coadd_key not in header.keys():
-            logger.debug(f"No {coadd_key} entry. Setting coadds to 1.")
-            header[coadd_key] = 1
-        if proc_history_key not in header.keys():
-            header[proc_history_key] = ""
-
-        filter_dict = {'J': 1,'H': 2, 'Ks': 3}
-        if "FILTERID" not in header.keys():
-            header["FILTERID"] = filter_dict[header["FILTER"]]
-        if "FIELDID" not in header.keys():
-            header["FIELDID"] = 99999
-        if "PROGPI" not in header.keys():
-            header["PROGPI"] = "Kasliwal"
-        if "PROGID" not in header.keys():
-            header["PROGID"] = 0
-
-        data[data == 0] = np.nan
+    data[data == 0] = np.nan
+    return data
+
+
+def load_raw_wirc_image(
+        path: str
+) -> tuple[np.array, astropy.io.fits.Header]:
+    header = load_raw_wirc_header(path)
+    data = load_raw_wirc_data(path)
     return data, header
 
 
@@ -96,7 +110,16 @@ class WircPipeline(Pipeline):
         None: [
             ImageLoader(
                 input_sub_dir="raw",
-                load_image=load_raw_wirc_image
+                load_image=load_raw_wirc_image,
+                load_header=load_raw_wirc_header,
+                load_data=load_raw_wirc_data,
+                lazy=True
+            ),
+            CatalogPrefetch(
+                ref_catalog_generators=[
+                    wirc_astrometric_catalog_generator,
+                    wirc_photometric_catalog_generator
+                ]
             ),
             MaskPixels(mask_path=wirc_mask_path),
             ImageBatcher(split_key="exptime"),
@@ -22,7 +22,8 @@ from winterdrp.processors.photometry.psf_photometry import PSFPhotometry
 from winterdrp.processors.photometry.aperture_photometry import AperturePhotometry
 from winterdrp.catalog.kowalski import TMASS, PS1
 from winterdrp.processors.xmatch import XMatch
-from winterdrp.pipelines.wirc.wirc_pipeline import load_raw_wirc_image
+from winterdrp.pipelines.wirc.wirc_pipeline import load_raw_wirc_image, load_raw_wirc_header, \
+    load_raw_wirc_data
 
 logger = logging.getLogger(__name__)
 
@@ -108,7 +109,10 @@ class WircImsubPipeline(Pipeline):
         None: [
             ImageLoader(
                 input_sub_dir="raw",
-                load_image=load_raw_wirc_image
+                load_image=load_raw_wirc_image,
+                load_header=load_raw_wirc_header,
+                load_data=load_raw_wirc_data,
+                lazy=True
             ),
             # ImageBatcher(split_key='UTSHUT'),
             ImageSelector((base_name_key, "ZTF21aagppzg_J_stack_1_20210330.fits")),
@@ -18,7 +18,7 @@ def run_psfex(sextractor_cat_path: str,
               norm_psf_output_name: str = None
               ):
     psfex_command = f"psfex -c {config_path} {sextractor_cat_path} -PSF_DIR {psf_output_dir} -CHECKIMAGE_TYPE NONE"
-    print(psfex_command)
+    logger.debug(psfex_command)
 
     execute(psfex_command)
 
@@ -33,16 +33,21 @@ def run_psfex(sextractor_cat_path: str,
 class PSFex(BaseImageProcessor):
     base_key = "psfex"
 
+    allow_checkpoint = True
+    checkpoint_file_keys = [psfex_header_key, norm_psfex_header_key]
+
     def __init__(self,
                  config_path: str = None,
                  output_sub_dir: str = "psf",
                  norm_fits: bool = True,
+                 max_n_tool_processes: int = 1,
                  *args,
                  **kwargs):
         super(PSFex, self).__init__(*args, **kwargs)
         self.config_path = config_path
         self.output_sub_dir = output_sub_dir
         self.norm_fits = norm_fits
+        self.max_n_tool_processes = max_n_tool_processes
 
     def get_psfex_output_dir(self):
         return get_output_dir(self.output_sub_dir, self.night_sub_dir)
@@ -59,22 +64,34 @@ class PSFex(BaseImageProcessor):
         except OSError:
             pass
 
-        for ind, header in enumerate(headers):
-            sextractor_cat_path = header[sextractor_header_key]
+        passed, _ = self.map_images(
+            lambda i: self.run_psfex_on_image(headers[i]),
+            headers,
+            n_threads=self.max_n_tool_processes
+        )
 
-            psf_path = sextractor_cat_path.replace('.cat', '.psf')
-            norm_psf_path = sextractor_cat_path.replace('.cat', '.psfmodel')
-            run_psfex(sextractor_cat_path=sextractor_cat_path,
-                      config_path=self.config_path,
-                      psf_output_dir=os.path.dirname(sextractor_cat_path),
-                      norm_psf_output_name=norm_psf_path
-                      )
+        images = [images[i] for i in passed]
+        headers = [headers[i] for i in passed]
 
-            header[psfex_header_key] = psf_path
-            header[norm_psfex_header_key] = norm_psf_path
-            # assert False
         return images, headers
 
+    def run_psfex_on_image(
+            self,
+            header: astropy.io.fits.Header
+    ):
+        sextractor_cat_path = header[sextractor_header_key]
+
+        psf_path = sextractor_cat_path.replace('.cat', '.psf')
+        norm_psf_path = sextractor_cat_path.replace('.cat', '.psfmodel')
+        run_psfex(sextractor_cat_path=sextractor_cat_path,
+                  config_path=self.config_path,
+                  psf_output_dir=os.path.dirname(sextractor_cat_path),
+                  norm_psf_output_name=norm_psf_path
+                  )
+
+        header[psfex_header_key] = psf_path
+        header[norm_psfex_header_key] = norm_psf_path
+
     def check_prerequisites(
             self,
     ):
@@ -39,6 +39,9 @@ class Scamp(BaseImageProcessor):
 
     base_key = "scamp"
 
+    allow_checkpoint = True
+    checkpoint_file_keys = [scamp_header_key]
+
     def __init__(
             self,
             ref_catalog_generator: Callable[[astropy.io.fits.Header], BaseCatalog],
@@ -99,8 +102,8 @@ class Scamp(BaseImageProcessor):
                 )
 
                 temp_img_path = get_temp_path(scamp_output_dir, header["BASENAME"])
-                self.save_fits(data, header, temp_img_path)
-                temp_mask_path = self.save_mask(data, header, temp_img_path)
+                self.link_saved_image(data, header, temp_img_path)
+                temp_mask_path = self.link_saved_mask(data, header, temp_img_path)
                 f.write(f"{temp_cat_path}\n")
                 temp_files += [temp_cat_path, temp_img_path, temp_mask_path]
 
@@ -8,6 +8,7 @@ from winterdrp.processors.astromatic.sextractor.sourceextractor import run_sextr
     run_sextractor_dual
 from winterdrp.processors.base_processor import BaseImageProcessor
 from winterdrp.paths import get_output_dir, get_temp_path, latest_mask_save_key
+from winterdrp.io import get_pixel_hash
 
 logger = logging.getLogger(__name__)
 
@@ -17,6 +18,9 @@ sextractor_header_key = 'SRCCAT'
 class Sextractor(BaseImageProcessor):
     base_key = "sextractor"
 
+    allow_checkpoint = True
+    checkpoint_file_keys = [sextractor_header_key]
+
     def __init__(
             self,
             output_sub_dir: str,
@@ -32,6 +36,7 @@ class Sextractor(BaseImageProcessor):
             dual: bool = False,
             cache: bool = False,
             mag_zp :float = None,
+            max_n_tool_processes: int = 1,
             *args,
             **kwargs
     ):
@@ -50,6 +55,7 @@ class Sextractor(BaseImageProcessor):
         self.dual = dual
         self.cache = cache
         self.mag_zp = mag_zp
+        self.max_n_tool_processes = max_n_tool_processes
 
     def get_sextractor_output_dir(self):
         return get_output_dir(self.output_sub_dir, self.night_sub_dir)
@@ -67,87 +73,112 @@ class Sextractor(BaseImageProcessor):
         except OSError:
             pass
 
-        for i in range(len(images)):
-
-            header = headers[i]
-            data = images[i]
-
-            det_image, measure_image, det_header, measure_header = None, None, None, None
-            if self.gain is None:
-                if 'GAIN' in header.keys():
-                    self.gain = header['GAIN']
-            if self.dual:
-                det_header = headers[i][0]
-                measure_header = headers[i][1]
-                det_image = images[i][0]
-                measure_image = images[i][1]
-                header = det_header
-                data = det_image
-                self.gain = measure_header["GAIN"]
-
-            temp_path = get_temp_path(sextractor_out_dir, header["BASENAME"])
+        passed, _ = self.map_images(
+            lambda i: self.run_sextractor_on_image(images[i], headers[i], sextractor_out_dir),
+            headers,
+            n_threads=self.max_n_tool_processes
+        )
+
+        images = [images[i] for i in passed]
+        headers = [headers[i] for i in passed]
+
+        return images, headers
+
+    def run_sextractor_on_image(
+            self,
+            image: np.ndarray | list[np.ndarray],
+            header: astropy.io.fits.Header | list[astropy.io.fits.Header],
+            sextractor_out_dir: str
+    ):
+        """Run sextractor on a single image (or, in dual mode, a pair of detection and measurement images).
+        This can be called for several images at once, so it does not modify the processor."""
+
+        data = image
+        gain = self.gain
+
+        det_image, measure_image, det_header, measure_header = None, None, None, None
+        if gain is None:
+            if 'GAIN' in header.keys():
+                gain = header['GAIN']
+        if self.dual:
+            det_header = header[0]
+            measure_header = header[1]
+            det_image = image[0]
+            measure_image = image[1]
+            header = det_header
+            data = det_image
+            gain = measure_header["GAIN"]
+
+        temp_path = get_temp_path(sextractor_out_dir, header["BASENAME"])
+
+        # An image (and mask) which is unchanged since it was saved is used directly, rather than a temporary copy
+        pixel_hash = get_pixel_hash(data)
+        image_path = self.get_saved_path(data, header, pixel_hash=pixel_hash)
+
+        if image_path is not None:
+            temp_files = []
+        else:
+            image_path = temp_path
             if not os.path.exists(temp_path):
-                self.save_fits(data, header, temp_path)
+                self.save_fits(data, header, temp_path, track=self.cache)
             temp_files = [temp_path]
 
-            mask_path = None
-            if latest_mask_save_key in header.keys():
-                image_mask_path = os.path.join(sextractor_out_dir, header[latest_mask_save_key])
-                temp_mask_path = get_temp_path(sextractor_out_dir, header[latest_mask_save_key])
-                if os.path.exists(image_mask_path):
-                    shutil.copyfile(image_mask_path,temp_mask_path)
-                    mask_path = temp_mask_path
-                    temp_files.append(mask_path)
-                else:
-                    mask_path = None
-
-            if mask_path is None:
-                mask_path = self.save_mask(data, header, temp_path)
+        mask_path = self.get_saved_mask_path(data, header, pixel_hash=pixel_hash)
+        if mask_path is None and latest_mask_save_key in header.keys():
+            image_mask_path = os.path.join(sextractor_out_dir, header[latest_mask_save_key])
+            temp_mask_path = get_temp_path(sextractor_out_dir, header[latest_mask_save_key])
+            if os.path.exists(image_mask_path):
+                shutil.copyfile(image_mask_path,temp_mask_path)
+                mask_path = temp_mask_path
                 temp_files.append(mask_path)
-            output_cat = os.path.join(sextractor_out_dir, header["BASENAME"].replace(".fits", ".cat"))
-
-            if not self.dual:
-                output_cat = run_sextractor_single(
-                    img=temp_path,
-                    config=self.config,
-                    output_dir=sextractor_out_dir,
-                    parameters_name=self.parameters_name,
-                    filter_name=self.filter_name,
-                    starnnw_name=self.starnnw_name,
-                    saturation=self.saturation,
-                    weight_image=mask_path,
-                    verbose_type=self.verbose_type,
-                    checkimage_name=self.checkimage_name,
-                    checkimage_type=self.checkimage_type,
-                    gain=self.gain,
-                    catalog_name=output_cat
-                )
-
-            if self.dual:
-                output_cat = run_sextractor_dual(
-                    det_image=det_image,
-                    measure_image=measure_image,
-                    config=self.config,
-                    output_dir=sextractor_out_dir,
-                    parameters_name=self.parameters_name,
-                    filter_name=self.filter_name,
-                    starnnw_name=self.starnnw_name,
-                    saturation=self.saturation,
-                    weight_image=mask_path,
-                    verbose_type=self.verbose_type,
-                    checkimage_name=self.checkimage_name,
-                    checkimage_type=self.checkimage_type,
-                    gain=self.gain,
-                    catalog_name=output_cat,
-                    mag_zp=self.mag_zp
-                )
-
-            logger.info(f'Cache save is {self.cache}')
-            if not self.cache:
-                for temp_file in temp_files:
-                    os.remove(temp_file)
-                    logger.info(f"Deleted temporary file {temp_file}")
-
-            header[sextractor_header_key] = os.path.join(sextractor_out_dir, output_cat)
-
-        return images, headers
\ No newline at end of file
+            else:
+                mask_path = None
+
+        if mask_path is None:
+            mask_path = self.save_mask(data, header, temp_path)
+            temp_files.append(mask_path)
+        output_cat = os.path.join(sextractor_out_dir, header["BASENAME"].replace(".fits", ".cat"))
+
+        if not self.dual:
+            output_cat = run_sextractor_single(
+                img=image_path,
+                config=self.config,
+                output_dir=sextractor_out_dir,
+                parameters_name=self.parameters_name,
+                filter_name=self.filter_name,
+                starnnw_name=self.starnnw_name,
+                saturation=self.saturation,
+                weight_image=mask_path,
+                verbose_type=self.verbose_type,
+                checkimage_name=self.checkimage_name,
+                checkimage_type=self.checkimage_type,
+                gain=gain,
+                catalog_name=output_cat
+            )
+
+        if self.dual:
+            output_cat = run_sextractor_dual(
+                det_image=det_image,
+                measure_image=measure_image,
+                config=self.config,
+                output_dir=sextractor_out_dir,
+                parameters_name=self.parameters_name,
+                filter_name=self.filter_name,
+                starnnw_name=self.starnnw_name,
+                saturation=self.saturation,
+                weight_image=mask_path,
+                verbose_type=self.verbose_type,
+                checkimage_name=self.checkimage_name,
+                checkimage_type=self.checkimage_type,
+                gain=gain,
+                catalog_name=output_cat,
+                mag_zp=self.mag_zp
+            )
+
+        logger.info(f'Cache save is {self.cache}')
+        if not self.cache:
+            for temp_file in temp_files:
+                os.remove(temp_file)
+                logger.info(f"Deleted temporary file {temp_file}")
+
+        header[sextractor_header_key] = os.path.join(sextractor_out_dir, output_cat)
@@ -3,6 +3,7 @@ import os
 import numpy as np
 import astropy.io.fits
 from winterdrp.processors.base_processor import BaseImageProcessor
+from winterdrp.data_quality import set_dq_flags, dq_edge
 from winterdrp.paths import get_output_dir, copy_temp_file, get_temp_path, base_name_key, latest_mask_save_key
 from winterdrp.utils import execute
 from winterdrp.processors.astromatic.scamp.scamp import Scamp, scamp_header_key
@@ -231,8 +232,8 @@ class Swarp(BaseImageProcessor):
                     )
 
                 temp_img_path = get_temp_path(swarp_output_dir, header["BASENAME"])
-                self.save_fits(data, header, temp_img_path)
-                temp_mask_path = self.save_mask(data, header, temp_img_path)
+                self.link_saved_image(data, header, temp_img_path)
+                temp_mask_path = self.link_saved_mask(data, header, temp_img_path)
 
                 f.write(f"{temp_img_path}\n")
                 g.write(f"{temp_mask_path}\n")
@@ -292,6 +293,10 @@ class Swarp(BaseImageProcessor):
 
         image, new_header = self.open_fits(output_image_path)
 
+        # Pixels with no coverage in the output weight map are flagged as edge pixels
+        weight, _ = self.open_fits(output_image_weight_path)
+        image = set_dq_flags(image, weight == 0, dq_edge)
+
         for key in headers[0]:
             if np.sum([x[key] == headers[0][key] for x in headers]) == len(headers):
                 if key not in new_header:
@@ -30,6 +30,7 @@ import urllib.request
 import math
 import numpy as np
 from astropy.io import fits
+from scipy.spatial import cKDTree
 from winterdrp.paths import base_output_dir, ProcessingError
 from winterdrp.processors.astromatic.sextractor.sourceextractor import run_sextractor_single, default_saturation
 import logging
@@ -177,6 +178,46 @@ def position_angle(
     return pa_deg                        # will have the number of matches cut by half at each comparison level
 
 
+def wrap_angles(
+        angles: np.ndarray
+) -> np.ndarray:
+    """Vectorised version of the loops in position_angle, wrapping angles (in degrees) into [-160, 200]"""
+    angles = np.array(angles, dtype=float)
+    high = angles > 200.
+    while np.any(high):
+        angles[high] -= 360.
+        high = angles > 200.
+    low = angles < -160.
+    while np.any(low):
+        angles[low] += 360.
+        low = angles < -160.
+    return angles
+
+
+def get_position_angles(
+        src_list: list[BaseSource],
+        first: np.ndarray,
+        second: np.ndarray
+) -> np.ndarray:
+    """Vectorised version of position_angle, from each source in 'first' to the source in 'second'"""
+    ra_rad = np.array([src.ra_rad for src in src_list], dtype=float)
+    dec_rad = [float(src.dec_rad) for src in src_list]
+
+    # Use math for the per-source terms, so the angles agree exactly with position_angle
+    cos_dec = np.array([math.cos(x) for x in dec_rad], dtype=float)
+    sin_dec = np.array([math.sin(x) for x in dec_rad], dtype=float)
+    tan_dec = np.array([math.tan(x) for x in dec_rad], dtype=float)
+
+    dra = ra_rad[second] - ra_rad[first]
+    pa_rad = np.arctan2(
+        cos_dec[first] * tan_dec[second] - sin_dec[first] * np.cos(dra),
+        np.sin(dra)
+    )
+    pa_deg = pa_rad * 180./math.pi
+    pa_deg = 90. - pa_deg
+    return wrap_angles(pa_deg)
+
+
 # Compare objects using magnitude.
 def compare_mag(
         source: SextractorSource
@@ -565,6 +606,72 @@ def get_catalog(
     return cat_list
 
 
+def get_distance_pairs(
+        ra_deg: np.ndarray,
+        dec_deg: np.ndarray,
+        ra_scale: float,
+        max_rad: float,
+        min_rad: float
+) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Find all pairs of sources separated by between min_rad and max_rad (in arcsec), as measured by quickdistance.
+    Candidate pairs are found with a KD-tree, and then filtered with exactly the same cuts as a loop over pairs.
+
+    Parameters
+    ----------
+    ra_deg: RA of each source, in degrees
+    dec_deg: Dec of each source, in degrees
+    ra_scale: cos(dec) used for the distances
+    max_rad: Maximum distance, in arcsec
+    min_rad: Minimum distance, in arcsec
+
+    Returns
+    -------
+    Index of the first and second source of each pair (sorted by first, then second source), and their distance
+    """
+    n_src = len(ra_deg)
+
+    # Planar positions (in arcsec), for which euclidean distances are quickdistance.
+    # The search radius is padded slightly, as the exact distances are recalculated below.
+    xy = np.stack([ra_deg * ra_scale * 3600., dec_deg * 3600.], axis=-1).reshape(-1, 2)
+    search_rad = max_rad * (1. + 1.e-6) + 1.e-6
+
+    tree = cKDTree(xy)
+    pairs = tree.query_pairs(r=search_rad, output_type="ndarray").reshape(-1, 2)
+    first = [pairs[:, 0], pairs[:, 1]]
+    second = [pairs[:, 1], pairs[:, 0]]
+
+    # quickdistance wraps RA differences above 180 degrees, so also look for pairs across RA=0
+    if n_src > 0 and np.max(ra_deg) - np.min(ra_deg) > 180.:
+        shifted = xy + np.array([360. * ra_scale * 3600., 0.])
+        matches = tree.query_ball_point(shifted, r=search_rad)
+        n_matches = np.array([len(x) for x in matches], dtype=int)
+        first.append(np.repeat(np.arange(n_src), n_matches))
+        second.append(np.concatenate([np.asarray(x, dtype=int) for x in matches] + [np.zeros(0, dtype=int)]))
+
+    keys = np.unique(np.concatenate(first).astype(np.int64) * n_src + np.concatenate(second))
+    first = keys // max(n_src, 1)
+    second = keys % max(n_src, 1)
+
+    ddec = dec_deg[second] - dec_deg[first]
+    dra = ra_deg[second] - ra_deg[first]
+
+    mask = np.logical_and(
+        first != second,
+        np.logical_not(np.logical_or(
+            np.abs(ddec) > max_rad,
+            ra_scale * np.abs(dra) > max_rad
+        ))
+    )
+
+    dra = np.where(dra > 180, 360 - dra, dra)
+    dist = 3600 * np.sqrt(ddec**2 + (ra_scale * dra)**2)
+
+    mask = np.logical_and(mask, np.logical_and(min_rad < dist, dist < max_rad))
+
+    return first[mask], second[mask], dist[mask]
+
+
 def distance_match(
         img_src_list: list[SextractorSource],
         ref_src_list: list[BaseSource],
@@ -601,54 +708,24 @@ def distance_match(
 
     # Calculate all the distances
 
-    # In image catalog:
-    img_src_dists = list()
-    img_src_match_ids = list()
-    for i, src in enumerate(img_src_list):
-        d = []
-        dj = []
-        for j, src2 in enumerate(img_src_list):
-            if i == j:
-                continue
-
-            if abs(src.dec_deg - src2.dec_deg) > max_rad:
-                continue
-            if ra_scale*abs(src.ra_deg - src2.ra_deg) > max_rad:
-                continue
-
-            dist = quickdistance(src, src2, ra_scale)
-
-            if min_rad < dist < max_rad:
-                d.append(dist)
-                dj.append(j)
-
-        img_src_dists.append(d)
-        img_src_match_ids.append(dj)
+    img_ra = np.array([src.ra_deg for src in img_src_list], dtype=float)
+    img_dec = np.array([src.dec_deg for src in img_src_list], dtype=float)
+    img_first, img_second, img_dist = get_distance_pairs(img_ra, img_dec, ra_scale, max_rad, min_rad)
+    img_n_pairs = np.bincount(img_first, minlength=len(img_src_list))
+    img_starts = np.cumsum(img_n_pairs) - img_n_pairs
 
-    # In reference catalog:
-    ref_src_dists = []
-    ref_src_match_ids = []
-    for i, src in enumerate(ref_src_list):
-        d = []
-        dj = []
-        for j, src2 in enumerate(ref_src_list):
-
-            if i == j:
-                continue
-
-            if abs(src.dec_deg - src2.dec_deg) > max_rad:
-                continue
-            if ra_scale*abs(src.ra_deg - src2.ra_deg) > max_rad:
-                continue
+    ref_ra = np.array([src.ra_deg for src in ref_src_list], dtype=float)
+    ref_dec = np.array([src.dec_deg for src in ref_src_list], dtype=float)
+    ref_first, ref_second, ref_dist = get_distance_pairs(ref_ra, ref_dec, ra_scale, max_rad, min_rad)
 
-            dist = quickdistance(src, src2, ra_scale)
+    # Reference sources with fewer than two distances are never matched
+    ref_n_pairs = np.bincount(ref_first, minlength=len(ref_src_list))
+    ref_pair_ids = np.arange(len(ref_first))[ref_n_pairs[ref_first] >= 2]
+    ref_pair_ids = ref_pair_ids[np.argsort(ref_dist[ref_pair_ids], kind="stable")]
+    ref_sorted_dist = ref_dist[ref_pair_ids]
 
-            if min_rad < dist < max_rad:
-                d.append(dist)
-                dj.append(j)
-
-        ref_src_dists.append(d)
-        ref_src_match_ids.append(dj)
+    img_pa = get_position_angles(img_src_list, img_first, img_second)
+    ref_pa = get_position_angles(ref_src_list, ref_first, ref_second)
 
     # Now look for matches in the reference catalog to distances in the image catalog.
 
@@ -662,68 +739,83 @@ def distance_match(
     primary_match_img = []
     primary_match_ref = []
 
-    for img_i, img_dist_array in enumerate(img_src_dists):
+    for img_i in range(len(img_src_list)):
 
-        if len(img_dist_array) < 2:
+        if img_n_pairs[img_i] < 2:
             continue
 
-        for ref_i, ref_dist_array in enumerate(ref_src_dists):
-
-            if len(ref_dist_array) < 2:
-                continue
+        img_pairs = np.arange(img_starts[img_i], img_starts[img_i] + img_n_pairs[img_i])
+        img_dist_array = img_dist[img_pairs]
 
-            match = 0
-            img_match_in = []
-            ref_match_in = []
-
-            for img_j, img_src_dist in enumerate(img_dist_array):
+        # Reference distances which could match each image distance, i.e. abs(img/ref - 1) < tolerance.
+        # The bounds are padded slightly, and the exact ratio is checked below.
+        lower = img_dist_array / (1. + tolerance) * (1. - 1.e-9)
+        if tolerance < 1.:
+            upper = img_dist_array / (1. - tolerance) * (1. + 1.e-9)
+        else:
+            upper = np.full(len(img_dist_array), np.inf)
+        lo = np.searchsorted(ref_sorted_dist, lower, side="left")
+        hi = np.searchsorted(ref_sorted_dist, upper, side="right")
+        n_candidates = hi - lo
+
+        img_j = np.repeat(np.arange(len(img_dist_array)), n_candidates)
+        sorted_idx = np.arange(n_candidates.sum()) - np.repeat(np.cumsum(n_candidates) - n_candidates - lo, n_candidates)
+        ref_pairs = ref_pair_ids[sorted_idx]
+
+        mask = np.abs((img_dist_array[img_j] / ref_dist[ref_pairs]) - 1.0) < tolerance
+        img_j = img_j[mask]
+        ref_pairs = ref_pairs[mask]
+
+        # Group by reference source, keeping the order of a loop over image distances, then reference distances
+        ref_i_all = ref_first[ref_pairs]
+        order = np.lexsort((ref_pairs, img_j, ref_i_all))
+        img_j = img_j[order]
+        ref_pairs = ref_pairs[order]
+        ref_i_all = ref_i_all[order]
+
+        if len(ref_i_all) == 0:
+            continue
 
-                new_match = 1
+        group_starts = np.flatnonzero(np.concatenate([[True], ref_i_all[1:] != ref_i_all[:-1]]))
+        group_ends = np.append(group_starts[1:], len(ref_i_all))
 
-                for ref_j, ref_src_dist in enumerate(ref_dist_array):
+        # Each image distance counts once towards 'match', however many reference distances it matches
+        new_match = np.concatenate([[True], np.logical_or(ref_i_all[1:] != ref_i_all[:-1], img_j[1:] != img_j[:-1])])
+        group_matches = np.add.reduceat(new_match.astype(int), group_starts)
 
-                    if abs((img_src_dist / ref_src_dist) - 1.0) < tolerance:
-                        match += new_match
+        img_match_ids = img_second[img_pairs[img_j]]
+        ref_match_ids = ref_second[ref_pairs]
 
-                        new_match = 0  # further matches before the next img_j loop indicate degeneracies
+        # Here, dpa[n] is the mean rotation of the PA from the primary star of this match
+        #  to the stars in its match RELATIVE TO those same angles for those same stars
+        #  in the catalog.  Therefore it is a robust measurement of the rotation.
+        all_dpa = wrap_angles(img_pa[img_pairs[img_j]] - ref_pa[ref_pairs])
 
-                        img_match_in.append(img_src_match_ids[img_i][img_j])
-                        ref_match_in.append(ref_src_match_ids[ref_i][ref_j])
+        for ref_i, group_start, group_end, match in zip(
+                ref_i_all[group_starts].tolist(), group_starts, group_ends, group_matches
+        ):
 
             if match >= req_match:
 
-                dpa = []
-                # Here, dpa[n] is the mean rotation of the PA from the primary star of this match
-                #  to the stars in its match RELATIVE TO those same angles for those same stars
-                #  in the catalog.  Therefore it is a robust measurement of the rotation.
-
-                for i in range(len(img_match_in)):
-                    ddpa = position_angle(img_src_list[img_i], img_src_list[img_match_in[i]]) \
-                           - position_angle(ref_src_list[ref_i], ref_src_list[ref_match_in[i]])
-                    while ddpa > 200.:
-                        ddpa -= 360.
-                    while ddpa < -160.:
-                        ddpa += 360.
-                    dpa.append(ddpa)
+                img_match_in = img_match_ids[group_start:group_end]
+                ref_match_in = ref_match_ids[group_start:group_end]
+                dpa = all_dpa[group_start:group_end]
 
                 # If user was confident the initial PA was right, remove bad PA'src right away
-                for i in range(len(img_match_in)-1, -1, -1):
-                    if abs(dpa[i]) > unc_pa:
-                        del img_match_in[i]
-                        del ref_match_in[i]
-                        del dpa[i]
+                mask = np.logical_not(np.abs(dpa) > unc_pa)
+                img_match_in = img_match_in[mask]
+                ref_match_in = ref_match_in[mask]
+                dpa = dpa[mask]
 
                 if len(img_match_in) < 2:
                     continue
 
-                mode_dpa = mode(dpa)
+                mode_dpa = mode(list(dpa))
 
                 # Remove deviant matches by PA
-                for i in range(len(img_match_in)-1, -1, -1):
-                    if abs(dpa[i] - mode_dpa) > pa_tolerance:
-                        del img_match_in[i]
-                        del ref_match_in[i]
-                        del dpa[i]
+                mask = np.logical_not(np.abs(dpa - mode_dpa) > pa_tolerance)
+                img_match_in = img_match_in[mask].tolist()
+                ref_match_in = ref_match_in[mask].tolist()
 
                 if len(img_match_in) < 2:
                     continue
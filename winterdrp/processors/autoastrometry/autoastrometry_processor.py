@@ -13,6 +13,8 @@ class AutoAstrometry(BaseImageProcessor):
 
     base_key = "autoastrometry"
 
+    allow_checkpoint = True
+
     def __init__(
             self,
             temp_output_sub_dir: str = "autoastrometry",
@@ -51,7 +53,7 @@ class AutoAstrometry(BaseImageProcessor):
 
             temp_path = os.path.join(sextractor_out_dir, header["BASENAME"])
             logger.info(sextractor_out_dir)
-            self.save_fits(data, header, temp_path)
+            self.save_fits(data, header, temp_path, track=False)
 
             run_autoastrometry_single(
                 img_path=temp_path,
@@ -9,12 +9,24 @@ import socket
 import getpass
 import datetime
 import hashlib
+import functools
+import pickle
 import pandas as pd
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from collections.abc import Callable
 
-from winterdrp.io import save_to_path, open_fits
+from winterdrp.io import save_to_path, open_fits, save_checkpoint, load_checkpoint, find_checkpoint, \
+    get_pixel_hash, get_header_hash, save_header_only, link_file, default_quantize_level
 from winterdrp.paths import cal_output_sub_dir, get_mask_path, latest_save_key, latest_mask_save_key, get_output_path,\
-    ProcessingError, base_name_key, proc_history_key
+    ProcessingError, base_name_key, proc_history_key, checkpoint_key, get_output_dir, cal_library_sub_dir, \
+    pixel_save_key, pixel_hash_key, header_hash_key, mask_hash_key
 from winterdrp.errors import ErrorReport
+from winterdrp.utils.execute_cmd import ExecutionError
+from winterdrp.calculate.combine import combine_images, default_block_mb
+from winterdrp.calibration_library import CalibrationLibrary, load_cached_master
+from winterdrp.data_quality import get_weight_map
+from winterdrp.monitor import get_resource_snapshot, get_usage_since, get_batch_size, record_bytes_read, \
+    record_bytes_written
 
 logger = logging.getLogger(__name__)
 
@@ -23,11 +35,52 @@ class PrerequisiteError(BaseException):
     pass
 
 
+def apply_to_batch(
+        processor,
+        batch
+) -> tuple:
+    """Apply a processor to a single batch, returning either the processed batch or the
+    ProcessingError which was raised, along with the resources used and the reports of any
+    individual images which failed (and were dropped from the batch). This is a module-level
+    function so that it can be dispatched to worker processes.
+
+    Parameters
+    ----------
+    processor: The processor to apply
+    batch: The batch to process
+
+    Returns
+    -------
+    A tuple of (processed batch or None, ProcessingError or None, resource usage dictionary,
+    list of ErrorReports for failed images)
+    """
+    n_in = get_batch_size(batch)
+    start = get_resource_snapshot()
+
+    processor.image_failures = []
+
+    try:
+        new_batch, err = processor.checkpoint_apply(batch), None
+    except ProcessingError as e:
+        new_batch, err = None, e
+        # The whole batch failed, so it is reported once rather than image by image
+        processor.image_failures = []
+
+    image_failures = processor.image_failures
+    processor.image_failures = []
+
+    usage = get_usage_since(start)
+    usage.update({"n_in": n_in, "n_out": get_batch_size(new_batch), "failed": err is not None})
+
+    return new_batch, err, usage, image_failures
+
+
 class ImageHandler:
     @staticmethod
     def open_fits(
             path: str
     ) -> tuple[np.ndarray, astropy.io.fits]:
+        record_bytes_read(path)
         return open_fits(path)
 
     @staticmethod
@@ -35,23 +88,129 @@ class ImageHandler:
             data,
             header,
             path: str,
+            track: bool = True,
+            compression: str = None,
+            quantize_level: float = default_quantize_level
     ):
+        """Save an image to path, optionally with tile compression (see winterdrp.io.save_to_path).
+        Unless track is False (e.g. for temporary files, which are deleted again), the header records
+        where the pixels were saved, and hashes of the pixels and header, so that unchanged images are
+        not saved again (see get_saved_path). Compressed files are not tracked, as they cannot be
+        passed to external tools or have their header rewritten in place."""
         if header is not None:
             header[latest_save_key] = path
+            if np.logical_and(track, compression is None):
+                header[pixel_save_key] = path
+                header[pixel_hash_key] = get_pixel_hash(data)
+                header[header_hash_key] = get_header_hash(header)
+            elif header.get(pixel_save_key, None) == path:
+                for key in [pixel_save_key, pixel_hash_key, header_hash_key]:
+                    header.remove(key, ignore_missing=True)
         logger.info(f"Saving to {path}")
-        save_to_path(data, header, path)
-
+        save_to_path(data, header, path, compression=compression, quantize_level=quantize_level)
+        record_bytes_written(path)
 
     def save_mask(
             self,
             data: np.ndarray,
             header: astropy.io.fits.Header,
-            img_path: str
+            img_path: str,
+            compression: str = None
     ) -> str:
-        mask = (~np.isnan(data)).astype(float)
+        """Save the weight map of an image (see winterdrp.data_quality.get_weight_map). Masks can
+        be compressed losslessly with 'GZIP_1', 'GZIP_2' or 'PLIO_1'."""
+        mask = get_weight_map(data)
         mask_path = get_mask_path(img_path)
         header[latest_mask_save_key] = mask_path
-        self.save_fits(mask, header, mask_path)
+        if compression is None:
+            header[mask_hash_key] = get_pixel_hash(data)
+        else:
+            header.remove(mask_hash_key, ignore_missing=True)
+        self.save_fits(mask, header, mask_path, track=False, compression=compression)
+        return mask_path
+
+    @staticmethod
+    def get_saved_path(
+            data: np.ndarray,
+            header: astropy.io.fits.Header,
+            match_header: bool = True,
+            pixel_hash: str = None
+    ) -> str | None:
+        """Get the path of a file to which these exact pixels were saved (and, if match_header is True,
+        with the same header apart from bookkeeping keys), or None if there is no such file.
+        The pixel hash can be passed in, if it has already been calculated."""
+        path = header.get(pixel_save_key, None)
+        if np.logical_or(path is None, not os.path.isfile(str(path))):
+            return None
+        if np.logical_and(match_header, header.get(header_hash_key, None) != get_header_hash(header)):
+            return None
+        if pixel_hash is None:
+            pixel_hash = get_pixel_hash(data)
+        if header.get(pixel_hash_key, None) != pixel_hash:
+            return None
+        return path
+
+    @staticmethod
+    def get_saved_mask_path(
+            data: np.ndarray,
+            header: astropy.io.fits.Header,
+            pixel_hash: str = None
+    ) -> str | None:
+        """Get the path of a saved mask which was made from these exact pixels, or None"""
+        path = header.get(latest_mask_save_key, None)
+        if np.logical_or(path is None, not os.path.isfile(str(path))):
+            return None
+        if pixel_hash is None:
+            pixel_hash = get_pixel_hash(data)
+        if header.get(mask_hash_key, None) != pixel_hash:
+            return None
+        return path
+
+    @staticmethod
+    def save_header(
+            header: astropy.io.fits.Header,
+            source_path: str,
+            path: str,
+            track: bool = True
+    ):
+        """Save an image whose pixels are unchanged since they were saved to source_path, by writing
+        only the new header (see winterdrp.io.save_header_only)"""
+        header[latest_save_key] = path
+        if track:
+            header[pixel_save_key] = path
+            header[header_hash_key] = get_header_hash(header)
+        logger.info(f"Saving header to {path}, with unchanged pixels from {source_path}")
+        n_bytes = save_header_only(header, source_path, path)
+        record_bytes_written(path, n_bytes=n_bytes)
+
+    def link_saved_image(
+            self,
+            data: np.ndarray,
+            header: astropy.io.fits.Header,
+            path: str
+    ):
+        """Provide an up-to-date copy of an image at path (e.g. a temporary file for an external tool),
+        hardlinking an existing file if the pixels and header are unchanged since it was saved"""
+        saved_path = self.get_saved_path(data, header)
+        if saved_path is None:
+            self.save_fits(data, header, path, track=False)
+        else:
+            logger.debug(f"Linking unchanged image {saved_path} to {path}")
+            link_file(saved_path, path)
+
+    def link_saved_mask(
+            self,
+            data: np.ndarray,
+            header: astropy.io.fits.Header,
+            img_path: str
+    ) -> str:
+        """As save_mask, but hardlinks an existing mask if it was made from the same pixels"""
+        saved_mask_path = self.get_saved_mask_path(data, header)
+        if saved_mask_path is None:
+            return self.save_mask(data, header, img_path)
+        mask_path = get_mask_path(img_path)
+        logger.debug(f"Linking unchanged mask {saved_mask_path} to {mask_path}")
+        link_file(saved_mask_path, mask_path)
         return mask_path
 
     @staticmethod
@@ -60,7 +219,86 @@ class ImageHandler:
         return hashlib.sha1(key.encode()).hexdigest()
 
 
+# Attributes which are set while running a pipeline, rather than configuring a processor
+runtime_attributes = [
+    "night", "night_sub_dir", "preceding_steps", "max_n_cpu", "pipeline_max_n_cpu", "batch_usage",
+    "checkpoint_dir", "checkpoint_config_hash", "image_failures"
+]
+
+
+def get_stable_repr(
+        value,
+        depth: int = 0
+) -> str:
+    """Get a representation of a value which is reproducible between runs (unlike the default
+    object repr, which includes a memory address). Used to hash processor configurations.
+
+    Parameters
+    ----------
+    value: Value to represent
+    depth: Current recursion depth
+
+    Returns
+    -------
+    String representation
+    """
+    if depth > 4:
+        return type(value).__qualname__
+    if isinstance(value, (str, int, float, bool, type(None))):
+        return repr(value)
+    if isinstance(value, np.ndarray):
+        return f"ndarray({hashlib.sha1(np.ascontiguousarray(value).view(np.uint8)).hexdigest()})"
+    if isinstance(value, (list, tuple)):
+        return "[" + ",".join([get_stable_repr(x, depth + 1) for x in value]) + "]"
+    if isinstance(value, dict):
+        return "{" + ",".join([
+            f"{get_stable_repr(k, depth + 1)}:{get_stable_repr(v, depth + 1)}"
+            for k, v in sorted(value.items(), key=lambda x: str(x[0]))
+        ]) + "}"
+    if isinstance(value, functools.partial):
+        return f"partial({get_stable_repr(value.func, depth + 1)},{get_stable_repr(value.args, depth + 1)}," \
+               f"{get_stable_repr(value.keywords, depth + 1)})"
+    if callable(value) and hasattr(value, "__qualname__"):
+        return f"{getattr(value, '__module__', '')}.{value.__qualname__}"
+    if hasattr(value, "__dict__"):
+        attributes = {k: v for k, v in vars(value).items() if k not in runtime_attributes}
+        return f"{type(value).__module__}.{type(value).__qualname__}({get_stable_repr(attributes, depth + 1)})"
+    return f"{type(value).__module__}.{type(value).__qualname__}"
+
+
+def get_dataframe_hash(
+        table: pd.DataFrame
+) -> str:
+    """Hash the contents of a dataframe. Object columns (e.g. BytesIO cutouts) are hashed via
+    their byte contents where available, so that the hash is reproducible between runs."""
+    table = table.copy()
+    for column in table.columns:
+        if table[column].dtype == object:
+            table[column] = [
+                x.getvalue() if hasattr(x, "getvalue") else str(x) for x in table[column]
+            ]
+    hashes = pd.util.hash_pandas_object(table, index=False).values
+    key = hashlib.sha1(hashes.tobytes())
+    key.update(",".join([str(x) for x in table.columns]).encode())
+    return key.hexdigest()
+
+
+def check_n_cpu(
+        max_n_cpu: int
+):
+    """Check that a maximum number of processes is a positive integer"""
+    if np.logical_or(not isinstance(max_n_cpu, (int, np.integer)), max_n_cpu < 1):
+        err = f"The maximum number of processes must be an integer of at least 1, not {max_n_cpu}"
+        logger.error(err)
+        raise ValueError(err)
+
+
 class BaseProcessor:
+    """Base class for all processors. With more than one CPU (see set_max_n_cpu), independent batches
+    are processed in worker processes, so a processor (and its attributes) must be picklable: use
+    module-level functions or functools.partial rather than lambdas or closures. A processor which
+    cannot be pickled falls back to processing its batches one at a time, with an error in the log.
+    """
 
     @property
     def base_key(self):
@@ -68,15 +306,42 @@ class BaseProcessor:
 
     subclasses = {}
 
+    # Processors which must see every batch at once (e.g. to regroup images between batches)
+    # act as barriers when the pipeline is run in streaming mode
+    requires_all_batches = False
+
+    # Whether the output of this processor can be stored and reused by the checkpoint cache.
+    # Processors opt in, and only should if their output is entirely contained in the returned batch,
+    # so that skipping them on a re-run loses nothing (e.g. no logs, database rows or alerts).
+    allow_checkpoint = False
+
+    # Header keys recording the paths of files written by this processor (e.g. catalogs). A stored
+    # checkpoint is only reused if all of these files still exist.
+    checkpoint_file_keys = []
+
+    # Processors which only regroup or filter images using their headers, without reading pixels or
+    # modifying headers. Header-based image selection can be moved ahead of these steps.
+    header_only = False
+
     def __init__(
             self,
             *args,
+            max_n_cpu: int = None,
             **kwargs
     ):
 
         self.night = None
         self.night_sub_dir = None
         self.preceding_steps = None
+        if max_n_cpu is not None:
+            check_n_cpu(max_n_cpu)
+        self.max_n_cpu = max_n_cpu
+        self.pipeline_max_n_cpu = 1
+        self.batch_usage = []
+        self.checkpoint_dir = None
+        self.checkpoint_config_hash = None
+        self.working_dtype = np.dtype(np.float64)
+        self.image_failures = []
 
     @classmethod
     def __init_subclass__(cls, **kwargs):
@@ -96,6 +361,129 @@ class BaseProcessor:
         self.night_sub_dir = night_sub_dir
         self.night = night_sub_dir.split("/")[-1]
 
+    def set_max_n_cpu(
+            self,
+            max_n_cpu: int = 1
+    ):
+        check_n_cpu(max_n_cpu)
+        self.pipeline_max_n_cpu = max_n_cpu
+
+    def get_max_n_cpu(self) -> int:
+        if self.max_n_cpu is not None:
+            return self.max_n_cpu
+        return self.pipeline_max_n_cpu
+
+    def get_n_threads_per_process(self) -> int:
+        """Number of threads each batch process can use, if the CPUs are shared between the
+        processes used for batches"""
+        return max(1, os.cpu_count() // self.get_max_n_cpu())
+
+    def set_working_dtype(
+            self,
+            working_dtype: str | np.dtype = np.float64
+    ):
+        """Set the floating point precision used for image data held in memory"""
+        self.working_dtype = np.dtype(working_dtype)
+
+    def set_checkpoint_dir(
+            self,
+            checkpoint_dir: str = None
+    ):
+        """Enable (or, with None, disable) the checkpoint cache. The processor configuration is
+        hashed at this point, before any batches are processed, so that state acquired while
+        running does not change the checkpoint keys."""
+        self.checkpoint_dir = checkpoint_dir
+        self.checkpoint_config_hash = self.get_config_hash()
+
+    def get_config_hash(self) -> str:
+        config = get_stable_repr(self)
+        return hashlib.sha1(config.encode()).hexdigest()
+
+    def get_batch_identity(
+            self,
+            batch
+    ) -> str:
+        """Identify the input batch for the checkpoint cache. For image batches, this is the
+        BASENAME and CALSTEPS of each image, along with the checkpoint key of the step which
+        produced it (so that changing the configuration of an earlier step invalidates later ones)."""
+        if isinstance(batch, pd.DataFrame):
+            return get_dataframe_hash(batch)
+
+        [_, headers] = batch
+        return "".join([
+            x[base_name_key] + x[proc_history_key] + str(x.get(checkpoint_key, "")) for x in headers
+        ])
+
+    def get_checkpoint_key(
+            self,
+            batch
+    ) -> str:
+        key = "_".join([
+            f"{self.__class__.__module__}.{self.__class__.__qualname__}",
+            self.checkpoint_config_hash,
+            self.get_batch_identity(batch)
+        ])
+        return hashlib.sha1(key.encode()).hexdigest()
+
+    def checkpoint_apply(
+            self,
+            batch
+    ):
+        """Apply the processor to a batch, but first check the checkpoint cache (if enabled)
+        for the output of an identical previous run, and use that instead."""
+
+        if np.logical_or(self.checkpoint_dir is None, not self.allow_checkpoint):
+            return self.apply(batch)
+
+        key = self.get_checkpoint_key(batch)
+
+        checkpoint_path = os.path.join(self.checkpoint_dir, f"{self.__class__.__name__}_{key}")
+
+        existing_path = find_checkpoint(checkpoint_path)
+
+        if existing_path is not None:
+            logger.info(f"Loading checkpoint for {self.__class__.__name__} from {existing_path}")
+            checkpoint_batch = load_checkpoint(existing_path)
+            if self.check_checkpoint_files(checkpoint_batch):
+                return checkpoint_batch
+            logger.info(f"Files written by {self.__class__.__name__} are missing, so the checkpoint "
+                        f"{existing_path} cannot be used. Reprocessing the batch.")
+
+        new_batch = self.apply(batch)
+
+        # Do not store a batch with failed images, so that those images are retried next time
+        if len(self.image_failures) > 0:
+            return new_batch
+
+        if not isinstance(new_batch, pd.DataFrame):
+            for header in new_batch[1]:
+                header[checkpoint_key] = key
+
+        try:
+            os.makedirs(self.checkpoint_dir)
+        except OSError:
+            pass
+
+        logger.debug(f"Saving checkpoint for {self.__class__.__name__} to {checkpoint_path}")
+        save_checkpoint(new_batch, checkpoint_path)
+
+        return new_batch
+
+    def check_checkpoint_files(
+            self,
+            batch
+    ) -> bool:
+        """Check that every file recorded (under checkpoint_file_keys) in the headers of a stored batch
+        still exists"""
+        if np.logical_or(isinstance(batch, pd.DataFrame), len(self.checkpoint_file_keys) == 0):
+            return True
+
+        for header in batch[1]:
+            for key in self.checkpoint_file_keys:
+                if key in header and not os.path.exists(header[key]):
+                    return False
+        return True
+
     @staticmethod
     def update_batches(
         batches: list
@@ -115,13 +503,32 @@ class BaseProcessor:
         passed_batches = []
         failures = []
 
-        for i, batch in enumerate(batches):
+        n_cpu = min(self.get_max_n_cpu(), len(batches))
 
-            try:
-                batch = self.apply(batch)
-                passed_batches.append(batch)
-            except ProcessingError as e:
-                err = ErrorReport(e, self.__module__, batch)
+        if np.logical_and(n_cpu > 1, not self.is_picklable()):
+            n_cpu = 1
+
+        if n_cpu > 1:
+            logger.debug(f"Applying {self.__class__} to {len(batches)} batches using {n_cpu} processes")
+            with ProcessPoolExecutor(max_workers=n_cpu) as executor:
+                results = list(executor.map(functools.partial(apply_to_batch, self), batches))
+        else:
+            results = [apply_to_batch(self, batch) for batch in batches]
+
+        self.batch_usage = []
+
+        for i, (new_batch, e, usage, image_failures) in enumerate(results):
+
+            self.batch_usage.append({"batch": i, **usage})
+
+            for err in image_failures:
+                logger.error(err.generate_log_message())
+                failures.append(err)
+
+            if e is None:
+                passed_batches.append(new_batch)
+            else:
+                err = ErrorReport(e, self.__module__, batches[i])
                 logger.error(err.generate_log_message())
                 failures.append(err)
 
@@ -129,9 +536,83 @@ class BaseProcessor:
 
         return batches, failures
 
+    def is_picklable(self) -> bool:
+        """Check whether the processor can be sent to worker processes"""
+        try:
+            pickle.dumps(self)
+        except (pickle.PicklingError, TypeError, AttributeError) as e:
+            logger.error(f"{self.__class__.__name__} cannot be pickled for worker processes ({e}), "
+                         f"so its batches will be processed one at a time. Avoid lambdas and closures "
+                         f"in processor arguments to process batches in parallel.")
+            return False
+        return True
+
     def apply(self, batch):
         raise NotImplementedError
 
+    def record_image_failure(
+            self,
+            error: Exception,
+            header: astropy.io.fits.Header
+    ):
+        """Record the failure of a single image, which has been dropped from its batch"""
+        self.image_failures.append(ErrorReport(error, self.__module__, [[None], [header]]))
+
+    def map_images(
+            self,
+            func: Callable[[int], object],
+            headers: list[astropy.io.fits.Header],
+            n_threads: int = 1
+    ) -> tuple[list[int], list]:
+        """
+        Run func(i) for the index i of each image in a batch, with up to n_threads calls at once.
+        This is intended for wrappers of external tools, which spend most of their time waiting on
+        a subprocess. An image for which func raises a ProcessingError or ExecutionError is recorded
+        as a failure (see record_image_failure), rather than failing the whole batch.
+
+        Parameters
+        ----------
+        func: Function to call with the index of each image
+        headers: Headers of the batch
+        n_threads: Maximum number of simultaneous calls (default: 1, i.e. one image at a time)
+
+        Returns
+        -------
+        The indices of the images which succeeded, and the corresponding results (in order)
+        """
+        def run(i):
+            try:
+                return func(i), None
+            except (ProcessingError, ExecutionError) as e:
+                return None, e
+
+        n_threads = min(n_threads, len(headers))
+
+        if n_threads > 1:
+            logger.debug(f"Running {self.__class__.__name__} on {len(headers)} images with {n_threads} threads")
+            with ThreadPoolExecutor(max_workers=n_threads) as executor:
+                outputs = list(executor.map(run, range(len(headers))))
+        else:
+            outputs = [run(i) for i in range(len(headers))]
+
+        passed, results, errors = [], [], []
+
+        for i, (result, e) in enumerate(outputs):
+            if e is None:
+                passed.append(i)
+                results.append(result)
+            else:
+                errors.append(e)
+                self.record_image_failure(e, headers[i])
+
+        if np.logical_and(len(passed) == 0, len(errors) > 0):
+            err = f"{self.__class__.__name__} failed for all {len(errors)} images in the batch: " \
+                  f"{[str(x) for x in errors]}"
+            logger.error(err)
+            raise ProcessingError(err)
+
+        return passed, results
+
 
 class BaseImageProcessor(BaseProcessor, ImageHandler, ABC):
 
@@ -169,12 +650,21 @@ class BaseImageProcessor(BaseProcessor, ImageHandler, ABC):
 
 class ProcessorWithCache(BaseImageProcessor, ABC):
 
+    # Metadata ('filter' and/or 'exptime') which a master frame from the calibration library
+    # must share with the images being calibrated. The detector must always match.
+    library_match_keys = []
+
     def __init__(
             self,
             try_load_cache: bool = True,
             write_to_cache: bool = True,
             overwrite: bool = True,
             cache_sub_dir: str = cal_output_sub_dir,
+            combine_method: str = "median",
+            combine_n_threads: int = None,
+            combine_block_mb: float = default_block_mb,
+            use_library: bool = True,
+            max_library_age_days: float = 30.,
             *args,
             **kwargs
     ):
@@ -183,6 +673,78 @@ class ProcessorWithCache(BaseImageProcessor, ABC):
         self.write_to_cache = write_to_cache
         self.overwrite = overwrite
         self.cache_sub_dir = cache_sub_dir
+        self.combine_method = combine_method
+        self.combine_n_threads = combine_n_threads
+        self.combine_block_mb = combine_block_mb
+        self.use_library = use_library
+        self.max_library_age_days = max_library_age_days
+
+    def select_cache_images(
+            self,
+            images: list[np.ndarray],
+            headers: list[astropy.io.fits.Header],
+    ) -> tuple[list[np.ndarray], list[astropy.io.fits.Header]]:
+        return images, headers
+
+    def get_library(self) -> CalibrationLibrary:
+        """The calibration library is shared by all nights of a pipeline"""
+        pipeline_sub_dir = os.path.dirname(self.night_sub_dir)
+        return CalibrationLibrary(get_output_dir(cal_library_sub_dir, sub_dir=pipeline_sub_dir))
+
+    def find_library_master(
+            self,
+            images: list[np.ndarray],
+            headers: list[astropy.io.fits.Header],
+    ) -> str | None:
+        """Search the calibration library for a master frame. If the batch contains calibration frames,
+        only a master built from exactly those frames is used. Otherwise, the nearest valid master in
+        time is used."""
+        _, cal_headers = self.select_cache_images(images, headers)
+
+        library = self.get_library()
+
+        if len(cal_headers) > 0:
+            return library.find_by_hash(self.base_key, self.get_hash(cal_headers))
+
+        logger.info(f"No {self.base_key} frames found in batch. "
+                    f"Searching the calibration library for the nearest master frame.")
+
+        path = library.find_nearest(
+            self.base_key,
+            headers,
+            match_keys=self.library_match_keys,
+            max_age_days=self.max_library_age_days
+        )
+
+        if path is None:
+            err = f"No {self.base_key} frames were found, and the calibration library has no valid " \
+                  f"{self.base_key} master within {self.max_library_age_days} days."
+            logger.error(err)
+            raise ProcessingError(err)
+
+        return path
+
+    def add_library_master(
+            self,
+            path: str,
+            images: list[np.ndarray],
+            headers: list[astropy.io.fits.Header],
+    ):
+        _, cal_headers = self.select_cache_images(images, headers)
+        self.get_library().add_master(
+            path,
+            cal_type=self.base_key,
+            input_hash=self.get_hash(cal_headers),
+            headers=cal_headers
+        )
+
+    def load_master(
+            self,
+            path: str
+    ) -> tuple[np.ndarray, astropy.io.fits.Header]:
+        """Load a master frame via the in-memory cache, returning copies which are safe to modify"""
+        image, header = load_cached_master(path, self.open_fits)
+        return image.astype(self.working_dtype, copy=True), header.copy()
 
     def get_cache_path(
             self,
@@ -224,15 +786,21 @@ class ProcessorWithCache(BaseImageProcessor, ABC):
 
         if np.logical_and(self.try_load_cache, exists):
             logger.info(f"Loading cached file {path}")
-            return self.open_fits(path)
+            return self.load_master(path)
 
-        else:
+        if np.logical_and(self.try_load_cache, self.use_library):
+            library_path = self.find_library_master(images, headers)
+            if library_path is not None:
+                logger.info(f"Using master frame {library_path} from the calibration library")
+                return self.load_master(library_path)
 
-            image, header = self.make_image(images, headers)
+        image, header = self.make_image(images, headers)
 
-            if self.write_to_cache:
-                if np.sum([not exists, self.overwrite]) > 0:
-                    self.save_fits(image, header, path)
+        if self.write_to_cache:
+            if np.sum([not exists, self.overwrite]) > 0:
+                self.save_fits(image, header, path)
+                if self.use_library:
+                    self.add_library_master(path, images, headers)
 
         return image, header
 
@@ -243,6 +811,26 @@ class ProcessorWithCache(BaseImageProcessor, ABC):
     ) -> tuple[np.ndarray, astropy.io.fits.Header]:
         raise NotImplementedError
 
+    def combine_images(
+            self,
+            images: list[np.ndarray],
+            scales: list[float] = None,
+    ) -> np.ndarray:
+        """Combine images with the tiled combine engine (see winterdrp.calculate.combine.combine_images).
+        By default, the CPUs are shared between the processes used for batches."""
+        n_threads = self.combine_n_threads
+        if n_threads is None:
+            n_threads = self.get_n_threads_per_process()
+
+        return combine_images(
+            images,
+            method=self.combine_method,
+            scales=scales,
+            dtype=self.working_dtype,
+            n_threads=n_threads,
+            max_block_mb=self.combine_block_mb
+        )
+
 
 class BaseCandidateGenerator(BaseProcessor, ImageHandler, ABC):
 
@@ -20,6 +20,9 @@ class BiasCalibrator(ProcessorWithCache):
 
     base_key = "bias"
 
+    allow_checkpoint = True
+    checkpoint_file_keys = [bias_frame_key]
+
     def __init__(
             self,
             select_bias_images: Callable[[list, list], [list, list]] = default_select_bias,
@@ -53,14 +56,7 @@ class BiasCalibrator(ProcessorWithCache):
 
         n_frames = len(images)
 
-        nx, ny = images[0].shape
-
-        biases = np.zeros((nx, ny, n_frames))
-
-        for i, img in enumerate(images):
-            biases[:, :, i] = img
-
-        logger.info(f'Median combining {n_frames} biases')
-        master_bias = np.nanmedian(biases, axis=2)
+        logger.info(f'Combining {n_frames} biases ({self.combine_method})')
+        master_bias = self.combine_images(images)
 
         return master_bias, headers[0]
\ No newline at end of file
@@ -11,6 +11,8 @@ class FilterCandidates(BaseDataframeProcessor):
 
     base_key = "filter"
 
+    allow_checkpoint = True
+
     def __init__(self,
                  *args,
                  **kwargs):
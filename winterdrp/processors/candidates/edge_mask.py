@@ -17,6 +17,8 @@ class EdgeCandidatesMask(BaseDataframeProcessor):
 
     base_key = "egdemask"
 
+    allow_checkpoint = True
+
     def __init__(
             self,
             edge_boundary_size: float,
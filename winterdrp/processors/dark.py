@@ -24,6 +24,10 @@ class DarkCalibrator(ProcessorWithCache):
     base_name = "master_dark"
     base_key = "dark"
 
+    allow_checkpoint = True
+
+    library_match_keys = ["exptime"]
+
     def __init__(
             self,
             select_cache_images: Callable[[list, list], [list, list]] = default_select_flat,
@@ -58,15 +62,9 @@ class DarkCalibrator(ProcessorWithCache):
 
         n_frames = len(images)
 
-        nx, ny = images[0].shape
-
-        darks = np.zeros((nx, ny, n_frames))
-
-        for i, img in enumerate(images):
-            dark_exptime = headers[i]['EXPTIME']
-            darks[:, :, i] = img / dark_exptime
+        dark_exptimes = [x['EXPTIME'] for x in headers]
 
-        logger.info(f'Median combining {n_frames} darks')
-        master_dark = np.nanmedian(darks, axis=2)
+        logger.info(f'Combining {n_frames} darks ({self.combine_method})')
+        master_dark = self.combine_images(images, scales=dark_exptimes)
 
         return master_dark, headers[0]
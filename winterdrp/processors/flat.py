@@ -6,6 +6,7 @@ from winterdrp.processors.base_processor import ProcessorWithCache
 from winterdrp.processors.utils.image_selector import select_from_images
 from collections.abc import Callable
 from winterdrp.paths import latest_save_key, flat_frame_key
+from winterdrp.data_quality import set_dq_flags, dq_flat_nan
 
 logger = logging.getLogger(__name__)
 
@@ -21,6 +22,11 @@ class FlatCalibrator(ProcessorWithCache):
 
     base_key = "flat"
 
+    allow_checkpoint = True
+    checkpoint_file_keys = [flat_frame_key]
+
+    library_match_keys = ["filter"]
+
     def __init__(
             self,
             x_min: int = 0,
@@ -58,6 +64,9 @@ class FlatCalibrator(ProcessorWithCache):
 
             data = data / master_flat
 
+            if np.sum(mask) > 0:
+                data = set_dq_flags(data, mask, dq_flat_nan)
+
             header[flat_frame_key] = master_flat_header[latest_save_key]
             images[i] = data
             headers[i] = header
@@ -73,16 +82,10 @@ class FlatCalibrator(ProcessorWithCache):
 
         n_frames = len(images)
 
-        nx, ny = images[0].shape
-
-        flats = np.zeros((nx, ny, n_frames))
-
-        for i, img in enumerate(images):
-            median = np.nanmedian(img[self.x_min:self.x_max, self.y_min:self.y_max])
-            flats[:, :, i] = img / median
+        medians = [np.nanmedian(img[self.x_min:self.x_max, self.y_min:self.y_max]) for img in images]
 
-        logger.info(f'Median combining {n_frames} flats')
-        master_flat = np.nanmedian(flats, axis=2)
+        logger.info(f'Combining {n_frames} flats ({self.combine_method})')
+        master_flat = self.combine_images(images, scales=medians)
 
         return master_flat, headers[0]
 
@@ -2,6 +2,8 @@ import astropy.io.fits
 import numpy as np
 import logging
 from winterdrp.processors.base_processor import BaseImageProcessor
+from winterdrp.data_quality import set_dq_flags, dq_masked, dq_saturated
+from winterdrp.paths import saturate_key
 
 logger = logging.getLogger(__name__)
 
@@ -13,6 +15,8 @@ class MaskPixels(BaseImageProcessor):
 
     base_key = "mask"
 
+    allow_checkpoint = True
+
     def __init__(
             self,
             mask_path: str,
@@ -40,6 +44,15 @@ class MaskPixels(BaseImageProcessor):
 
             mask = mask != 0
 
+            data = data.astype(self.working_dtype, copy=False)
+            data = set_dq_flags(data, mask, dq_masked)
+
+            # Raw pixels at or above the saturation level of the detector (if known)
+            if saturate_key in header:
+                saturated = np.asarray(data) >= float(header[saturate_key])
+                if np.sum(saturated) > 0:
+                    data = set_dq_flags(data, saturated, dq_saturated)
+
             data[mask] = mask_value
             images[i] = data
             headers[i] = header
@@ -7,9 +7,8 @@ from winterdrp.paths import get_output_dir, copy_temp_file
 from collections.abc import Callable
 from winterdrp.catalog.base_catalog import BaseCatalog
 from winterdrp.processors.astromatic.sextractor.sextractor import Sextractor, sextractor_header_key
-from winterdrp.utils.ldac_tools import get_table_from_ldac
-from astropy.coordinates import SkyCoord
-import astropy.units as u
+from winterdrp.utils.ldac_tools import get_table_from_ldac, get_ldac_columns
+from winterdrp.calculate.crossmatch import SkyIndex
 from winterdrp.errors import ProcessorError
 from astropy.stats import sigma_clip, sigma_clipped_stats
 
@@ -31,6 +30,8 @@ REQUIRED_PARAMETERS = [
 class PhotCalibrator(BaseImageProcessor):
     base_key = 'photcalibrator'
 
+    allow_checkpoint = True
+
     def __init__(self,
                  ref_catalog_generator: Callable[[astropy.io.fits.Header], BaseCatalog],
                  temp_output_sub_dir: str = "phot",
@@ -70,8 +71,6 @@ class PhotCalibrator(BaseImageProcessor):
             logger.error(err)
             raise ProcessorError(err)
 
-        ref_coords = SkyCoord(ra=ref_cat['ra'], dec=ref_cat['dec'], unit=(u.deg, u.deg))
-
         clean_mask = (img_cat['FLAGS'] == 0) & \
                      (img_cat['FWHM_WORLD'] < self.fwhm_threshold_arcsec / 3600.) & \
                      (img_cat['X_IMAGE'] > self.x_lower_limit) & \
@@ -82,16 +81,15 @@ class PhotCalibrator(BaseImageProcessor):
         clean_img_cat = img_cat[clean_mask]
         logger.debug(f'Found {len(clean_img_cat)} clean sources in image.')
 
-        clean_img_coords = SkyCoord(ra=clean_img_cat['ALPHAWIN_J2000'], dec=clean_img_cat['DELTAWIN_J2000'],
-                                    unit=(u.deg, u.deg))
+        clean_img_index = SkyIndex(clean_img_cat['ALPHAWIN_J2000'], clean_img_cat['DELTAWIN_J2000'])
 
-        if 0 == len(clean_img_coords):
+        if 0 == len(clean_img_index):
             err = 'No clean sources found in image'
             logger.error(err)
             raise ProcessorError(err)
 
-        idx, d2d, d3d = ref_coords.match_to_catalog_sky(clean_img_coords)
-        match_mask = d2d < 1.0 * u.arcsec
+        idx, d2d_arcsec = clean_img_index.match_nearest(ref_cat['ra'], ref_cat['dec'])
+        match_mask = d2d_arcsec < 1.0
         matched_ref_cat = ref_cat[match_mask]
         matched_img_cat = clean_img_cat[idx[match_mask]]
         logger.info(f'Cross-matched {len(matched_img_cat)} sources from catalog to the image.')
@@ -172,13 +170,13 @@ class PhotCalibrator(BaseImageProcessor):
 
     @staticmethod
     def get_fwhm(img_cat_path):
-        imcat = get_table_from_ldac(img_cat_path)
+        imcat = get_ldac_columns(img_cat_path, ['X_IMAGE', 'Y_IMAGE', 'FWHM_WORLD'])
         nemask = (imcat['X_IMAGE'] > 50) & (imcat['X_IMAGE'] < 2000) & (imcat['Y_IMAGE'] > 50) & (
                     imcat['Y_IMAGE'] < 2000)
-        imcat = imcat[nemask]
-        med_fwhm = np.median(imcat['FWHM_WORLD'])
-        mean_fwhm = np.mean(imcat['FWHM_WORLD'])
-        std_fwhm = np.std(imcat['FWHM_WORLD'])
+        fwhm = imcat['FWHM_WORLD'][nemask]
+        med_fwhm = np.median(fwhm)
+        mean_fwhm = np.mean(fwhm)
+        std_fwhm = np.std(fwhm)
         return med_fwhm, mean_fwhm, std_fwhm
 
     def get_sextractor_module(self) -> Sextractor:
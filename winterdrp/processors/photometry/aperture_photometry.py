@@ -2,7 +2,7 @@ from winterdrp.processors.base_processor import BaseDataframeProcessor
 import pandas as pd
 import numpy as np
 from astropy.io import fits
-from winterdrp.processors.photometry.utils import make_cutouts
+from winterdrp.processors.photometry.utils import get_candidate_cutouts
 import matplotlib.pyplot as plt
 from astropy.stats import sigma_clipped_stats
 from matplotlib.patches import Circle
@@ -85,6 +85,16 @@ class AperturePhotometry(BaseDataframeProcessor):
             self,
             candidate_table: pd.DataFrame,
     ) -> pd.DataFrame:
+        x_images = np.array(candidate_table['X_IMAGE'], dtype=int) - 1
+        y_images = np.array(candidate_table['Y_IMAGE'], dtype=int) - 1
+
+        diff_cutouts = get_candidate_cutouts(
+            candidate_table['diffimname'], x_images, y_images, self.cutout_size_aper_phot
+        )
+        diff_unc_cutouts = get_candidate_cutouts(
+            candidate_table['diffuncname'], x_images, y_images, self.cutout_size_aper_phot
+        )
+
         for ind, aper_diam in enumerate(self.aper_diameters):
             bkg_in_diameter = self.bkg_in_diameters[ind]
             bkg_out_diameter = self.bkg_out_diameters[ind]
@@ -93,16 +103,8 @@ class AperturePhotometry(BaseDataframeProcessor):
             fluxes, fluxuncs = [], []
 
             for cand_ind in range(len(candidate_table)):
-                row = candidate_table.iloc[cand_ind]
-                ximage, yimage = int(row['X_IMAGE'])-1, int(row['Y_IMAGE'])-1
-                diff_filename = row['diffimname']
-                diff_psf_filename = row['diffpsfname']
-                diff_unc_filename = row['diffuncname']
-                diff_cutout = make_cutouts(diff_filename, (ximage, yimage), self.cutout_size_aper_phot)
-                diff_unc_cutout = make_cutouts(diff_unc_filename, (ximage, yimage), self.cutout_size_aper_phot)
-
-                flux, fluxunc = self.aperture_photometry(diff_cutout, diff_unc_cutout, aper_diam, bkg_in_diameter,
-                                                         bkg_out_diameter)
+                flux, fluxunc = self.aperture_photometry(diff_cutouts[cand_ind], diff_unc_cutouts[cand_ind],
+                                                         aper_diam, bkg_in_diameter, bkg_out_diameter)
                 fluxes.append(flux)
                 fluxuncs.append(fluxunc)
             candidate_table[f'fluxap{suffix}'] = fluxes
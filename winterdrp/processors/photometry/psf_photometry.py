@@ -2,7 +2,7 @@ from winterdrp.processors.base_processor import BaseDataframeProcessor
 import pandas as pd
 import numpy as np
 from astropy.io import fits
-from winterdrp.processors.photometry.utils import make_cutouts
+from winterdrp.processors.photometry.utils import get_candidate_cutouts
 
 
 class PSFPhotometry(BaseDataframeProcessor):
@@ -73,16 +73,27 @@ class PSFPhotometry(BaseDataframeProcessor):
     ) -> pd.DataFrame:
         fluxes, fluxuncs, minchi2s, xshifts, yshifts = [], [], [], [], []
 
+        diff_cutouts = get_candidate_cutouts(
+            candidate_table['diffimname'], candidate_table['xpeak'], candidate_table['ypeak'],
+            self.cutout_size_psf_phot
+        )
+        diff_unc_cutouts = get_candidate_cutouts(
+            candidate_table['diffuncname'], candidate_table['xpeak'], candidate_table['ypeak'],
+            self.cutout_size_psf_phot
+        )
+
+        # The shifted PSF models only depend on the PSF file, which is shared by all candidates of an image
+        all_psfmodels = {}
+
         for ind in range(len(candidate_table)):
             row = candidate_table.iloc[ind]
-            xpeak, ypeak = row['xpeak'], row['ypeak']
-            diff_filename = row['diffimname']
             diff_psf_filename = row['diffpsfname']
-            diff_unc_filename = row['diffuncname']
-            diff_cutout = make_cutouts(diff_filename, (xpeak, ypeak), self.cutout_size_psf_phot)
-            diff_unc_cutout = make_cutouts(diff_unc_filename, (xpeak, ypeak), self.cutout_size_psf_phot)
-            psfmodels = self.make_psf_shifted_array(diff_psf_filename, self.cutout_size_psf_phot)
-            flux, fluxunc, minchi2, xshift, yshift = self.psf_photometry(diff_cutout, diff_unc_cutout,
+            if diff_psf_filename not in all_psfmodels:
+                all_psfmodels[diff_psf_filename] = self.make_psf_shifted_array(
+                    diff_psf_filename, self.cutout_size_psf_phot
+                )
+            psfmodels = all_psfmodels[diff_psf_filename]
+            flux, fluxunc, minchi2, xshift, yshift = self.psf_photometry(diff_cutouts[ind], diff_unc_cutouts[ind],
                                                                          psfmodels)
             fluxes.append(flux)
             fluxuncs.append(fluxunc)
@@ -90,7 +101,6 @@ class PSFPhotometry(BaseDataframeProcessor):
             xshifts.append(xshift)
             yshifts.append(yshift)
 
-
         candidate_table['psf_flux'] = fluxes
         candidate_table['psf_fluxunc'] = fluxuncs
         candidate_table['chipsf'] = minchi2s
@@ -1,6 +1,7 @@
-from astropy.io import fits
 import numpy as np
+import pandas as pd
 import logging
+from winterdrp.utils.cutouts import make_cutouts as make_batch_cutouts
 
 logger = logging.getLogger(__name__)
 
@@ -10,42 +11,37 @@ def make_cutouts(
         position,
         half_size
 ):
-    data = fits.getdata(image_path)
-    y_image_size, x_image_size = np.shape(data)
-    x, y = position
-    # logger.debug(f'{x},{y},{np.shape(data)}')
-    if np.logical_and(x < half_size,y < half_size):
-        cutout = data[0:y+half_size+1, 0:x+half_size+1]
-        n_xpix = half_size-y
-        n_ypix = half_size-x
-        cutout = np.pad(cutout, ((n_ypix, 0), (n_xpix, 0)), 'constant')
-
-    elif np.logical_and(x+half_size+1 > x_image_size, y+half_size+1 > y_image_size):
-        cutout = data[y - half_size: y_image_size, x-half_size, x_image_size]
-        n_xpix = (half_size+x+1) - x_image_size
-        n_ypix = (half_size+y+1) - y_image_size
-        cutout = np.pad(cutout, ((0, n_ypix), (0, n_xpix)), 'constant')
-
-    elif y < half_size:
-        logger.info(f'Cutout parameters are {y + half_size + 1}, {x - half_size}, {x + half_size + 1},{y_image_size},'
-                    f'{x_image_size}')
-        cutout = data[0:y + half_size + 1, x - half_size:x + half_size + 1]
-        n_pix = half_size - y
-        cutout = np.pad(cutout, ((n_pix, 0), (0, 0)), 'constant')
-
-    elif y + half_size + 1 > y_image_size:
-        cutout = data[y - half_size: y_image_size, x - half_size: x + half_size + 1]
-        n_pix = (half_size + y + 1) - y_image_size
-        cutout = np.pad(cutout, ((0, n_pix), (0, 0)), 'constant')
-
-    elif x < half_size:
-        cutout = data[y - half_size: y + half_size + 1, 0:x + half_size + 1]
-        n_pix = half_size - x
-        cutout = np.pad(cutout, ((0, 0), (n_pix, 0)), 'constant')
-    elif x + half_size > x_image_size:
-        cutout = data[y - half_size:y + half_size + 1, x - half_size:x_image_size]
-        n_pix = (half_size + x + 1) - x_image_size
-        cutout = np.pad(cutout, ((0, 0), (0, n_pix)), 'constant')
-    else:
-        cutout = data[y - half_size:y + half_size + 1, x - half_size:x + half_size + 1]
-    return cutout
+    """Make a single zero-padded cutout of an image (see get_candidate_cutouts for many at once)"""
+    return make_batch_cutouts(image_path, [position], half_size)[0]
+
+
+def get_candidate_cutouts(
+        image_paths: list[str] | np.ndarray,
+        x_positions: list[int] | np.ndarray,
+        y_positions: list[int] | np.ndarray,
+        half_size: int,
+) -> np.ndarray:
+    """Make a cutout around each candidate, from the image at the corresponding path. The cutouts of all
+    candidates from the same image are extracted together, so each image is only read once.
+
+    Parameters
+    ----------
+    image_paths: Path of the image for each candidate
+    x_positions: Integer (0-indexed) x pixel position of each candidate
+    y_positions: Integer (0-indexed) y pixel position of each candidate
+    half_size: Half the side of each cutout, in pixels
+
+    Returns
+    -------
+    Array of cutouts, in the same order as the candidates
+    """
+    positions = np.column_stack([np.array(x_positions, dtype=int), np.array(y_positions, dtype=int)])
+    image_paths = np.array(image_paths)
+
+    cutouts = np.zeros((len(image_paths), 2 * int(half_size) + 1, 2 * int(half_size) + 1))
+
+    for image_path in pd.unique(image_paths):
+        mask = image_paths == image_path
+        cutouts[mask] = make_batch_cutouts(image_path, positions[mask], half_size)
+
+    return cutouts
@@ -7,40 +7,226 @@ from collections.abc import Callable
 from astropy.time import Time
 from winterdrp.processors.base_processor import ProcessorWithCache
 from winterdrp.processors.flat import SkyFlatCalibrator
-from winterdrp.paths import cal_output_dir, saturate_key
+from winterdrp.paths import cal_output_dir, saturate_key, ProcessingError
+from winterdrp.calibration_library import get_obs_mjd
 
 logger = logging.getLogger(__name__)
 
 
+class RollingSkyWindow:
+    """
+    Window of sky frames, kept sorted independently for each pixel, so that frames can be added or
+    evicted one at a time and the per-pixel median read off directly. NaN pixels are stored as +inf
+    (sorting after every valid value), with a count of valid values per pixel.
+    """
+
+    def __init__(
+            self,
+            shape: tuple,
+            max_size: int,
+            dtype: np.dtype = np.float64
+    ):
+        self.shape = shape
+        self.values = np.full((max_size, int(np.prod(shape))), np.inf, dtype=dtype)
+        self.n_valid = np.zeros(self.values.shape[1], dtype=int)
+        self.rows = np.arange(max_size)[:, None]
+        self.columns = np.arange(self.values.shape[1])
+
+    def prepare_frame(
+            self,
+            frame: np.ndarray
+    ) -> np.ndarray:
+        frame = np.array(frame, dtype=self.values.dtype).ravel()
+        frame[np.isnan(frame)] = np.inf
+        return frame
+
+    def add(
+            self,
+            frame: np.ndarray
+    ):
+        frame = self.prepare_frame(frame)
+        position = np.sum(self.values < frame, axis=0)
+        self.values[1:] = np.where(self.rows[1:] > position, self.values[:-1], self.values[1:])
+        self.values[position, self.columns] = frame
+        self.n_valid += np.isfinite(frame)
+
+    def remove(
+            self,
+            frame: np.ndarray
+    ):
+        frame = self.prepare_frame(frame)
+        # The first occurrence of the value is after all smaller values
+        position = np.sum(self.values < frame, axis=0)
+        self.values[:-1] = np.where(self.rows[:-1] >= position, self.values[1:], self.values[:-1])
+        self.values[-1] = np.inf
+        self.n_valid -= np.isfinite(frame)
+
+    def get_median(self) -> np.ndarray:
+        lower = np.take_along_axis(self.values, np.maximum((self.n_valid - 1) // 2, 0)[None, :], axis=0)[0]
+        upper = np.take_along_axis(self.values, np.maximum(self.n_valid // 2, 0)[None, :], axis=0)[0]
+        median = 0.5 * (lower + upper)
+        median[self.n_valid == 0] = np.nan
+        return median.reshape(self.shape)
+
+
+def get_window_indices(
+        n_sky: int,
+        window_size: int,
+        position: int,
+        sky_index: int = None,
+) -> list[int]:
+    """Get the indices of the 'window_size' sky frames nearest to an image, excluding the image itself
+
+    Parameters
+    ----------
+    n_sky: Number of sky frames (sorted by time)
+    window_size: Number of sky frames to use
+    position: Index at which the image falls in the sorted sky frames
+    sky_index: Index of the image in the sky frames, if it is one of them
+
+    Returns
+    -------
+    List of sky frame indices
+    """
+    if sky_index is not None:
+        window_size = min(window_size, n_sky - 1)
+        lower = int(np.clip(sky_index - window_size // 2, 0, n_sky - window_size - 1))
+        return [x for x in range(lower, lower + window_size + 1) if x != sky_index]
+
+    window_size = min(window_size, n_sky)
+    lower = int(np.clip(position - window_size // 2, 0, n_sky - window_size))
+    return list(range(lower, lower + window_size))
+
+
 class NightSkyMedianCalibrator(SkyFlatCalibrator):
 
     base_key = "sky"
 
+    def __init__(
+            self,
+            window_size: int = None,
+            *args,
+            **kwargs
+    ):
+        """
+        Parameters
+        ----------
+        window_size: If None, a single sky is median-combined from every science frame in the batch.
+        Otherwise, each image gets its own sky, from the median of the 'window_size' science frames
+        nearest to it in time (excluding itself).
+        """
+        super().__init__(*args, **kwargs)
+        self.window_size = window_size
+
+    def subtract_sky(
+            self,
+            data: np.ndarray,
+            header: astropy.io.fits.Header,
+            master_sky: np.ndarray,
+    ) -> tuple[np.ndarray, astropy.io.fits.Header]:
+
+        mask = master_sky <= self.flat_nan_threshold
+
+        if np.sum(mask) > 0:
+            master_sky[mask] = np.nan
+
+        subtract_median = np.nanmedian(data)
+        data = data - subtract_median * master_sky
+
+        header.append(('SKMEDSUB', subtract_median, 'Median sky level subtracted'), end=True)
+
+        return data, header
+
     def _apply_to_images(
             self,
             images: list[np.ndarray],
             headers: list[astropy.io.fits.Header],
     ) -> tuple[list[np.ndarray], list[astropy.io.fits.Header]]:
 
+        if self.window_size is not None:
+            return self.apply_rolling_sky(images, headers)
+
         master_sky, _ = self.get_cache_file(images, headers)
 
-        mask = master_sky <= self.flat_nan_threshold
+        for i, data in enumerate(images):
+            images[i], headers[i] = self.subtract_sky(data, headers[i], master_sky)
 
-        if np.sum(mask) > 0:
-            master_sky[mask] = np.nan
+        return images, headers
 
-        for i, data in enumerate(images):
-            header = headers[i]
+    def get_time_order(
+            self,
+            headers: list[astropy.io.fits.Header]
+    ) -> np.ndarray:
+        mjds = [get_obs_mjd(x) for x in headers]
+        if None in mjds:
+            logger.warning("Could not determine the observation time of every image, "
+                           "so the batch order will be used for the rolling sky.")
+            return np.arange(len(headers))
+        return np.argsort(mjds, kind="stable")
 
-            subtract_median = np.nanmedian(data)
-            data = data - subtract_median * master_sky
+    def apply_rolling_sky(
+            self,
+            images: list[np.ndarray],
+            headers: list[astropy.io.fits.Header],
+    ) -> tuple[list[np.ndarray], list[astropy.io.fits.Header]]:
+        """Subtract a rolling-window sky from each image. Images are processed in time order, and the
+        window of sky frames is updated incrementally, adding and evicting single frames as it moves."""
 
-            header.append(('SKMEDSUB', subtract_median, 'Median sky level subtracted'), end=True)
+        time_order = self.get_time_order(headers)
 
-            images[i] = data
-            headers[i] = header
+        # Sky frames (science frames), in time order
+        sky_ids = set([id(x) for x in self.select_cache_images(images, headers)[1]])
+        sky_order = [i for i in time_order if id(headers[i]) in sky_ids]
 
-        return images, headers
+        if len(sky_order) < 2:
+            err = f"At least 2 sky frames are needed for a rolling sky, but only {len(sky_order)} were found."
+            logger.error(err)
+            raise ProcessingError(err)
+
+        logger.info(f"Subtracting rolling sky from {len(images)} images, "
+                    f"using {len(sky_order)} sky frames with a window of {self.window_size}")
+
+        scales = dict()
+
+        def get_sky_frame(sky_index: int) -> np.ndarray:
+            img = np.asarray(images[sky_order[sky_index]], dtype=self.working_dtype)
+            if sky_index not in scales:
+                scales[sky_index] = np.array(
+                    np.nanmedian(img[self.x_min:self.x_max, self.y_min:self.y_max]), dtype=self.working_dtype
+                )
+            return img / scales[sky_index]
+
+        window = RollingSkyWindow(images[sky_order[0]].shape, self.window_size, dtype=self.working_dtype)
+        current = []
+
+        new_images = list(images)
+
+        n_skies_before = 0
+
+        for i in time_order:
+
+            if id(headers[i]) in sky_ids:
+                sky_index = sky_order.index(i)
+                n_skies_before = sky_index
+            else:
+                sky_index = None
+
+            indices = get_window_indices(len(sky_order), self.window_size, n_skies_before, sky_index=sky_index)
+
+            if sky_index is not None:
+                n_skies_before = sky_index + 1
+
+            for j in [x for x in current if x not in indices]:
+                window.remove(get_sky_frame(j))
+
+            for j in [x for x in indices if x not in current]:
+                window.add(get_sky_frame(j))
+
+            current = indices
+
+            new_images[i], headers[i] = self.subtract_sky(images[i], headers[i], window.get_median())
+
+        return new_images, headers
 
 
 # class OldNightSkyMedianCalibrator(
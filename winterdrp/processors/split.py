@@ -1,32 +1,58 @@
 import copy
+import hashlib
 
 import astropy.io.fits
 import numpy as np
 import logging
 from winterdrp.processors.base_processor import BaseImageProcessor
 from winterdrp.paths import base_name_key
+from winterdrp.data_quality import DQImage, get_dq
 
 logger = logging.getLogger(__name__)
 
 sub_id_key = "SUBID"
+sub_coord_key = "SUBCOORD"
+src_image_key = "SRCIMAGE"
+sub_x_offset_key = "SUBX0"
+sub_y_offset_key = "SUBY0"
+src_shape_keys = ["SRCNAX1", "SRCNAX2"]
+src_batch_key = "SRCBATCH"
 
 
 class SplitImage(BaseImageProcessor):
 
     base_key = "split"
 
+    allow_checkpoint = True
+
     def __init__(
             self,
             buffer_pixels: int = 0,
             n_x: int = 1,
             n_y: int = 1,
+            copy_data: bool = False,
+            tile_batches: bool = False,
             *args,
             **kwargs
     ):
+        """
+        Parameters
+        ----------
+        buffer_pixels: Number of pixels by which neighbouring sub-images overlap
+        n_x: Number of sub-images along the first axis
+        n_y: Number of sub-images along the second axis
+        copy_data: Copy each sub-image. Otherwise, sub-images are views of the original image
+        (unless they overlap, i.e buffer_pixels > 0, in which case they must be independent copies).
+        tile_batches: Put each sub-image of each image in its own batch, so that downstream processors
+        work on the sub-images of a single exposure in parallel (see BaseProcessor.base_apply).
+        Otherwise, there is one batch per sub-image position. Use MergeTiles to recombine them.
+        """
         super().__init__(*args, **kwargs)
         self.buffer_pixels = buffer_pixels
         self.n_x = n_x
         self.n_y = n_y
+        self.copy_data = copy_data
+        self.tile_batches = tile_batches
 
     def get_range(
             self,
@@ -49,10 +75,18 @@ class SplitImage(BaseImageProcessor):
 
         logger.info(f"Splitting each image into {self.n_x*self.n_y} sub-images")
 
+        copy_data = np.logical_or(self.copy_data, self.buffer_pixels > 0)
+
+        # Identify the input batch, so that MergeTiles can restore the original batches
+        batch_id = hashlib.sha1(",".join([x[base_name_key] for x in headers]).encode()).hexdigest()[:16]
+
         for i, data in enumerate(images):
 
             base_header = headers[i]
 
+            if not copy_data:
+                data = data.astype(self.working_dtype, copy=False)
+
             pix_width_x, pix_width_y = data.shape
 
             k = 0
@@ -64,7 +98,12 @@ class SplitImage(BaseImageProcessor):
                 for iy in range(self.n_y):
                     y_0, y_1 = self.get_range(self.n_y, pix_width_y, iy)
 
-                    new_data = np.array(data[x_0:x_1, y_0:y_1])
+                    if copy_data:
+                        new_data = np.array(data[x_0:x_1, y_0:y_1], dtype=self.working_dtype)
+                        if get_dq(data) is not None:
+                            new_data = DQImage(new_data, dq=np.array(get_dq(data)[x_0:x_1, y_0:y_1]))
+                    else:
+                        new_data = data[x_0:x_1, y_0:y_1]
 
                     new_header = copy.copy(base_header)
 
@@ -74,16 +113,29 @@ class SplitImage(BaseImageProcessor):
 
                     sub_img_id = f"{ix}_{iy}"
 
-                    new_header["SUBCOORD"] = (sub_img_id, "Sub-image coordinate, in form x_y")
+                    new_header[sub_coord_key] = (sub_img_id, "Sub-image coordinate, in form x_y")
 
                     new_header[sub_id_key] = k
                     k += 1
 
-                    new_header["SRCIMAGE"] = (
+                    new_header[src_image_key] = (
                         base_header[base_name_key],
                         "Source image name, from which sub-image was made"
                     )
 
+                    new_header[src_batch_key] = (batch_id, "Batch of the source image")
+
+                    new_header[sub_x_offset_key] = (x_0, "Offset of sub-image along first array axis")
+                    new_header[sub_y_offset_key] = (y_0, "Offset of sub-image along second array axis")
+                    new_header[src_shape_keys[0]] = (pix_width_x, "Source image size along first array axis")
+                    new_header[src_shape_keys[1]] = (pix_width_y, "Source image size along second array axis")
+
+                    # FITS axis 1 is the second numpy axis
+                    if "CRPIX1" in new_header.keys():
+                        new_header["CRPIX1"] -= y_0
+                    if "CRPIX2" in new_header.keys():
+                        new_header["CRPIX2"] -= x_0
+
                     new_header["NAXIS1"], new_header["NAXIS2"] = new_data.shape
 
                     new_header[base_name_key] = base_header[base_name_key].replace(
@@ -101,6 +153,11 @@ class SplitImage(BaseImageProcessor):
 
         all_new_batches = []
 
+        if self.tile_batches:
+            for [images, headers] in batches:
+                all_new_batches += [[[images[i]], [header]] for i, header in enumerate(headers)]
+            return all_new_batches
+
         for [images, headers] in batches:
             new_batches = [[[], []] for _ in range(self.n_x * self.n_y)]
 
@@ -112,3 +169,123 @@ class SplitImage(BaseImageProcessor):
             all_new_batches += new_batches
 
         return all_new_batches
+
+
+
+def merge_tiles(
+        images: list[np.ndarray],
+        headers: list[astropy.io.fits.Header],
+) -> tuple[list[np.ndarray], list[astropy.io.fits.Header]]:
+    """
+    Recombine the sub-images made by SplitImage into their source images. Where sub-images overlap,
+    the later sub-image is used, and pixels covered by no sub-image are NaN. The merged header is that of
+    the first sub-image, without the sub-image keys, and with the WCS reference pixel shifted back to the
+    frame of the full image.
+
+    Parameters
+    ----------
+    images: Sub-images
+    headers: Sub-image headers
+
+    Returns
+    -------
+    Merged images and headers, one for each source image
+    """
+
+    groups = dict()
+
+    for i, header in enumerate(headers):
+        source = header[src_image_key]
+        if source not in groups.keys():
+            groups[source] = []
+        groups[source].append(i)
+
+    logger.info(f"Merging {len(images)} sub-images into {len(groups)} images")
+
+    new_images = []
+    new_headers = []
+
+    for source, indices in groups.items():
+
+        indices = sorted(indices, key=lambda x: headers[x][sub_id_key])
+
+        first = headers[indices[0]]
+        shape = (first[src_shape_keys[0]], first[src_shape_keys[1]])
+
+        dtype = np.result_type(*[images[i].dtype for i in indices])
+        merged = np.full(shape, np.nan, dtype=dtype)
+
+        dqs = [get_dq(images[i]) for i in indices]
+        merged_dq = None
+        if np.sum([x is not None for x in dqs]) > 0:
+            merged_dq = np.zeros(shape, dtype=[x for x in dqs if x is not None][0].dtype)
+
+        for i, dq in zip(indices, dqs):
+            x_0 = headers[i][sub_x_offset_key]
+            y_0 = headers[i][sub_y_offset_key]
+            n_x, n_y = images[i].shape
+            merged[x_0:x_0 + n_x, y_0:y_0 + n_y] = images[i]
+            if dq is not None:
+                merged_dq[x_0:x_0 + n_x, y_0:y_0 + n_y] = dq
+
+        new_header = first.copy()
+
+        if "CRPIX1" in new_header.keys():
+            new_header["CRPIX1"] += first[sub_y_offset_key]
+        if "CRPIX2" in new_header.keys():
+            new_header["CRPIX2"] += first[sub_x_offset_key]
+
+        for key in [sub_id_key, sub_coord_key, src_image_key, sub_x_offset_key, sub_y_offset_key] + src_shape_keys:
+            del new_header[key]
+
+        if src_batch_key in new_header.keys():
+            del new_header[src_batch_key]
+
+        new_header[base_name_key] = source
+        new_header["NAXIS1"], new_header["NAXIS2"] = merged.shape
+
+        if merged_dq is not None:
+            merged = DQImage(merged, dq=merged_dq)
+
+        new_images.append(merged)
+        new_headers.append(new_header)
+
+    return new_images, new_headers
+
+
+class MergeTiles(BaseImageProcessor):
+    """
+    Inverse of SplitImage. The sub-images of each source image may be spread across batches,
+    so every batch is gathered. The merged images are then returned in the same batches as the
+    source images were in before SplitImage (e.g. as grouped by an earlier ImageBatcher).
+    """
+
+    base_key = "merge"
+
+    allow_checkpoint = True
+
+    requires_all_batches = True
+
+    def _apply_to_images(
+            self,
+            images: list[np.ndarray],
+            headers: list[astropy.io.fits.Header],
+    ) -> tuple[list[np.ndarray], list[astropy.io.fits.Header]]:
+        return images, headers
+
+    def update_batches(
+        self,
+        batches: list[list[list[np.ndarray], list[astropy.io.fits.header]]]
+    ) -> list[list[list[np.ndarray], list[astropy.io.fits.header]]]:
+
+        groups = dict()
+
+        for [images, headers] in batches:
+            for i, header in enumerate(headers):
+                batch_id = header.get(src_batch_key, None)
+                if batch_id not in groups.keys():
+                    groups[batch_id] = [[], []]
+                groups[batch_id][0].append(images[i])
+                groups[batch_id][1].append(header)
+
+        return [list(merge_tiles(images, headers)) for [images, headers] in groups.values()]
@@ -0,0 +1,119 @@
+import logging
+from collections.abc import Callable
+
+import astropy.io.fits
+import numpy as np
+
+from winterdrp.catalog.base_catalog import BaseCatalog
+from winterdrp.catalog.prefetch import get_prefetcher, default_max_prefetch_workers
+from winterdrp.processors.base_processor import BaseImageProcessor
+
+logger = logging.getLogger(__name__)
+
+# Header keys (in order of preference) for the pointing of an image
+pointing_keys = [("CRVAL1", "CRVAL2"), ("RA", "DEC")]
+
+
+def get_pointing(
+        header: astropy.io.fits.Header
+) -> tuple[float, float] | None:
+    for ra_key, dec_key in pointing_keys:
+        try:
+            return float(header[ra_key]), float(header[dec_key])
+        except (KeyError, TypeError, ValueError):
+            pass
+    return None
+
+
+class CatalogPrefetch(BaseImageProcessor):
+    """
+    Processor to start querying reference catalogs in the background, as soon as the pointing of each
+    image is known (e.g. straight after ImageLoader). The images themselves are passed on unchanged.
+    Later processors using the same catalog generators (e.g. Scamp, PhotCalibrator) then find the catalogs
+    already cached, or wait for the prefetch in progress.
+
+    Parameters
+    ----------
+    ref_catalog_generators: Functions returning the reference catalog for a header
+    max_workers: Maximum number of concurrent catalog queries (for each process)
+    min_query_interval_s: Minimum time between the start of successive network queries
+    pointing_margin_arcmin: Extra search radius, to allow for the pointing changing slightly
+    after astrometric calibration
+    target_obsclass: Only prefetch catalogs for images with this OBSCLASS (e.g. skipping calibration frames),
+    or None to prefetch for every image
+    """
+
+    base_key = "prefetch"
+
+    header_only = True
+
+    def __init__(
+            self,
+            ref_catalog_generators: list[Callable[[astropy.io.fits.Header], BaseCatalog]],
+            max_workers: int = default_max_prefetch_workers,
+            min_query_interval_s: float = 0.,
+            pointing_margin_arcmin: float = 5.,
+            target_obsclass: str | None = "science",
+            *args,
+            **kwargs
+    ):
+        super().__init__(*args, **kwargs)
+        self.ref_catalog_generators = ref_catalog_generators
+        self.max_workers = max_workers
+        self.min_query_interval_s = min_query_interval_s
+        self.pointing_margin_arcmin = pointing_margin_arcmin
+        self.target_obsclass = target_obsclass
+
+    def get_max_n_cpu(self) -> int:
+        # The prefetcher belongs to the process which submits the queries, and is shut down when that
+        # process exits. Queries must be submitted from the main process, so they outlive this step.
+        return 1
+
+    def _apply_to_images(
+            self,
+            images: list[np.ndarray],
+            headers: list[astropy.io.fits.Header],
+    ) -> tuple[list[np.ndarray], list[astropy.io.fits.Header]]:
+
+        prefetcher = get_prefetcher(
+            max_workers=self.max_workers,
+            min_query_interval_s=self.min_query_interval_s
+        )
+
+        n_submitted = 0
+
+        for header in headers:
+
+            if np.logical_and(
+                    self.target_obsclass is not None,
+                    str(header.get("OBSCLASS", self.target_obsclass)).lower() != self.target_obsclass
+            ):
+                continue
+
+            pointing = get_pointing(header)
+
+            if pointing is None:
+                continue
+
+            ra_deg, dec_deg = pointing
+
+            for generator in self.ref_catalog_generators:
+                try:
+                    catalog = generator(header)
+                except (KeyError, ValueError) as exc:
+                    logger.debug(f"Cannot make reference catalog for prefetching: {exc}")
+                    continue
+
+                future = prefetcher.submit(
+                    catalog,
+                    ra_deg=ra_deg,
+                    dec_deg=dec_deg,
+                    search_radius_arcmin=catalog.search_radius_arcmin + self.pointing_margin_arcmin
+                )
+
+                if future is not None:
+                    n_submitted += 1
+
+        logger.info(f"Prefetching {n_submitted} reference catalogs for {len(headers)} images")
+
+        return images, headers
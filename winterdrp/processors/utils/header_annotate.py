@@ -11,6 +11,8 @@ class HeaderAnnotator(BaseImageProcessor):
 
     base_key = "header_reader"
 
+    allow_checkpoint = True
+
     def __init__(
             self,
             input_keys: str | list[str],
@@ -1,4 +1,5 @@
 import os
+from functools import partial
 
 import astropy.io.fits
 import numpy as np
@@ -7,12 +8,25 @@ from winterdrp.processors.base_processor import BaseImageProcessor
 from winterdrp.paths import core_fields
 import logging
 from collections.abc import Callable
-from winterdrp.io import open_fits
+from winterdrp.io import open_fits, open_header, LazyImage, get_header_shape
 from glob import glob
 
 logger = logging.getLogger(__name__)
 
 
+def load_image_data(
+        path: str,
+        load_image: Callable = open_fits,
+        dtype: np.dtype = np.float64,
+        load_data: Callable = None
+) -> np.ndarray:
+    if load_data is not None:
+        data = load_data(path)
+    else:
+        data, _ = load_image(path)
+    return data.astype(dtype, copy=False)
+
+
 class ImageLoader(BaseImageProcessor):
 
     base_key = "load"
@@ -22,6 +36,9 @@ class ImageLoader(BaseImageProcessor):
             input_sub_dir: str = raw_img_sub_dir,
             input_img_dir: str = base_raw_dir,
             load_image: Callable = open_fits,
+            load_header: Callable = None,
+            load_data: Callable = None,
+            lazy: bool = False,
             *args,
             **kwargs
     ):
@@ -29,13 +46,59 @@ class ImageLoader(BaseImageProcessor):
         self.input_sub_dir = input_sub_dir
         self.load_image = load_image
         self.input_img_dir = input_img_dir
+        self.lazy = lazy
+        # Optional function reading only the pixels of an image, used when lazy images are (re)loaded
+        self.load_data = load_data
+
+        if load_header is None and load_image is open_fits:
+            load_header = open_header
+
+        if lazy and load_header is None:
+            err = "Lazy image loading requires a 'load_header' function, " \
+                  "to read each header without its pixels."
+            logger.error(err)
+            raise ValueError(err)
+
+        self.load_header = load_header
+        self.header_selectors = []
+
+    def set_header_selectors(
+            self,
+            header_selectors: list
+    ):
+        """Set the selectors (see ImageSelector.select_header) which every image must pass to be loaded.
+        Where possible, these are applied using the header alone, so pixels of rejected images are never read.
+        """
+        self.header_selectors = header_selectors
+
+    def is_selected(
+            self,
+            header: astropy.io.fits.Header
+    ) -> bool:
+        return all([x.select_header(header) for x in self.header_selectors])
 
     def open_raw_image(
             self,
-            path: str
+            path: str,
+            header: astropy.io.fits.Header = None
     ) -> tuple[np.array, astropy.io.fits.Header]:
 
-        data, header = self.load_image(path)
+        if self.lazy:
+            if header is None:
+                header = self.load_header(path)
+            data = LazyImage(
+                path,
+                loader=partial(
+                    load_image_data,
+                    load_image=self.load_image,
+                    dtype=self.working_dtype,
+                    load_data=self.load_data
+                ),
+                shape=get_header_shape(header)
+            )
+        else:
+            data, header = self.load_image(path)
+            data = data.astype(self.working_dtype, copy=False)
 
         for key in core_fields:
             if key not in header.keys():
@@ -44,7 +107,7 @@ class ImageLoader(BaseImageProcessor):
                 logger.error(err)
                 raise KeyError(err)
 
-        return data.astype(np.float64), header
+        return data, header
 
     def open_raw_image_batch(
             self,
@@ -84,16 +147,23 @@ class ImageLoader(BaseImageProcessor):
         new_headers = []
 
         for path in img_list:
-            img, header = self.open_raw_image(path)
-            new_images.append(img)
-            new_headers.append(header)
 
-        return new_images, new_headers
+            header = None
 
+            if np.logical_and(len(self.header_selectors) > 0, self.load_header is not None):
+                header = self.load_header(path)
+                if not self.is_selected(header):
+                    continue
 
+            img, header = self.open_raw_image(path, header=header)
 
+            if not self.is_selected(header):
+                continue
 
+            new_images.append(img)
+            new_headers.append(header)
 
-    
-
+        if len(self.header_selectors) > 0:
+            logger.info(f"Header selection kept {len(new_images)} of {len(img_list)} images")
 
+        return new_images, new_headers
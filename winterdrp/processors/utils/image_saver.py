@@ -2,7 +2,9 @@ import os
 
 import astropy.io.fits
 import numpy as np
-from winterdrp.paths import get_output_path, get_output_dir, latest_save_key, latest_mask_save_key, base_output_dir
+from winterdrp.paths import get_output_path, get_output_dir, latest_save_key, latest_mask_save_key, base_output_dir, \
+    get_mask_path
+from winterdrp.io import get_pixel_hash, default_quantize_level
 from winterdrp.processors.base_processor import BaseImageProcessor
 
 
@@ -15,6 +17,9 @@ class ImageSaver(BaseImageProcessor):
             output_dir_name: str,
             write_mask: bool = True,
             output_dir: str = base_output_dir,
+            compression: str = None,
+            quantize_level: float = default_quantize_level,
+            mask_compression: str = None,
             *args,
             **kwargs
     ):
@@ -22,6 +27,9 @@ class ImageSaver(BaseImageProcessor):
         self.output_dir_name = output_dir_name
         self.write_mask = write_mask
         self.output_dir = output_dir
+        self.compression = compression
+        self.quantize_level = quantize_level
+        self.mask_compression = mask_compression
 
     def _apply_to_images(
             self,
@@ -51,10 +59,28 @@ class ImageSaver(BaseImageProcessor):
 
             header[latest_save_key] = path
 
+            # Pixels which are unchanged since they were last saved are not serialized again
+            pixel_hash = get_pixel_hash(img)
+
             if self.write_mask:
-                mask_path = self.save_mask(img, header, img_path=path)
+                saved_mask_path = None
+                if self.mask_compression is None:
+                    saved_mask_path = self.get_saved_mask_path(img, header, pixel_hash=pixel_hash)
+                if saved_mask_path is None:
+                    mask_path = self.save_mask(img, header, img_path=path, compression=self.mask_compression)
+                else:
+                    mask_path = get_mask_path(path)
+                    header[latest_mask_save_key] = mask_path
+                    self.save_header(header, saved_mask_path, mask_path, track=False)
                 header[latest_mask_save_key] = mask_path
 
-            self.save_fits(img, header, path)
+            saved_path = None
+            if self.compression is None:
+                saved_path = self.get_saved_path(img, header, match_header=False, pixel_hash=pixel_hash)
+
+            if saved_path is None:
+                self.save_fits(img, header, path, compression=self.compression, quantize_level=self.quantize_level)
+            else:
+                self.save_header(header, saved_path, path)
 
         return images, headers
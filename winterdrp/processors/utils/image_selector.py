@@ -6,6 +6,18 @@ from winterdrp.processors.base_processor import BaseImageProcessor
 logger = logging.getLogger(__name__)
 
 
+def header_matches(
+        header: astropy.io.fits.Header,
+        header_key: str = "target",
+        target_values: str | list[str] = "science",
+) -> bool:
+
+    if isinstance(target_values, str):
+        target_values = [target_values]
+
+    return header[header_key] in target_values
+
+
 def select_from_images(
         images: list[np.ndarray],
         headers: list[astropy.io.fits.Header],
@@ -13,14 +25,11 @@ def select_from_images(
         target_values: str | list[str] = "science",
 ) -> tuple[list[np.ndarray], list[astropy.io.fits.Header]]:
 
-    if isinstance(target_values, str):
-        target_values = [target_values]
-
     passing_images = []
     passing_headers = []
 
     for i, header in enumerate(headers):
-        if header[header_key] in target_values:
+        if header_matches(header, header_key=header_key, target_values=target_values):
             passing_images.append(images[i])
             passing_headers.append(header)
 
@@ -31,6 +40,8 @@ class ImageSelector(BaseImageProcessor):
 
     base_key = "select"
 
+    header_only = True
+
     def __init__(
             self,
             *args: tuple[str, str | list[str]],
@@ -39,6 +50,16 @@ class ImageSelector(BaseImageProcessor):
         super().__init__(*args, **kwargs)
         self.targets = args
 
+    def select_header(
+            self,
+            header: astropy.io.fits.Header
+    ) -> bool:
+        """Check whether an image with this header would be kept by the selector"""
+        for (header_key, target_values) in self.targets:
+            if not header_matches(header, header_key=header_key, target_values=target_values):
+                return False
+        return True
+
     def _apply_to_images(
             self,
             images: list[np.ndarray],
@@ -96,6 +117,10 @@ class ImageBatcher(BaseImageProcessor):
 
     base_key = "batch"
 
+    requires_all_batches = True
+
+    header_only = True
+
     def __init__(
             self,
             split_key: str | list[str],
@@ -129,6 +154,10 @@ class ImageDebatcher(BaseImageProcessor):
 
     base_key = "debatch"
 
+    requires_all_batches = True
+
+    header_only = True
+
     def _apply_to_images(
             self,
             images: list[np.ndarray],
@@ -8,6 +8,8 @@ logger = logging.getLogger(__name__)
 
 
 class XMatch(BaseDataframeProcessor):
+    allow_checkpoint = True
+
     def __init__(self,
                  catalog: BaseXMatchCatalog,
                  num_stars: int = 1,
@@ -27,8 +29,8 @@ class XMatch(BaseDataframeProcessor):
             self,
             candidate_table: pd.DataFrame,
     ) -> pd.DataFrame:
-        ras = candidate_table['ra']
-        decs = candidate_table['dec']
+        ras = candidate_table['ra'].to_numpy()
+        decs = candidate_table['dec'].to_numpy()
         query_names = np.array([f'q{x}' for x in np.arange(len(ras))])
 
         catalog = self.catalog
@@ -41,22 +43,32 @@ class XMatch(BaseDataframeProcessor):
             if catalog.projection[k] == 1:
                 available_projection_keys += [k]
 
+        # Flatten the results into one entry per (candidate, match)
+        results = [query_results.get(query_name, []) for query_name in query_names]
+        n_matches = np.array([len(x) for x in results], dtype=int)
+        match_query_inds = np.repeat(np.arange(len(results)), n_matches)
+        match_nums = np.concatenate([np.arange(x) for x in n_matches] + [np.zeros(0, dtype=int)])
+        matches = [result for query_results_list in results for result in query_results_list]
 
+        new_columns = {}
         for key in available_projection_keys:
+            colname = catalog.column_names[key]
+            dtype = catalog.column_dtypes[colname]
             for num in range(self.num_stars):
-                colname = catalog.column_names[key]
-                candidate_table[colname + f'{num + 1}'] = np.array(np.zeros(len(candidate_table))-99,
-                                                                   dtype=catalog.column_dtypes[colname]
-                                                                   )
+                column = np.array(np.zeros(len(candidate_table))-99, dtype=dtype)
+                if dtype == str:
+                    column = column.astype(object)
+                fill_value = np.array([-99.], dtype=dtype).astype(object)[0]
+
+                match_inds = np.flatnonzero(match_nums == num)
+                column[match_query_inds[match_inds]] = [matches[i].get(key, fill_value) for i in match_inds]
+
+                new_columns[colname + f'{num + 1}'] = column
+
+        for colname, column in new_columns.items():
+            candidate_table[colname] = column
+
         nmatch_colname = f'nmtch{self.catalog.abbreviation}'
-        candidate_table[nmatch_colname] = 0
-        for query_ind, query_name in enumerate(query_names):
-            results = query_results[query_name]
-            for result_ind, result in enumerate(results):
-                for key in result.keys():
-                    colname = catalog.column_names[key] + f'{result_ind + 1}'
-                    candidate_table.at[query_ind, colname] = result[key]
-
-            candidate_table.at[query_ind,nmatch_colname] = len(results)
+        candidate_table[nmatch_colname] = n_matches
 
         return candidate_table
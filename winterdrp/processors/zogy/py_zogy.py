@@ -25,7 +25,7 @@ pyfftw.interfaces.cache.enable()
 pyfftw.interfaces.cache.set_keepalive_time(1.)
 
 
-def py_zogy(Nf, Rf, P_Nf, P_Rf, S_Nf, S_Rf, SN, SR, dx=0.25, dy=0.25):
+def py_zogy(Nf, Rf, P_Nf, P_Rf, S_Nf, S_Rf, SN, SR, dx=0.25, dy=0.25, dtype=np.float64):
     '''
     Python implementation of ZOGY image subtraction algorithm.
 	As per Frank's instructions, will assume images have been aligned,
@@ -42,6 +42,7 @@ def py_zogy(Nf, Rf, P_Nf, P_Rf, S_Nf, S_Rf, SN, SR, dx=0.25, dy=0.25):
 	SR: Average uncertainty (sigma) of Reference image
 	dx: Astrometric uncertainty (sigma) in x coordinate
 	dy: Astrometric uncertainty (sigma) in y coordinate
+	dtype: Floating point precision used for the images (and their transforms)
 
 	Returns:
 	D: Subtracted image
@@ -50,8 +51,8 @@ def py_zogy(Nf, Rf, P_Nf, P_Rf, S_Nf, S_Rf, SN, SR, dx=0.25, dy=0.25):
 	'''
 
     # Load the new and ref images into memory
-    N = fits.open(Nf)[0].data
-    R = fits.open(Rf)[0].data
+    N = fits.open(Nf)[0].data.astype(dtype, copy=False)
+    R = fits.open(Rf)[0].data.astype(dtype, copy=False)
 
     # Load the PSFs into memory
     P_N_small = fits.open(P_Nf)[0].data
@@ -60,8 +61,8 @@ def py_zogy(Nf, Rf, P_Nf, P_Rf, S_Nf, S_Rf, SN, SR, dx=0.25, dy=0.25):
     logger.info('Max of small PSF is %d %d' % np.unravel_index(np.argmax(P_N_small, axis=None), P_N_small.shape))
 
     # Place PSF at center of image with same size as new / reference
-    P_N = np.zeros(N.shape)
-    P_R = np.zeros(R.shape)
+    P_N = np.zeros(N.shape, dtype=dtype)
+    P_R = np.zeros(R.shape, dtype=dtype)
     idx = [slice(N.shape[0] // 2 - P_N_small.shape[0] // 2,
                  N.shape[0] // 2 + P_N_small.shape[0] // 2 + 1),
            slice(N.shape[1] // 2 - P_N_small.shape[1] // 2,
@@ -127,8 +128,8 @@ def py_zogy(Nf, Rf, P_Nf, P_Rf, S_Nf, S_Rf, SN, SR, dx=0.25, dy=0.25):
 
     # Start out with source noise
     # Load the sigma images into memory
-    S_N = fits.open(S_Nf)[0].data
-    S_R = fits.open(S_Rf)[0].data
+    S_N = fits.open(S_Nf)[0].data.astype(dtype, copy=False)
+    S_R = fits.open(S_Rf)[0].data.astype(dtype, copy=False)
 
     # Sigma to variance
     V_N = S_N ** 2
@@ -5,9 +5,8 @@ from winterdrp.paths import get_output_dir, latest_mask_save_key
 from astropy.io import fits
 import numpy as np
 from winterdrp.utils.ldac_tools import get_table_from_ldac
-from astropy.coordinates import SkyCoord
+from winterdrp.calculate.crossmatch import get_ldac_sky_index
 from astropy.stats import sigma_clipped_stats
-import astropy.units as u
 from winterdrp.io import open_fits
 from winterdrp.processors.zogy.py_zogy import py_zogy
 from winterdrp.paths import norm_psfex_header_key
@@ -50,12 +49,14 @@ class ZOGY(BaseImageProcessor):
             temp_files = [sci_image_path, ref_image_path, sci_rms_image, ref_rms_image]
 
             D, P_D, S_corr = py_zogy(sci_image_path, ref_image_path, sci_psf, ref_psf, sci_rms_image,
-                                     ref_rms_image, sci_rms, ref_rms, dx=ast_unc_x, dy=ast_unc_y)
+                                     ref_rms_image, sci_rms, ref_rms, dx=ast_unc_x, dy=ast_unc_y,
+                                     dtype=self.working_dtype)
 
             diff_image_path = sci_image_path.replace('.fits', '') + '.diff.fits'
             self.save_fits(data=D,
                            header=header,
-                           path=os.path.join(self.get_sub_output_dir(), diff_image_path))
+                           path=os.path.join(self.get_sub_output_dir(), diff_image_path),
+                           track=False)
 
             diff_psf_path = diff_image_path + '.psf'
             self.save_fits(data=P_D,
@@ -77,7 +78,8 @@ class ZOGY(BaseImageProcessor):
             diff_rms_path = diff_image_path + '.unc'
             self.save_fits(data=diff_rms_image,
                            header=header,
-                           path=os.path.join(self.get_sub_output_dir(), diff_rms_path))
+                           path=os.path.join(self.get_sub_output_dir(), diff_rms_path),
+                           track=False)
 
             header["DIFFIMG"] = diff_image_path
             header["DIFFPSF"] = diff_psf_path
@@ -124,11 +126,17 @@ class ZOGYPrepare(BaseImageProcessor):
         ref_catalog = ref_catalog[good_ref_sources]
         sci_catalog = sci_catalog[good_sci_sources]
 
-        sci_coords = SkyCoord(ra=sci_catalog['ALPHAWIN_J2000'], dec=sci_catalog['DELTAWIN_J2000'], frame='icrs')
-        ref_coords = SkyCoord(ra=ref_catalog['ALPHAWIN_J2000'], dec=ref_catalog['DELTAWIN_J2000'], frame='icrs')
-
-        # Cross match the catalogs
-        idx_ref, idx_sci, d2d, d3d = sci_coords.search_around_sky(ref_coords, 1.0 * u.arcsec)
+        # Cross match the catalogs. The index of the full reference catalog is cached, because the same
+        # reference is used for every science image, so matches to bad reference sources are removed afterwards.
+        good_ref_sources = np.asarray(good_ref_sources)
+        ref_index = get_ldac_sky_index(ref_catalog_name, 'ALPHAWIN_J2000', 'DELTAWIN_J2000')
+        idx_sci, idx_ref_all, d2d = ref_index.match_within(
+            sci_catalog['ALPHAWIN_J2000'], sci_catalog['DELTAWIN_J2000'], radius_arcsec=1.0
+        )
+        good_match = good_ref_sources[idx_ref_all]
+        idx_sci = idx_sci[good_match]
+        idx_ref = (np.cumsum(good_ref_sources) - 1)[idx_ref_all[good_match]]
+        d2d = d2d[good_match]
 
         xpos_sci = sci_catalog['XWIN_IMAGE']
         ypos_sci = sci_catalog['YWIN_IMAGE']
@@ -173,9 +181,11 @@ class ZOGYPrepare(BaseImageProcessor):
         for ind, header in enumerate(headers):
             ref_img_path = header["REFIMG"]
             sci_img_path = header["BASENAME"]
-            sci_data = images[ind]
+            sci_data = images[ind].astype(self.working_dtype, copy=False)
+            images[ind] = sci_data
 
             ref_data, ref_header = self.open_fits(os.path.join(self.get_sub_output_dir(), ref_img_path))
+            ref_data = ref_data.astype(self.working_dtype, copy=False)
             ref_catalog_path = ref_header["SRCCAT"]
             ref_mask_path = ref_header["MASKPATH"]
 
@@ -242,7 +252,8 @@ class ZOGYPrepare(BaseImageProcessor):
 
             self.save_fits(data=sci_rms_image,
                            header=header,
-                           path=os.path.join(os.path.join(self.get_sub_output_dir(), sci_rms_path))
+                           path=os.path.join(os.path.join(self.get_sub_output_dir(), sci_rms_path)),
+                           track=False
                            )
 
             self.save_fits(data=ref_rms_image,
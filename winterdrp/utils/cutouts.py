@@ -0,0 +1,141 @@
+"""
+Module for extracting many small cutouts (stamps) from the same images, e.g. for candidates in a difference image.
+
+Each image is opened once (memory-mapped, and kept in a small LRU cache), padded once, and all stamps
+are then extracted in a single vectorized gather, rather than reading the full image for every cutout.
+"""
+import gzip
+import io
+import logging
+import os
+import threading
+from collections import OrderedDict
+
+import astropy.io.fits
+import numpy as np
+from astropy.io import fits
+from numpy.lib.stride_tricks import sliding_window_view
+
+from winterdrp.io import get_image_hdu, get_primary_header
+from winterdrp.monitor import record_bytes_read
+
+logger = logging.getLogger(__name__)
+
+max_cached_images = 8
+
+image_cache = OrderedDict()
+image_cache_lock = threading.Lock()
+
+
+def open_cached_fits(
+        path: str
+) -> tuple[np.ndarray, astropy.io.fits.Header]:
+    """Open an image (memory-mapped where possible), keeping the most recently used images open.
+    The cached objects are returned directly, so callers must not modify them.
+
+    Parameters
+    ----------
+    path: Path of the image
+
+    Returns
+    -------
+    Image data and header
+    """
+    stat = os.stat(path)
+    key = (os.path.abspath(path), stat.st_mtime_ns, stat.st_size)
+
+    with image_cache_lock:
+        if key in image_cache:
+            image_cache.move_to_end(key)
+            return image_cache[key]
+
+    with fits.open(path, memmap=True) as img:
+        hdu = get_image_hdu(img)
+        data = hdu.data
+        header = get_primary_header(hdu)
+
+    record_bytes_read(path)
+
+    with image_cache_lock:
+        image_cache[key] = (data, header)
+        while len(image_cache) > max_cached_images:
+            image_cache.popitem(last=False)
+
+    return data, header
+
+
+def get_cached_header_value(
+        path: str,
+        key: str
+):
+    """Equivalent to fits.getval(path, key), using the image cache"""
+    _, header = open_cached_fits(path)
+    return header[key]
+
+
+def make_cutouts(
+        image: str | np.ndarray,
+        positions: np.ndarray | list,
+        half_size: int
+) -> np.ndarray:
+    """
+    Extract square cutouts of side (2 * half_size + 1), centred on each (x, y) pixel position.
+    Parts of a cutout which fall outside the image are filled with zeros.
+
+    Parameters
+    ----------
+    image: Path of the image (opened via the image cache), or the image data
+    positions: Array of shape (N, 2) of integer (x, y) pixel positions (0-indexed)
+    half_size: Half the side of each cutout, in pixels
+
+    Returns
+    -------
+    Array of shape (N, 2 * half_size + 1, 2 * half_size + 1)
+    """
+    if isinstance(image, str):
+        image, _ = open_cached_fits(image)
+
+    half_size = int(half_size)
+    positions = np.asarray(positions, dtype=int).reshape(-1, 2)
+
+    padded = np.pad(np.asarray(image), half_size, mode="constant")
+    windows = sliding_window_view(padded, (2 * half_size + 1, 2 * half_size + 1))
+
+    # Row y of the image is row (y + half_size) of the padded image, which is where the window centred
+    # on y starts
+    return windows[positions[:, 1], positions[:, 0]]
+
+
+def make_bit_images(
+        cutouts: np.ndarray
+) -> list[io.BytesIO]:
+    """Make gzipped FITS files of the cutouts for the marshal, in bulk. All cutouts share one header,
+    so the FITS files are assembled directly rather than via an HDU for each cutout.
+
+    Parameters
+    ----------
+    cutouts: Array of cutouts, of shape (N, ny, nx)
+
+    Returns
+    -------
+    A list of gzipped fits files, as BytesIO objects
+    """
+    cutouts = np.asarray(cutouts, dtype=">f4")
+
+    if len(cutouts) == 0:
+        return []
+
+    header_bytes = fits.PrimaryHDU(np.zeros(cutouts.shape[1:], dtype=np.float32)).header.tostring().encode("ascii")
+
+    n_data_bytes = int(np.prod(cutouts.shape[1:])) * cutouts.dtype.itemsize
+    # FITS files are made of 2880 byte blocks
+    padding = b"\0" * (-n_data_bytes % 2880)
+
+    bit_images = []
+    for cutout in cutouts:
+        buf = io.BytesIO()
+        with gzip.open(buf, "wb") as fz:
+            fz.write(header_bytes + cutout.tobytes() + padding)
+        bit_images.append(buf)
+
+    return bit_images
@@ -1,27 +1,35 @@
 import os
 import io
+import atexit
+import shutil
 import tarfile
+import tempfile
+import threading
+import multiprocessing.util
+from contextlib import contextmanager
 import docker
 import logging
 from docker.errors import DockerException
 from docker.models.containers import Container
+from winterdrp.io import link_file
 
 logger = logging.getLogger(__name__)
 
 docker_image_name = "robertdstein/astrodocker"
 docker_dir = "/usr/src/astrodocker"
 
+# Path at which the scratch directory of a container pool is mounted, inside each container
+docker_scratch_dir = "/usr/src/scratch"
+
+
+def get_docker_client():
+    """Connect to the default docker daemon, and pull the "robertdstein/astrodocker" image if needed.
 
-def new_container():
-    f"""Generate a new docker.models.containers.Container object, using the default 
-    docker daemon and the "{docker_image_name}" image. If the image is not found locally, 
-    the image will first be pulled from DockerHub.
-    
     This function requires a Docker daemon to first be running.
-    
+
     Returns
     -------
-    A docker container built with the {docker_image_name} image
+    A docker.DockerClient object
     """
     try:
         client = docker.from_env()
@@ -35,7 +43,195 @@ def new_container():
         logger.info(f"Pulling docker image {docker_image_name}")
         client.images.pull(docker_image_name)
 
-    return client.containers.run(docker_image_name, tty=True, detach=True)
+    return client
+
+
+def new_container():
+    f"""Generate a new docker.models.containers.Container object, using the default 
+    docker daemon and the "{docker_image_name}" image. If the image is not found locally, 
+    the image will first be pulled from DockerHub.
+    
+    This function requires a Docker daemon to first be running.
+    
+    Returns
+    -------
+    A docker container built with the {docker_image_name} image
+    """
+    return get_docker_client().containers.run(docker_image_name, tty=True, detach=True)
+
+
+class DockerContainerPool:
+    """
+    Pool of long-lived docker containers, which are reused between commands.
+
+    Every container bind-mounts the same local scratch directory (at docker_scratch_dir), so files are
+    shared with the containers rather than copied in and out. Each command gets its own work directory
+    inside the scratch directory (see new_work_dir), so any container can run any command, and several
+    commands can run at once. Containers are created as needed, up to 'max_containers' at once.
+
+    Parameters
+    ----------
+    client: Docker client to use (by default, one is connected to the docker daemon when first needed).
+    Any object with the same 'containers.run' interface can be used, e.g. a fake client for testing.
+    image_name: Docker image for the containers
+    scratch_root: Directory in which to make the scratch directory (default: system temporary directory)
+    max_containers: Maximum number of containers (default: no limit)
+    """
+
+    def __init__(
+            self,
+            client=None,
+            image_name: str = docker_image_name,
+            scratch_root: str = None,
+            max_containers: int = None,
+    ):
+        self.client = client
+        self.image_name = image_name
+        self.max_containers = max_containers
+
+        if scratch_root is not None:
+            try:
+                os.makedirs(scratch_root)
+            except OSError:
+                pass
+
+        self.scratch_dir = tempfile.mkdtemp(dir=scratch_root, prefix="winterdrp_docker_")
+
+        self.lock = threading.Lock()
+        self.slots = None if max_containers is None else threading.BoundedSemaphore(max_containers)
+        self.idle_containers = []
+        self.all_containers = []
+        self.closed = False
+
+    def get_client(self):
+        if self.client is None:
+            self.client = get_docker_client()
+        return self.client
+
+    def new_container(self) -> Container:
+        container = self.get_client().containers.run(
+            self.image_name,
+            tty=True,
+            detach=True,
+            volumes={self.scratch_dir: {"bind": docker_scratch_dir, "mode": "rw"}}
+        )
+        logger.debug(f"Started new docker container, with {self.scratch_dir} mounted at {docker_scratch_dir}")
+        return container
+
+    @contextmanager
+    def container(self):
+        """Borrow a container from the pool, for the duration of a 'with' block. A container which
+        raised a docker API error is removed rather than returned to the pool."""
+        if self.closed:
+            err = "Cannot use a docker container pool which has been shut down."
+            logger.error(err)
+            raise ValueError(err)
+
+        if self.slots is not None:
+            self.slots.acquire()
+
+        try:
+            with self.lock:
+                container = self.idle_containers.pop() if len(self.idle_containers) > 0 else None
+
+            if container is None:
+                container = self.new_container()
+                with self.lock:
+                    self.all_containers.append(container)
+
+            broken = False
+
+            try:
+                yield container
+            except docker.errors.APIError:
+                broken = True
+                raise
+            finally:
+                if broken:
+                    self.remove_container(container)
+                else:
+                    with self.lock:
+                        if container in self.all_containers:
+                            self.idle_containers.append(container)
+
+        finally:
+            if self.slots is not None:
+                self.slots.release()
+
+    def remove_container(
+            self,
+            container: Container
+    ):
+        with self.lock:
+            if container in self.all_containers:
+                self.all_containers.remove(container)
+        try:
+            container.kill()
+            container.remove()
+        except DockerException as err:
+            logger.warning(f"Unable to remove docker container: {err}")
+
+    def new_work_dir(self) -> str:
+        """Make a new (local) work directory for a single command, inside the shared scratch directory"""
+        return tempfile.mkdtemp(dir=self.scratch_dir)
+
+    def get_container_path(
+            self,
+            work_dir: str,
+            local_path: str
+    ) -> str:
+        """Path inside the containers of the file 'local_path' in the work directory 'work_dir'"""
+        return os.path.join(
+            docker_scratch_dir,
+            os.path.relpath(work_dir, self.scratch_dir),
+            os.path.basename(local_path)
+        )
+
+    def shutdown(self):
+        """Kill and remove all containers, and delete the scratch directory"""
+        if self.closed:
+            return
+        self.closed = True
+
+        with self.lock:
+            containers = list(self.all_containers)
+
+        for container in containers:
+            self.remove_container(container)
+
+        self.idle_containers = []
+        logger.debug(f"Shut down docker container pool with {len(containers)} containers")
+
+        shutil.rmtree(self.scratch_dir, ignore_errors=True)
+
+
+container_pools = {}
+container_pools_lock = threading.Lock()
+
+
+def get_container_pool(
+        scratch_root: str = None
+) -> DockerContainerPool:
+    """Get the docker container pool of this process, creating it if needed.
+    Each (worker) process has its own pool, which is shut down when the process exits."""
+    pid = os.getpid()
+    with container_pools_lock:
+        if pid not in container_pools:
+            container_pools[pid] = DockerContainerPool(scratch_root=scratch_root)
+            # Worker processes do not run atexit handlers, but do run multiprocessing finalizers
+            multiprocessing.util.Finalize(None, shutdown_container_pools, exitpriority=10)
+        return container_pools[pid]
+
+
+def shutdown_container_pools():
+    """Shut down the docker container pool of this process, if there is one"""
+    with container_pools_lock:
+        pool = container_pools.pop(os.getpid(), None)
+    if pool is not None:
+        pool.shutdown()
+
+
+atexit.register(shutdown_container_pools)
 
 
 def docker_path(file):
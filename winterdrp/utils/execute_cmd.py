@@ -1,18 +1,80 @@
 import logging
 import subprocess
 import os
+import tempfile
+import numpy as np
 import docker
 import shutil
 from docker.errors import DockerException
-from winterdrp.utils.dockerutil import new_container, docker_path, docker_batch_put, docker_get_new_files
+from winterdrp.utils.dockerutil import DockerContainerPool, get_container_pool, link_file
 
 logger = logging.getLogger(__name__)
 
+# Optional root directory for the private scratch directories of local commands (e.g. a tmpfs mount)
+scratch_dir_env = "SCRATCH_DATA_DIR"
+
 
 class ExecutionError(Exception):
     pass
 
 
+def get_local_path(
+        arg: str
+) -> str:
+    """Make any token of a command which looks like a relative path (an existing file,
+    or a file in an existing directory) absolute, so the command can run in another directory.
+    Comma-separated lists of paths (e.g. 'sex det.fits,measure.fits') are handled part by part.
+
+    Parameters
+    ----------
+    arg: A single (space-separated) argument of a command
+
+    Returns
+    -------
+    The argument, with relative paths replaced by absolute paths
+    """
+    parts = arg.split(",")
+    for i, x in enumerate(parts):
+        if np.logical_or(len(x) == 0, os.path.isabs(x)):
+            continue
+        if np.logical_or(os.path.exists(x), os.path.isdir(os.path.dirname(x))):
+            parts[i] = os.path.abspath(x)
+    return ",".join(parts)
+
+
+def localise_cmd(
+        cmd: str,
+        scratch_dir: str
+) -> str:
+    """Rewrite a command so that it can be run from 'scratch_dir' instead of the current directory.
+    Relative paths are made absolute, and any file-of-files ('@list.txt') is copied to
+    scratch_dir with its own relative paths made absolute.
+
+    Parameters
+    ----------
+    cmd: Command to run
+    scratch_dir: Directory the command will be run from
+
+    Returns
+    -------
+    The rewritten command
+    """
+    new_args = []
+
+    for arg in cmd.split(" "):
+        if np.logical_and(arg.startswith("@"), os.path.isfile(arg[1:])):
+            temp_file = temp_config(arg[1:], scratch_dir)
+            with open(arg[1:], "r") as f:
+                lines = [get_local_path(line.strip("\n")) + "\n" for line in f.readlines()]
+            with open(temp_file, "w") as g:
+                g.writelines(lines)
+            new_args.append(f"@{temp_file}")
+        else:
+            new_args.append(get_local_path(arg))
+
+    return " ".join(new_args)
+
+
 def run_local(
         cmd: str,
         output_dir: str = "."
@@ -20,8 +82,10 @@ def run_local(
     """
     Function to run on local machine using subprocess, with error handling.
 
-    After the specified 'cmd' command has been run, any newly-generated files
-    will be copied out of the current directory to 'output_dir'
+    Each command is run in its own private scratch directory (created under $SCRATCH_DATA_DIR,
+    e.g. a tmpfs mount, if set, or the system temporary directory otherwise), so that several commands
+    can run at once. Relative paths in 'cmd' are made absolute beforehand. After the command has been run,
+    any files it created in the scratch directory will be moved to 'output_dir'.
 
     Parameters
     ----------
@@ -34,54 +98,60 @@ def run_local(
 
     """
 
-    try:
+    scratch_root = os.getenv(scratch_dir_env)
 
-        # See what files are in the directory beforehand
+    if scratch_root is not None:
+        try:
+            os.makedirs(scratch_root)
+        except OSError:
+            pass
 
-        ignore_files = subprocess.run("ls", check=True, capture_output=True).stdout.decode().split("\n")
+    with tempfile.TemporaryDirectory(dir=scratch_root, prefix="winterdrp_") as scratch_dir:
 
-        # Run sextractor
+        try:
 
-        rval = subprocess.run(cmd, check=True, capture_output=True, shell=True)
+            local_cmd = localise_cmd(cmd, scratch_dir)
 
-        msg = f'Successfully executed command. '
+            # Note the files made for the command itself, which are not outputs
 
-        if rval.stdout.decode() != "":
-            msg += f"Found the following output: {rval.stdout.decode()}"
-        logger.debug(msg)
+            ignore_files = os.listdir(scratch_dir)
 
-        try:
-            os.makedirs(output_dir)
-        except OSError:
-            pass
+            rval = subprocess.run(local_cmd, check=True, capture_output=True, shell=True, cwd=scratch_dir)
 
-        # Move new files to output dir
+            msg = f'Successfully executed command. '
 
-        new_files = [
-            x for x in subprocess.run("ls", check=True, capture_output=True).stdout.decode().split("\n")
-            if x not in ignore_files
-        ]
+            if rval.stdout.decode() != "":
+                msg += f"Found the following output: {rval.stdout.decode()}"
+            logger.debug(msg)
 
-        current_dir = subprocess.run("pwd", check=True, capture_output=True).stdout.decode().strip()
+            try:
+                os.makedirs(output_dir)
+            except OSError:
+                pass
 
-        if len(new_files) > 0:
+            # Move new files to output dir
 
-            logger.debug(f"The following new files were created in the current directory: {new_files}")
+            new_files = [x for x in os.listdir(scratch_dir) if x not in ignore_files]
 
-        for file in new_files:
+            if len(new_files) > 0:
 
-            current_path = os.path.join(current_dir, file)
-            output_path = os.path.join(output_dir, file)
+                logger.debug(f"The following new files were created in the scratch directory: {new_files}")
+
+            for file in new_files:
+
+                current_path = os.path.join(scratch_dir, file)
+                output_path = os.path.join(output_dir, file)
 
-            logger.info(f"File saved to {output_path}")
+                logger.info(f"File saved to {output_path}")
 
-            shutil.move(current_path, output_path)
+                shutil.move(current_path, output_path)
 
-    except subprocess.CalledProcessError as err:
-        msg = f"Error found when running with command: \n \n '{err.cmd}' \n \n" \
-              f"This yielded a return code of {err.returncode}. The following traceback was found: \n {err.stderr.decode()}"
-        logger.error(msg)
-        raise ExecutionError(msg)
+        except subprocess.CalledProcessError as err:
+            msg = f"Error found when running with command: \n \n '{err.cmd}' \n \n" \
+                  f"This yielded a return code of {err.returncode}. " \
+                  f"The following traceback was found: \n {err.stderr.decode()}"
+            logger.error(msg)
+            raise ExecutionError(msg)
 
 
 def temp_config(
@@ -94,33 +164,38 @@ def temp_config(
 
 def run_docker(
         cmd: str,
-        output_dir: str = "."
+        output_dir: str = ".",
+        pool: DockerContainerPool = None
 ):
-    """Function to run a command via Docker. A container will be generated automatically,
+    """Function to run a command via Docker. Commands are run in a pool of long-lived containers
+    (see winterdrp.utils.dockerutil.DockerContainerPool), which are created automatically,
     but a Docker server must be running first. You can start one via the Desktop application,
     or on the command line with `docker start'.
 
-    After the specified 'cmd' command has been run, any newly-generated files
-     will be copied out of the container to 'output_dir'
+    Input files are hardlinked into a work directory which is bind-mounted in the container, and after the
+    specified 'cmd' command has been run, any newly-generated files will be moved from it to 'output_dir'
 
     Parameters
     ----------
     cmd: A string containing the base arguments you want to use to run sextractor. An example would be:
         cmd = 'image01.fits -c sex.config'
     output_dir: A local directory to save the output files to.
+    pool: Container pool to use (default: the pool of the current process, see get_container_pool)
 
     Returns
     -------
 
     """
 
-    container = new_container()
+    if pool is None:
+        pool = get_container_pool(scratch_root=os.getenv(scratch_dir_env))
 
-    try:
+    work_dir = pool.new_work_dir()
 
-        container.attach()
+    def container_path(path):
+        return pool.get_container_path(work_dir, path)
 
-        container.start()
+    try:
 
         split = cmd.split(" -")
 
@@ -138,11 +213,10 @@ def run_docker(
         new_split = []
 
         # Loop over sextractor command, and
-        # copy everything that looks like a file into container
+        # link everything that looks like a file into the work directory
         # Go through everything that looks like a file with paths in it after
 
         copy_list = []
-        temp_files = []
 
         files_of_files = []
 
@@ -157,12 +231,12 @@ def run_docker(
             for j, x in enumerate(sep):
                 if len(x) > 0:
                     if os.path.isfile(x):
-                        new[j] = docker_path(sep[j])
+                        new[j] = container_path(sep[j])
                         copy_list.append(sep[j])
                     elif x[0] == "@":
                         files_of_files.append(x[1:])
                     elif os.path.isdir(os.path.dirname(x)):
-                        new[j] = docker_path(sep[j])
+                        new[j] = container_path(sep[j])
 
             new_split.append(" ".join(new))
 
@@ -183,39 +257,34 @@ def run_docker(
                     for i, arg in enumerate(args):
                         if os.path.isfile(arg):
                             copy_list.append(arg)
-                            new_args[i] = docker_path(arg)
+                            new_args[i] = container_path(arg)
                         elif os.path.isfile(arg.strip("\n")):
                             copy_list.append(arg.strip("\n"))
-                            new_args[i] = docker_path(arg.strip("\n")) + "\n"
+                            new_args[i] = container_path(arg.strip("\n")) + "\n"
                     new_file.append(" ".join(new_args))
 
-            temp_file = temp_config(path, output_dir)
+            temp_file = temp_config(path, work_dir)
 
             with open(temp_file, "w") as g:
                 g.writelines(new_file)
 
-            copy_list.append(temp_file)
+            cmd = cmd.replace(path + " ", container_path(temp_file) + " ")
 
-            cmd = cmd.replace(path + " ", docker_path(temp_file) + " ")
-
-        # Copy in files, and see what files are already there
+        # Link in files, and see what files are already there
 
         copy_list = list(set(copy_list))
 
-        logger.debug(f"Copying {copy_list} into container")
+        logger.debug(f"Linking {copy_list} into work directory {work_dir}")
 
-        ignore_files = docker_batch_put(
-            container=container,
-            local_paths=copy_list
-        )
+        for path in copy_list:
+            link_file(path, os.path.join(work_dir, os.path.basename(path)))
 
-        # Run command
+        ignore_files = os.listdir(work_dir)
 
-        log = container.exec_run(cmd, stderr=True, stdout=True)
+        # Run command
 
-        for temp_file in temp_files:
-            logger.debug(f"Deleting temporary file {temp_file}")
-            os.remove(temp_file)
+        with pool.container() as container:
+            log = container.exec_run(cmd, stderr=True, stdout=True, workdir=container_path(""))
 
         if not log.output == b"":
             logger.info(f"Output: {log.output.decode()}")
@@ -224,27 +293,26 @@ def run_docker(
             err = f"Error running command: \n '{cmd}'\n which resulted in returncode '{log.exit_code}' and" \
                   f"the following error message: \n '{log.output.decode()}'"
             logger.error(err)
-            raise subprocess.CalledProcessError(
-                returncode=log.exit_code,
-                cmd=cmd,
-                stderr=log.output.decode()
-            )
+            raise ExecutionError(err)
 
-        # Copy out any files which did not exist before running sextractor
+        # Move out any files which did not exist before running the command
 
-        docker_get_new_files(
-            container=container,
-            output_dir=output_dir,
-            ignore_files=ignore_files
-        )
+        try:
+            os.makedirs(output_dir)
+        except OSError:
+            pass
+
+        for file in [x for x in os.listdir(work_dir) if x not in ignore_files]:
+            output_path = os.path.join(output_dir, file)
+            shutil.move(os.path.join(work_dir, file), output_path)
+            logger.debug(f"Saved to {output_path}")
 
     except docker.errors.APIError as err:
         logger.error(err)
         raise ExecutionError(err)
     finally:
-        # In any case, clean up by killing the container and removing files
-        container.kill()
-        container.remove()
+        # In any case, clean up the work directory (the container is kept for reuse)
+        shutil.rmtree(work_dir, ignore_errors=True)
 
 
 def execute(
@@ -7,9 +7,16 @@ vice versa.
 from astropy.io import fits
 import astropy.io
 import numpy as np
-import tempfile
+import os
+import threading
+from collections import OrderedDict
 from astropy.table import Table
 
+max_cached_ldac_tables = 16
+
+ldac_cache = OrderedDict()
+ldac_cache_lock = threading.Lock()
+
 
 def convert_hdu_to_ldac(
         hdu: astropy.io.fits.BinTableHDU | astropy.io.fits.TableHDU
@@ -55,17 +62,12 @@ def convert_table_to_ldac(
     hdulist: `astropy.io.fits.HDUList`
         FITS_LDAC hdulist that can be read by astromatic software
     """
-    t = tbl.copy()
     # Cannot save "object"-type fields via fits
-    del_list = [x for x in t.dtype.names if t.dtype[x].kind == "O"]
-    t.remove_columns(del_list)
-    f = tempfile.NamedTemporaryFile(suffix='.fits', mode='rb+')
-    print(t)
-    t.write(f, format='fits')
-    f.seek(0)
-    hdulist = fits.open(f, mode='update')
-    tbl1, tbl2 = convert_hdu_to_ldac(hdulist[1])
-    new_hdulist = [hdulist[0], tbl1, tbl2]
+    keep_list = [x for x in tbl.colnames if tbl[x].dtype.kind != "O"]
+    t = Table(tbl[keep_list], copy=False) if len(keep_list) > 0 else Table()
+    # The table is converted to a binary table HDU in memory, rather than via a temporary file
+    tbl1, tbl2 = convert_hdu_to_ldac(fits.table_to_hdu(t))
+    new_hdulist = [fits.PrimaryHDU(), tbl1, tbl2]
     new_hdulist = fits.HDUList(new_hdulist)
     return new_hdulist
 
@@ -91,6 +93,42 @@ def save_table_as_ldac(
     hdulist.writeto(file_path, **kwargs)
 
 
+def read_cached_ldac(
+        file_path: str,
+        frame: int = 1
+) -> astropy.table.Table:
+    """
+    Load an astropy table from a fits_ldac, keeping the most recently read tables in memory, so
+    that each catalog is only parsed once (until the file changes). The cached table is returned
+    directly, so it must not be modified.
+
+    Parameters
+    ----------
+    file_path: str
+        Name of the file to open
+    frame: int
+        Number of the frame in a regular fits file
+    """
+    stat = os.stat(file_path)
+    key = (os.path.abspath(file_path), stat.st_mtime_ns, stat.st_size, frame)
+
+    with ldac_cache_lock:
+        if key in ldac_cache:
+            ldac_cache.move_to_end(key)
+            return ldac_cache[key]
+
+    if frame > 0:
+        frame = frame*2
+    tbl = Table.read(file_path, hdu=frame)
+
+    with ldac_cache_lock:
+        ldac_cache[key] = tbl
+        while len(ldac_cache) > max_cached_ldac_tables:
+            ldac_cache.popitem(last=False)
+
+    return tbl
+
+
 def get_table_from_ldac(
         file_path: str,
         frame: int = 1
@@ -99,6 +137,7 @@ def get_table_from_ldac(
     Load an astropy table from a fits_ldac by frame (Since the ldac format has column 
     info for odd tables, giving it twce as many tables as a regular fits BinTableHDU,
     match the frame of a table to its corresponding frame in the ldac file).
+    The file is only parsed once, and each call returns a new copy of the table.
     
     Parameters
     ----------
@@ -107,8 +146,36 @@ def get_table_from_ldac(
     frame: int
         Number of the frame in a regular fits file
     """
-    if frame > 0:
-        frame = frame*2
-    tbl = Table.read(file_path, hdu=frame)
-    return tbl
+    return read_cached_ldac(file_path, frame=frame).copy()
+
+
+def get_ldac_columns(
+        file_path: str,
+        columns: list[str],
+        frame: int = 1
+) -> dict[str, np.ndarray]:
+    """
+    Get columns of a fits_ldac table as (read-only) numpy arrays, without copying the table
+
+    Parameters
+    ----------
+    file_path: str
+        Name of the file to open
+    columns: list
+        Names of the columns
+    frame: int
+        Number of the frame in a regular fits file
+
+    Returns
+    -------
+    columns: dict
+        Array of each column, by name
+    """
+    tbl = read_cached_ldac(file_path, frame=frame)
+    arrays = {}
+    for column in columns:
+        array = np.asarray(tbl[column]).view()
+        array.flags.writeable = False
+        arrays[column] = array
+    return arrays
 